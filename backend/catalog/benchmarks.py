@@ -0,0 +1,52 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import Client
+from rest_framework.test import APIClient
+
+from core.benchmarks import scenario, measure
+from studios.models import Studio
+from users.models import User
+from .models import ClassType, Product
+from .views import ClassTypeViewSet, ProductViewSet
+
+
+@scenario('public_catalog')
+def public_catalog(size=None):
+    """Pricing page data: authenticated product + class type list calls vs the cached public catalog."""
+    page_loads = size or 500
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    Product.objects.bulk_create([
+        Product(studio=studio, type=list(Product.ProductType)[i % 3], name=f'Bench {i}', price_cents=1000 + i,
+                meta={'credits': 10, 'expiry_days': 60})
+        for i in range(30)
+    ])
+    ClassType.objects.bulk_create([ClassType(studio=studio, name=f'Bench {i}', duration_minutes=50) for i in range(10)])
+    user = User.objects.create_user(email='bench-catalog@example.com', password='pass', studio=studio)
+    cache.clear()
+
+    api = APIClient()
+    api.force_authenticate(user)
+    api.credentials(HTTP_X_STUDIO_ID=str(studio.id))
+    anonymous = Client()
+    url = f'/api/catalog/public/{studio.id}/'
+
+    def viewsets():
+        # Sin límite de peticiones: se mide el costo de servirlas, no el 429
+        with patch.object(ProductViewSet, 'throttle_classes', []), patch.object(ClassTypeViewSet, 'throttle_classes', []):
+            for _ in range(page_loads):
+                api.get('/api/catalog/products/')
+                api.get('/api/catalog/class-types/')
+
+    def public(etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        for _ in range(page_loads):
+            anonymous.get(url, **headers)
+
+    etag = anonymous.get(url)['ETag']
+    result = {'page_loads': page_loads}
+    for name, run in (('viewsets', viewsets), ('public_cached', public), ('public_304', lambda: public(etag))):
+        timing = measure(run, 1)
+        timing['loads_per_s'] = round(page_loads / (timing['mean_ms'] / 1000), 1)
+        result[name] = timing
+    return result
@@ -0,0 +1,98 @@
+"""Per-studio price book and public catalog, served from the cache.
+
+Order creation resolves every line against the price book instead of
+querying products one by one; the public pricing page reads the rendered
+catalog. Any product or class type save/delete bumps the studio's catalog
+version once the transaction commits.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import bump_version, versioned_key
+from .models import ClassType, Product
+
+CACHE_NAMESPACE = 'catalog'
+CACHE_SECONDS = 60 * 60
+# Reglas de venta que sí se muestran al público
+PUBLIC_META = ('credits', 'duration_days', 'expiry_days')
+
+
+def invalidate_catalog(studio_id):
+    transaction.on_commit(lambda: bump_version(CACHE_NAMESPACE, studio_id))
+
+
+def build_price_book(studio_id):
+    return {
+        str(product.id): {
+            'type': product.type,
+            'name': product.name,
+            'price_cents': product.price_cents,
+            'currency': product.currency,
+            'is_active': product.is_active,
+            'meta': product.meta or {},
+        }
+        for product in Product.objects.filter(studio_id=studio_id).in_bulk().values()
+    }
+
+
+def get_price_book(studio_id):
+    key = versioned_key(CACHE_NAMESPACE, studio_id, 'prices')
+    prices = cache.get(key)
+    if prices is None:
+        prices = build_price_book(studio_id)
+        cache.set(key, prices, CACHE_SECONDS)
+    return prices
+
+
+def render_public_catalog(studio_id):
+    products = Product.objects.filter(studio_id=studio_id, is_active=True).order_by('type', 'price_cents', 'name')
+    class_types = ClassType.objects.filter(studio_id=studio_id).order_by('name')
+    catalog = {
+        'studio': str(studio_id),
+        'products': [
+            {
+                'id': str(product.id),
+                'type': product.type,
+                'name': product.name,
+                'description': product.description,
+                'price_cents': product.price_cents,
+                'currency': product.currency,
+                **{name: product.meta[name] for name in PUBLIC_META if name in (product.meta or {})},
+            }
+            for product in products
+        ],
+        'class_types': [
+            {
+                'id': str(class_type.id),
+                'name': class_type.name,
+                'description': class_type.description,
+                'duration_minutes': class_type.duration_minutes,
+            }
+            for class_type in class_types
+        ],
+    }
+    return json.dumps(catalog, ensure_ascii=False, separators=(',', ':'))
+
+
+def get_public_catalog(studio_id):
+    """Return ``{'body', 'etag', 'last_modified'}`` for the studio, or ``None`` if it does not exist."""
+    key = versioned_key(CACHE_NAMESPACE, studio_id, 'public')
+    catalog = cache.get(key)
+    if catalog is None:
+        from studios.models import Studio
+
+        if not Studio.objects.filter(id=studio_id).exists():
+            return None
+        body = render_public_catalog(studio_id)
+        catalog = {
+            'body': body,
+            # ETag fuerte: el mismo contenido da siempre la misma etiqueta, en cualquier worker
+            'etag': '"%s"' % hashlib.sha256(body.encode('utf-8')).hexdigest()[:32],
+            'last_modified': int(timezone.now().timestamp()),
+        }
+        cache.set(key, catalog, CACHE_SECONDS)
+    return catalog
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import ClassType, Product
+from .pricing import invalidate_catalog
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ClassType)
+def catalog_changed(sender, instance, **kwargs):
+    invalidate_catalog(instance.studio_id)
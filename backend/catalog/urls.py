@@ -1,9 +1,12 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import InstructorViewSet, ClassTypeViewSet, ProductViewSet
+from .views import InstructorViewSet, ClassTypeViewSet, ProductViewSet, public_catalog
 
 router = DefaultRouter()
 router.register('instructors', InstructorViewSet, basename='instructor')
 router.register('class-types', ClassTypeViewSet, basename='class-type')
 router.register('products', ProductViewSet, basename='product')
 
-urlpatterns = router.urls
+urlpatterns = [
+    path('public/<uuid:studio_id>/', public_catalog, name='public-catalog'),
+] + router.urls
@@ -1,6 +1,11 @@
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.response import Response
 from .models import Instructor, ClassType, Product
+from .pricing import get_public_catalog
 from .serializers import InstructorSerializer, ClassTypeSerializer, ProductSerializer
 
 class StudioScopedMixin:
@@ -40,3 +45,22 @@ class ProductViewSet(StudioScopedMixin, viewsets.ModelViewSet):
     search_fields = ['name', 'type']
     ordering_fields = ['price_cents', 'created_at']
     model = Product
+
+
+# nginx guarda la respuesta una hora y revalida con If-None-Match; el navegador, cinco minutos
+PUBLIC_CACHE_CONTROL = 'public, max-age=300, s-maxage=3600, stale-while-revalidate=600'
+
+
+@require_safe
+def public_catalog(request, studio_id):
+    """Active products and class types of a studio for the public pricing page; no login, served from cache"""
+    catalog = get_public_catalog(studio_id)
+    if catalog is None:
+        raise Http404
+    response = get_conditional_response(request, etag=catalog['etag'], last_modified=catalog['last_modified'])
+    if response is None:
+        response = HttpResponse(catalog['body'], content_type='application/json')
+    response['ETag'] = catalog['etag']
+    response['Last-Modified'] = http_date(catalog['last_modified'])
+    response['Cache-Control'] = PUBLIC_CACHE_CONTROL
+    return response
@@ -0,0 +1,353 @@
+from datetime import timedelta
+
+import requests
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from catalog.models import Product
+from core.benchmarks import burst, scenario, measure
+from core.provider_client import CircuitOpen, ProviderClient
+from studios.models import Studio
+from users.models import User
+from .models import CreditMovement, EntitlementSummary, Order, OrderItem, PaymentNotification, RevenueDaily, UserCredit, UserMembership
+from .billing import run_billing
+from .expiry import expire_entitlements
+from .ledger import check_credit_ledger
+from .payments import process_notification
+from .reconciliation import reconcile_pending_orders
+from .revenue import revenue_report
+from .services import create_order, fetch_mp_payment, get_user_balance, get_user_balances, mark_order_paid
+from .stubs import PaymentsApiStub
+from .views import OrderViewSet, mp_webhook
+
+
+@scenario('balance_batch')
+def balance_batch(size=None):
+    """Staff member list: balances of a whole studio in one batch vs one call per member."""
+    members = size or 5000
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    product = Product.objects.create(studio=studio, type=Product.ProductType.MEMBERSHIP, name='Bench', price_cents=1000)
+    users = User.objects.bulk_create([User(email=f'bench-balance-{i}@example.com', password='!', studio=studio) for i in range(members)])
+    now = timezone.now()
+    UserCredit.objects.bulk_create([
+        UserCredit(studio=studio, user=user, credits_total=10, credits_used=i % 10, expires_at=now + timedelta(days=i % 60 + 1))
+        for i, user in enumerate(users) for _ in range(2)
+    ], batch_size=2000)
+    UserMembership.objects.bulk_create([
+        UserMembership(studio=studio, user=user, product=product, ends_at=now + timedelta(days=30))
+        for user in users[::4]
+    ])
+    user_ids = [user.id for user in users]
+
+    def cold():
+        EntitlementSummary.objects.filter(studio=studio).delete()
+        get_user_balances(studio=studio, user_ids=user_ids)
+
+    return {
+        'members': members,
+        'batch_cold': measure(cold, 3),
+        'batch_warm': measure(lambda: get_user_balances(studio=studio, user_ids=user_ids), 5),
+        'per_member_warm': measure(lambda: [get_user_balance(studio=studio, user=user) for user in users], 1),
+    }
+
+
+def _create_order_per_line(studio, user, items_payload):
+    # Camino anterior: un SELECT y un INSERT por línea y un UPDATE final del total
+    order = Order.objects.create(studio=studio, user=user, status=Order.OrderStatus.PENDING)
+    total = 0
+    for item in items_payload:
+        product = Product.objects.get(id=item['product'], studio=studio)
+        qty = int(item.get('quantity', 1))
+        OrderItem.objects.create(order=order, product=product, quantity=qty,
+                                 unit_price_cents=product.price_cents, line_total_cents=product.price_cents * qty)
+        total += product.price_cents * qty
+    order.total_cents = total
+    order.save(update_fields=['total_cents'])
+    return order
+
+
+@scenario('order_creation')
+def order_creation(size=None):
+    """Checkout with 1, 10 and 50 lines: cached price book + bulk insert vs per-line queries."""
+    repeat = size or 50
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    user = User.objects.create(email='bench-orders@example.com', password='!', studio=studio)
+    products = Product.objects.bulk_create([
+        Product(studio=studio, type=Product.ProductType.PACKAGE, name=f'Bench {i}', price_cents=1000 + i, meta={'credits': 5})
+        for i in range(50)
+    ])
+    results = {}
+    for lines in (1, 10, 50):
+        payload = [{'product': str(product.id), 'quantity': 2} for product in products[:lines]]
+        with CaptureQueriesContext(connection) as bulk_queries:
+            create_order(studio=studio, user=user, items_payload=payload)
+        with CaptureQueriesContext(connection) as legacy_queries:
+            _create_order_per_line(studio, user, payload)
+        results[f'{lines}_lines'] = {
+            'bulk': measure(lambda: create_order(studio=studio, user=user, items_payload=payload), repeat),
+            'bulk_queries': len(bulk_queries),
+            'per_line': measure(lambda: _create_order_per_line(studio, user, payload), repeat),
+            'per_line_queries': len(legacy_queries),
+        }
+    return results
+
+
+@scenario('mp_webhook_burst')
+def mp_webhook_burst(size=None):
+    """Burst of payment notifications against a provider answering in 100 ms.
+
+    ``inline`` replays the previous webhook (fetch + fulfill inside the
+    request); ``ack`` is the current webhook and ``worker`` the Celery side.
+    """
+    burst_size = size or 100
+    web_workers = 4
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    user = User.objects.create(email='bench-mp@example.com', password='!', studio=studio)
+    product = Product.objects.create(studio=studio, type=Product.ProductType.DROP_IN, name='Bench', price_cents=1000)
+    orders = [create_order(studio=studio, user=user, items_payload=[{'product': str(product.id)}]) for _ in range(burst_size * 2)]
+    factory = APIRequestFactory()
+
+    with PaymentsApiStub(delay=0.1) as stub, override_settings(MP_API_URL=stub.url, MP_ACCESS_TOKEN='bench', MP_WEBHOOK_SECRET=None):
+        for i, order in enumerate(orders):
+            stub.add_payment(str(90000 + i), 'approved', str(order.id))
+        inline_ids = iter(range(90000, 90000 + burst_size))
+        ack_ids = iter(range(90000 + burst_size, 90000 + 2 * burst_size))
+
+        def inline(db):
+            payment_id = str(next(inline_ids))
+            data = fetch_mp_payment(payment_id)
+            with db:
+                mark_order_paid(Order.objects.get(id=data['external_reference']), provider='mercadopago', provider_ref=payment_id)
+
+        def ack(db):
+            with db:
+                mp_webhook(factory.post(f'/api/commerce/mp/webhook/?type=payment&data.id={next(ack_ids)}', {}, format='json'))
+
+        # La ráfaga llega a la vez a los workers web síncronos; busy_s es el tiempo de worker que ocupó
+        inline_stats = burst(inline, burst_size, web_workers)
+        ack_stats = burst(ack, burst_size, web_workers)
+        pending = list(PaymentNotification.objects.filter(status=PaymentNotification.Status.RECEIVED).values_list('pk', flat=True))
+        pending_iter = iter(pending)
+        worker_stats = measure(lambda: process_notification(next(pending_iter)), len(pending))
+
+    return {'burst': burst_size, 'inline': inline_stats, 'ack': ack_stats, 'worker': worker_stats}
+
+
+@scenario('provider_client')
+def provider_client(size=None):
+    """Provider calls: new connection per call vs pooled client, and failing fast once the circuit opens."""
+    calls = size or 200
+    with PaymentsApiStub() as stub:
+        stub.add_payment('1', 'approved')
+        url = f'{stub.url}/v1/payments/1'
+        client = ProviderClient('bench', backoff=0, failure_threshold=5, reset_after=60)
+        results = {
+            'calls': calls,
+            'bare_requests': measure(lambda: requests.get(url, timeout=10), calls),
+            'pooled_client': measure(lambda: client.get(url), calls),
+        }
+        stub.delay = 0.2
+        stub.fail_next = 10 ** 6
+        degraded = ProviderClient('bench-degraded', retries=0, backoff=0, failure_threshold=5, reset_after=60)
+
+        def degraded_call():
+            try:
+                degraded.get(url)
+            except CircuitOpen:
+                pass
+
+        results['degraded_until_open'] = measure(degraded_call, 5)
+        results['degraded_circuit_open'] = measure(degraded_call, calls)
+        results['client_stats'] = client.stats()
+    return results
+
+
+@scenario('payment_reconciliation')
+def payment_reconciliation(size=None):
+    """Reconciliation pass over pending orders with a 10 ms provider: serial lookups vs the worker pool."""
+    pending = size or 1000
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    user = User.objects.create(email='bench-rec@example.com', password='!', studio=studio)
+    product = Product.objects.create(studio=studio, type=Product.ProductType.DROP_IN, name='Bench', price_cents=1000)
+    old = timezone.now() - timedelta(days=1)
+    orders = Order.objects.bulk_create([
+        Order(studio=studio, user=user, provider='mercadopago', provider_ref=f'pref-{i}', total_cents=1000, created_at=old)
+        for i in range(pending)
+    ], batch_size=2000)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, unit_price_cents=1000, line_total_cents=1000) for order in orders
+    ], batch_size=2000)
+
+    with PaymentsApiStub(delay=0.01) as stub, override_settings(MP_API_URL=stub.url, MP_ACCESS_TOKEN='bench'):
+        for i, order in enumerate(orders):
+            stub.add_payment(str(80000 + i), 'in_process', str(order.id))
+        results = {'orders': pending}
+        for workers in (1, 8, 16):
+            results[f'workers_{workers}'] = measure(lambda: reconcile_pending_orders(max_workers=workers, restart=True), 1)
+    return results
+
+
+@scenario('membership_billing')
+def membership_billing(size=None):
+    """Billing run over due memberships with a 20 ms provider (8 workers), then the retry of a finished run."""
+    due = size or 10000
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    product = Product.objects.create(studio=studio, type=Product.ProductType.MEMBERSHIP, name='Bench', price_cents=50000,
+                                     meta={'duration_days': 30})
+    users = User.objects.bulk_create([User(email=f'bench-billing-{i}@example.com', password='!', studio=studio) for i in range(due)])
+    now = timezone.now()
+    UserMembership.objects.bulk_create([
+        UserMembership(studio=studio, user=user, product=product, ends_at=now - timedelta(minutes=i % 600),
+                       next_billing_at=now - timedelta(minutes=i % 600), provider='mercadopago', provider_ref=f'cust-{i}')
+        for i, user in enumerate(users)
+    ], batch_size=2000)
+    result = {'memberships': due}
+    with PaymentsApiStub(delay=0.02) as stub, override_settings(MP_API_URL=stub.url, MP_ACCESS_TOKEN='bench'):
+        result['run'] = measure(lambda: result.setdefault('stats', run_billing()), 1)
+        result['rerun'] = measure(lambda: run_billing(), 1)
+        result['charges'] = len(stub.charges)
+    return result
+
+
+@scenario('credit_ledger_check')
+def credit_ledger_check(size=None):
+    """Nightly ledger check over a studio's bookings (10 per credit) with 1% drifted credits: report, repair, recheck."""
+    from catalog.models import ClassType
+    from scheduling.models import Booking, Session
+
+    bookings = size or 100000
+    per_credit = 10
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    class_type = ClassType.objects.create(studio=studio, name='BENCH', duration_minutes=50)
+    now = timezone.now()
+    sessions = Session.objects.bulk_create([
+        Session(studio=studio, class_type=class_type, starts_at=now - timedelta(days=i), capacity=bookings) for i in range(per_credit)
+    ])
+    users = User.objects.bulk_create([User(email=f'bench-ledger-{i}@example.com', password='!', studio=studio) for i in range(bookings // per_credit)])
+    credits = UserCredit.objects.bulk_create([
+        UserCredit(studio=studio, user=user, credits_total=per_credit + 2, credits_used=per_credit + (i % 100 == 0))
+        for i, user in enumerate(users)
+    ], batch_size=2000)
+    Booking.objects.bulk_create([
+        Booking(studio=studio, session=session, user=credit.user, credit=credit, status='attended')
+        for credit in credits for session in sessions
+    ], batch_size=5000)
+    CreditMovement.objects.bulk_create([
+        CreditMovement(studio=studio, user=credit.user, credit=credit, delta=1, kind='consume')
+        for credit in credits for _ in sessions
+    ], batch_size=5000)
+    result = {'bookings': bookings, 'credits': len(credits)}
+    result['report'] = measure(lambda: result.setdefault('found', check_credit_ledger(studio_id=studio.id)['ledger_drift']), 1)
+    result['repair'] = measure(lambda: check_credit_ledger(studio_id=studio.id, repair=True), 1)
+    result['recheck'] = measure(lambda: result.setdefault('left', check_credit_ledger(studio_id=studio.id)['ledger_drift']), 1)
+    return result
+
+
+@scenario('expiry_sweep')
+def expiry_sweep(size=None):
+    """Backlog of lapsed credits and memberships expired by the chunked sweeper."""
+    backlog = size or 20000
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    product = Product.objects.create(studio=studio, type=Product.ProductType.MEMBERSHIP, name='Bench', price_cents=1000)
+    users = User.objects.bulk_create([User(email=f'bench-expiry-{i}@example.com', password='!', studio=studio) for i in range(backlog // 10)])
+    now = timezone.now()
+    UserCredit.objects.bulk_create([
+        UserCredit(studio=studio, user=users[i % len(users)], credits_total=5,
+                   expires_at=now - timedelta(days=1 + i % 30) if i % 4 else now + timedelta(days=30))
+        for i in range(backlog)
+    ], batch_size=2000)
+    UserMembership.objects.bulk_create([
+        UserMembership(studio=studio, user=user, product=product, ends_at=now - timedelta(days=1)) for user in users
+    ], batch_size=2000)
+    result = {}
+    result['sweep'] = measure(lambda: result.setdefault('changed', expire_entitlements()), 1)
+    result['sweep_idle'] = measure(expire_entitlements, 5)
+    return result
+
+
+@scenario('revenue_report')
+def revenue_report_bench(size=None):
+    """Year-to-date revenue by type: rollups vs aggregating order items, at growing order volume."""
+    volume = size or 50000
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    user = User.objects.create(email='bench-revenue@example.com', password='!', studio=studio)
+    products = Product.objects.bulk_create([
+        Product(studio=studio, type=list(Product.ProductType)[i % 3], name=f'Bench {i}', price_cents=1000 + i) for i in range(20)
+    ])
+    today = timezone.localdate()
+    start = today.replace(month=1, day=1)
+    RevenueDaily.objects.bulk_create([
+        RevenueDaily(studio=studio, day=start + timedelta(days=d), product=product, product_type=product.type,
+                     lines=5, units=5, gross_cents=5 * product.price_cents)
+        for d in range((today - start).days + 1) for product in products
+    ], batch_size=2000)
+    end = today + timedelta(days=1)
+    results = {'rollup_rows': RevenueDaily.objects.filter(studio=studio).count()}
+
+    created = 0
+    for target in (volume // 10, volume):
+        paid_at = timezone.now() - timedelta(hours=1)
+        orders = Order.objects.bulk_create([
+            Order(studio=studio, user=user, status=Order.OrderStatus.PAID, total_cents=1000, paid_at=paid_at)
+            for _ in range(target - created)
+        ], batch_size=2000)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=products[i % 20], unit_price_cents=1000, line_total_cents=1000)
+            for i, order in enumerate(orders)
+        ], batch_size=2000)
+        created = target
+
+        def scan():
+            list(OrderItem.objects.filter(order__studio=studio, order__status=Order.OrderStatus.PAID, order__paid_at__date__gte=start)
+                 .values('product__type').annotate(gross=Sum('line_total_cents')))
+
+        results[f'{target}_orders'] = {
+            'rollups': measure(lambda: revenue_report(studio, start, end, 'type'), 10),
+            'scan_orders': measure(scan, 3),
+        }
+    return results
+
+
+@scenario('order_list_page')
+def order_list_page(size=None):
+    """A 1,000-order staff page (3 lines each): per-order item queries vs prefetch vs summary mode."""
+    page = size or 1000
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    staff = User.objects.create(email='bench-orders-staff@example.com', password='!', studio=studio)
+    staff.add_role('staff')
+    product = Product.objects.create(studio=studio, type=Product.ProductType.DROP_IN, name='Bench', price_cents=1000)
+    paid_at = timezone.now() - timedelta(days=1)
+    orders = Order.objects.bulk_create([
+        Order(studio=studio, user=staff, status=Order.OrderStatus.PAID, total_cents=3000, paid_at=paid_at) for _ in range(page)
+    ])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, unit_price_cents=1000, line_total_cents=1000) for order in orders for _ in range(3)
+    ], batch_size=2000)
+    factory = APIRequestFactory()
+
+    class PerOrderItems(OrderViewSet):
+        def get_queryset(self):
+            return Order.objects.filter(studio=self.request.studio)
+
+    def call(viewset, **params):
+        request = factory.get('/api/commerce/orders/', {'page_size': page, **params})
+        request.studio = studio
+        force_authenticate(request, user=staff)
+        response = viewset.as_view({'get': 'list'})(request)
+        response.render()
+        return response
+
+    results = {}
+    for name, viewset, params in (
+        ('per_order_items', PerOrderItems, {}),
+        ('prefetched', OrderViewSet, {}),
+        ('summary', OrderViewSet, {'view': 'summary'}),
+        ('summary_paid_range', OrderViewSet, {'view': 'summary', 'status': 'paid', 'paid_from': paid_at.date().isoformat()}),
+    ):
+        with CaptureQueriesContext(connection) as queries:
+            response = call(viewset, **params)
+        results[name] = {'timing': measure(lambda: call(viewset, **params), 5), 'queries': len(queries), 'bytes': len(response.content)}
+    return results
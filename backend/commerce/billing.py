@@ -0,0 +1,353 @@
+"""Recurring billing of memberships.
+
+Memberships whose ``next_billing_at`` is due are read in keyset batches
+through ``memberships_billing_due_idx``. Each batch gets its renewal orders
+in three bulk inserts, is charged from a bounded thread pool and is applied
+in one transaction: an approved charge marks the order paid and moves
+``ends_at``/``next_billing_at`` forward with a conditional UPDATE, a declined
+one is retried later and abandoned after ``MAX_ATTEMPTS``. A payment the
+provider leaves in process is looked up on later runs instead of charged
+again; if it settles through the webhook first, ``settle_renewal`` applies
+the same conditional advance.
+
+Safe to re-run: ``MembershipRenewal`` is unique per membership and billing
+date, so a retried run reuses the order it already created, and every charge
+attempt carries its own idempotency key, so the provider answers a repeated
+call with the payment it already made.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import CharField, Case, F, Q, Value, When
+from django.utils import timezone
+
+from core.models import AuditLog
+from core.provider_client import ProviderError
+from users.dashboard import invalidate_member
+from .entitlements import rebuild_summaries
+from .models import MembershipRenewal, Order, OrderItem, UserMembership
+from .revenue import record_paid_orders
+from .services import PaymentProviderError, fetch_mp_payment, mp_client
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+MAX_WORKERS = 8
+MAX_ATTEMPTS = 3
+# Espera antes del 2.º y 3.er intento de una tarjeta rechazada
+RETRY_AFTER = (timedelta(days=1), timedelta(days=3))
+# Cuánto espera el barrido de vencimientos a una membresía que aún se está cobrando
+GRACE = sum(RETRY_AFTER, timedelta()) + timedelta(days=1)
+LOCK_KEY = 'commerce:membership-billing'
+LOCK_SECONDS = 60 * 60
+PENDING_STATUSES = ('pending', 'in_process', 'authorized')
+
+Renewal = MembershipRenewal.Status
+
+
+class Charge(NamedTuple):
+    # 'approved', 'rejected' o 'retry' (sin respuesta definitiva del proveedor)
+    outcome: str
+    reference: str | None = None
+    error: str = ''
+
+
+class MercadoPagoBilling:
+    """Charges the customer saved at Mercado Pago, stored in the membership's ``provider_ref``."""
+    provider = 'mercadopago'
+
+    def charge(self, *, customer_ref, amount_cents, currency, reference, description, idempotency_key):
+        access_token = getattr(settings, 'MP_ACCESS_TOKEN', None)
+        if not access_token:
+            return Charge('retry', error='MP_ACCESS_TOKEN no configurado')
+        payload = {
+            'transaction_amount': amount_cents / 100.0,
+            'currency_id': currency,
+            'description': description,
+            'external_reference': reference,
+            'payer': {'type': 'customer', 'id': customer_ref},
+        }
+        headers = {'Authorization': f'Bearer {access_token}'}
+        try:
+            resp = mp_client.post(f'{settings.MP_API_URL}/v1/payments', json=payload, headers=headers,
+                                  idempotency_key=idempotency_key)
+        except ProviderError as exc:
+            return Charge('retry', error=str(exc))
+        if resp.status_code == 429 or resp.status_code >= 500:
+            return Charge('retry', error=f'{resp.status_code} {resp.text[:500]}')
+        if not resp.ok:
+            # Cliente o tarjeta inválidos: cuenta como rechazo
+            return Charge('rejected', error=f'{resp.status_code} {resp.text[:500]}')
+        return self._outcome(resp.json())
+
+    def lookup(self, payment_ref):
+        """Current outcome of a payment an earlier charge left in process."""
+        try:
+            return self._outcome(fetch_mp_payment(payment_ref))
+        except PaymentProviderError as exc:
+            return Charge('retry', payment_ref, str(exc))
+
+    @staticmethod
+    def _outcome(data):
+        reference = str(data['id']) if data.get('id') is not None else None
+        if data.get('status') == 'approved':
+            return Charge('approved', reference)
+        if data.get('status') in PENDING_STATUSES:
+            return Charge('retry', reference, data['status'])
+        return Charge('rejected', reference, data.get('status_detail') or data.get('status') or '')
+
+
+def _due(now, provider):
+    return UserMembership.objects.filter(
+        status='active', next_billing_at__isnull=False, next_billing_at__lte=now, provider=provider,
+    ).order_by('next_billing_at', 'pk')
+
+
+def _renews(row):
+    meta = row['product__meta'] or {}
+    return bool(row['product__is_active'] and meta.get('duration_days') and row['provider_ref'])
+
+
+@transaction.atomic
+def _prepare(rows, now, provider):
+    """``(row, renewal)`` pairs to charge now, creating the missing renewals with their orders.
+
+    Memberships that can no longer renew (inactive product, no duration or no
+    saved customer) stop being billed and lapse at ``ends_at``.
+    """
+    stop = [row for row in rows if not _renews(row)]
+    if stop:
+        UserMembership.objects.filter(pk__in=[row['id'] for row in stop]).update(next_billing_at=None, version=F('version') + 1)
+        AuditLog.objects.bulk_create([
+            AuditLog(studio_id=row['studio_id'], action='membership_renewal_stopped', entity='user_membership',
+                     entity_id=row['id'], meta={'user': str(row['user_id'])})
+            for row in stop
+        ])
+    rows = [row for row in rows if _renews(row)]
+    if not rows:
+        return [], len(stop)
+    existing = {
+        (renewal.membership_id, renewal.billing_at): renewal
+        for renewal in MembershipRenewal.objects.filter(
+            membership_id__in=[row['id'] for row in rows],
+            billing_at__gte=min(row['next_billing_at'] for row in rows),
+        ).select_related('order')
+    }
+    renewals, orders, items = [], [], []
+    for row in rows:
+        if (row['id'], row['next_billing_at']) in existing:
+            continue
+        start = max(row['ends_at'] or row['next_billing_at'], row['next_billing_at'])
+        order = Order(
+            studio_id=row['studio_id'],
+            user_id=row['user_id'],
+            status=Order.OrderStatus.PENDING,
+            total_cents=row['product__price_cents'],
+            currency=row['product__currency'],
+            provider=provider,
+        )
+        orders.append(order)
+        items.append(OrderItem(
+            order=order,
+            product_id=row['product_id'],
+            quantity=1,
+            unit_price_cents=row['product__price_cents'],
+            line_total_cents=row['product__price_cents'],
+            # Extiende la membresía existente: fulfill_order no crea otra
+            meta={'renewal_of': str(row['id'])},
+        ))
+        renewal = MembershipRenewal(
+            membership_id=row['id'],
+            order=order,
+            billing_at=row['next_billing_at'],
+            period_end=start + timedelta(days=int(row['product__meta']['duration_days'])),
+        )
+        renewals.append(renewal)
+        existing[(row['id'], row['next_billing_at'])] = renewal
+    lost = set()
+    if orders:
+        Order.objects.bulk_create(orders)
+        OrderItem.objects.bulk_create(items)
+        MembershipRenewal.objects.bulk_create(renewals, ignore_conflicts=True)
+        kept = set(MembershipRenewal.objects.filter(order_id__in=[order.pk for order in orders]).values_list('order_id', flat=True))
+        # Otra corrida creó esas renovaciones primero: cobra ella, estas órdenes sobran
+        lost = {order.pk for order in orders if order.pk not in kept}
+        if lost:
+            Order.objects.filter(pk__in=lost).delete()
+    due = []
+    for row in rows:
+        renewal = existing[(row['id'], row['next_billing_at'])]
+        if renewal.order_id in lost or renewal.status not in (Renewal.PENDING, Renewal.FAILED):
+            continue
+        if renewal.retry_at and renewal.retry_at > now:
+            continue
+        due.append((row, renewal))
+    return due, len(stop)
+
+
+def _charge(adapter, row, renewal):
+    try:
+        if renewal.payment_ref:
+            # El cobro anterior sigue en proceso: repetirlo con la misma llave solo devolvería la misma respuesta
+            return adapter.lookup(renewal.payment_ref)
+        return adapter.charge(
+            customer_ref=row['provider_ref'],
+            amount_cents=renewal.order.total_cents,
+            currency=renewal.order.currency,
+            reference=str(renewal.order_id),
+            description=f"Renovación {row['product__name']}",
+            # Misma llave al reintentar el mismo intento; nueva tras registrar un rechazo
+            idempotency_key=f'renewal-{renewal.pk}-{renewal.attempts}',
+        )
+    except Exception as exc:  # un error del adaptador no debe tumbar el lote entero
+        logger.exception('membership charge failed', extra={'renewal': str(renewal.pk)})
+        return Charge('retry', error=str(exc))
+
+
+def _advance(membership_id, ends_at, next_billing_at, renewal):
+    """Move the membership to the renewal's period; only if nobody moved it since it was read, so a retry never extends twice."""
+    lead = max((ends_at or next_billing_at) - next_billing_at, timedelta(0))
+    return UserMembership.objects.filter(pk=membership_id, status='active', next_billing_at=renewal.billing_at).update(
+        ends_at=renewal.period_end, next_billing_at=renewal.period_end - lead, version=F('version') + 1,
+    )
+
+
+def _audit(row, action, meta):
+    return AuditLog(studio_id=row['studio_id'], action=action, entity='user_membership', entity_id=row['id'],
+                    meta={'user': str(row['user_id']), **meta})
+
+
+@transaction.atomic
+def _apply(results, now, provider, stats):
+    """Record one batch of charge outcomes."""
+    approved, changed, audits, advanced = [], [], [], set()
+    for row, renewal, charge in results:
+        if charge.outcome == 'approved':
+            if _advance(row['id'], row['ends_at'], row['next_billing_at'], renewal):
+                advanced.add((row['studio_id'], row['user_id']))
+            else:
+                logger.warning('renewal charged for a membership that changed', extra={'renewal': str(renewal.pk)})
+            renewal.status, renewal.charged_at, renewal.retry_at, renewal.last_error = Renewal.CHARGED, now, None, ''
+            renewal.payment_ref = ''
+            approved.append((renewal, charge.reference))
+            audits.append(_audit(row, 'membership_renewed', {'order': str(renewal.order_id), 'ends_at': renewal.period_end.isoformat()}))
+            stats['charged'] += 1
+        elif charge.outcome == 'rejected':
+            renewal.attempts, renewal.payment_ref = renewal.attempts + 1, ''
+            renewal.last_error = charge.error[:1000]
+            if renewal.attempts >= MAX_ATTEMPTS:
+                renewal.status, renewal.retry_at = Renewal.ABANDONED, None
+                Order.objects.filter(pk=renewal.order_id, status=Order.OrderStatus.PENDING).update(status=Order.OrderStatus.FAILED)
+                # Deja de cobrarse; vence sola en ends_at
+                UserMembership.objects.filter(pk=row['id'], next_billing_at=renewal.billing_at).update(
+                    next_billing_at=None, version=F('version') + 1,
+                )
+                audits.append(_audit(row, 'membership_renewal_abandoned', {'order': str(renewal.order_id), 'error': renewal.last_error}))
+                stats['abandoned'] += 1
+            else:
+                renewal.status, renewal.retry_at = Renewal.FAILED, now + RETRY_AFTER[renewal.attempts - 1]
+                audits.append(_audit(row, 'membership_renewal_declined', {'order': str(renewal.order_id), 'error': renewal.last_error}))
+                stats['declined'] += 1
+        else:
+            renewal.last_error = charge.error[:1000]
+            if charge.reference:
+                # En proceso: la siguiente corrida consulta este pago
+                renewal.payment_ref = charge.reference
+                stats['in_process'] += 1
+            else:
+                stats['errors'] += 1
+        changed.append(renewal)
+
+    MembershipRenewal.objects.bulk_update(changed, ['status', 'attempts', 'retry_at', 'last_error', 'charged_at', 'payment_ref'])
+    if approved:
+        # El webhook del mismo cobro pudo marcar ya la orden: solo se registra la venta de las que cambian aquí
+        won = set(
+            Order.objects.select_for_update()
+            .filter(pk__in=[renewal.order_id for renewal, _ in approved], status=Order.OrderStatus.PENDING)
+            .values_list('pk', flat=True)
+        )
+        approved = [(renewal, reference) for renewal, reference in approved if renewal.order_id in won]
+    if approved:
+        Order.objects.filter(pk__in=won).update(
+            status=Order.OrderStatus.PAID,
+            paid_at=now,
+            provider=provider,
+            provider_ref=Case(*[When(pk=renewal.order_id, then=Value(reference)) for renewal, reference in approved],
+                              output_field=CharField()),
+        )
+        for renewal, _ in approved:
+            renewal.order.status, renewal.order.paid_at = Order.OrderStatus.PAID, now
+        record_paid_orders([renewal.order for renewal, _ in approved])
+    AuditLog.objects.bulk_create(audits)
+    if advanced:
+        rebuild_summaries(advanced)
+        invalidate_member(*(user_id for _, user_id in advanced))
+
+
+@transaction.atomic
+def settle_renewal(order, now=None):
+    """Advance the membership of a renewal order paid outside billing (webhook or reconciliation).
+
+    Returns whether the membership moved.
+    """
+    renewal = (
+        MembershipRenewal.objects.select_for_update(of=('self',))
+        .filter(order=order).exclude(status=Renewal.CHARGED)
+        .select_related('membership').first()
+    )
+    if renewal is None:
+        return False
+    membership = renewal.membership
+    moved = _advance(membership.pk, membership.ends_at, membership.next_billing_at, renewal)
+    if not moved:
+        logger.warning('renewal paid for a membership that changed', extra={'renewal': str(renewal.pk)})
+    renewal.status, renewal.charged_at, renewal.retry_at, renewal.last_error = Renewal.CHARGED, now or timezone.now(), None, ''
+    renewal.payment_ref = ''
+    renewal.save(update_fields=['status', 'charged_at', 'retry_at', 'last_error', 'payment_ref'])
+    row = {'id': membership.pk, 'studio_id': membership.studio_id, 'user_id': membership.user_id}
+    _audit(row, 'membership_renewed', {'order': str(order.pk), 'ends_at': renewal.period_end.isoformat()}).save()
+    if moved:
+        rebuild_summaries({(membership.studio_id, membership.user_id)})
+        invalidate_member(membership.user_id)
+    return bool(moved)
+
+
+def run_billing(*, now=None, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS, adapter=None):
+    """Bill every due membership; returns counters, or ``None`` if another run holds the lock."""
+    if not cache.add(LOCK_KEY, 1, LOCK_SECONDS):
+        return None
+    try:
+        now = now or timezone.now()
+        adapter = adapter or MercadoPagoBilling()
+        stats = {'due': 0, 'charged': 0, 'in_process': 0, 'declined': 0, 'abandoned': 0, 'errors': 0, 'stopped': 0}
+        fields = ('id', 'studio_id', 'user_id', 'product_id', 'ends_at', 'next_billing_at', 'provider_ref', 'product__name',
+                  'product__price_cents', 'product__currency', 'product__is_active', 'product__meta')
+        cursor = None
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while True:
+                qs = _due(now, adapter.provider)
+                if cursor:
+                    qs = qs.filter(Q(next_billing_at__gt=cursor[0]) | Q(next_billing_at=cursor[0], pk__gt=cursor[1]))
+                rows = list(qs.values(*fields)[:batch_size])
+                if not rows:
+                    break
+                cursor = rows[-1]['next_billing_at'], rows[-1]['id']
+                due, stopped = _prepare(rows, now, adapter.provider)
+                stats['stopped'] += stopped
+                stats['due'] += len(due)
+                charges = list(pool.map(lambda pair: _charge(adapter, *pair), due))
+                if due and all(charge.outcome == 'retry' and not charge.reference for charge in charges):
+                    # Proveedor caído: las renovaciones quedan pendientes para la siguiente corrida
+                    logger.warning('membership billing paused, provider unavailable', extra={'error': charges[0].error})
+                    stats['errors'] += len(due)
+                    break
+                _apply([(row, renewal, charge) for (row, renewal), charge in zip(due, charges)], now, adapter.provider, stats)
+        logger.info('membership billing finished', extra=stats)
+        return stats
+    finally:
+        cache.delete(LOCK_KEY)
@@ -0,0 +1,246 @@
+"""Entitlement summaries: O(1) balance reads and credit selection.
+
+Every change to credits or memberships rewrites the member's summary inside
+the same transaction: booking consumption updates the buckets in place,
+everything else rebuilds the row from the source tables. Time-based expiry is
+applied lazily when a read finds ``valid_until`` in the past.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import EntitlementSummary, UserCredit, UserMembership
+
+SUMMARY_FIELDS = ('credits_available', 'credit_buckets', 'next_credit_expiration', 'membership_id', 'membership_ends_at', 'valid_until')
+
+
+def _key(studio_id, user_id):
+    return str(studio_id), str(user_id)
+
+
+def _derive(buckets, membership_id=None, membership_ends_at=None):
+    expirations = [parse_datetime(bucket['expires_at']) for bucket in buckets if bucket['expires_at']]
+    limits = [moment for moment in (min(expirations, default=None), membership_ends_at) if moment]
+    return {
+        'credits_available': sum(bucket['remaining'] for bucket in buckets),
+        'credit_buckets': buckets,
+        'next_credit_expiration': min(expirations, default=None),
+        'membership_id': membership_id,
+        'membership_ends_at': membership_ends_at,
+        'valid_until': min(limits, default=None),
+    }
+
+
+def compute_summaries(pairs, now=None):
+    """Expected summary fields for ``(studio_id, user_id)`` pairs, from two queries."""
+    now = now or timezone.now()
+    pairs = {_key(*pair) for pair in pairs}
+    if not pairs:
+        return {}
+    studio_ids = {studio_id for studio_id, _ in pairs}
+    user_ids = {user_id for _, user_id in pairs}
+
+    credits = defaultdict(list)
+    rows = (
+        UserCredit.objects.filter(studio_id__in=studio_ids, user_id__in=user_ids, status=UserCredit.Status.ACTIVE, credits_used__lt=F('credits_total'))
+        # Cubre los que vencieron después del último barrido
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gte=now))
+        .values('id', 'studio_id', 'user_id', 'credits_total', 'credits_used', 'expires_at', 'created_at', 'source_order_item__product_id')
+    )
+    for row in rows:
+        credits[_key(row['studio_id'], row['user_id'])].append(row)
+
+    memberships = {}
+    rows = (
+        UserMembership.objects.filter(studio_id__in=studio_ids, user_id__in=user_ids, status='active')
+        .filter(Q(ends_at__isnull=True) | Q(ends_at__gte=now))
+        .values('id', 'studio_id', 'user_id', 'ends_at')
+    )
+    for row in rows:
+        key = _key(row['studio_id'], row['user_id'])
+        current = memberships.get(key)
+        # La que vence primero, igual que order_by('ends_at') en Postgres (sin fecha al final)
+        if current is None or (row['ends_at'] is not None and (current['ends_at'] is None or row['ends_at'] < current['ends_at'])):
+            memberships[key] = row
+
+    expected = {}
+    for key in pairs:
+        ordered = sorted(credits.get(key, []), key=lambda row: (row['expires_at'] is None, row['expires_at'] or now, row['created_at']))
+        buckets = [
+            {
+                'credit': str(row['id']),
+                'remaining': row['credits_total'] - row['credits_used'],
+                'expires_at': row['expires_at'].isoformat() if row['expires_at'] else None,
+                'product': str(row['source_order_item__product_id']) if row['source_order_item__product_id'] else None,
+            }
+            for row in ordered
+        ]
+        membership = memberships.get(key)
+        expected[key] = _derive(buckets, membership['id'] if membership else None, membership['ends_at'] if membership else None)
+    return expected
+
+
+@transaction.atomic
+def rebuild_summary(studio_id, user_id):
+    expected = compute_summaries([(studio_id, user_id)])[_key(studio_id, user_id)]
+    summary, _ = EntitlementSummary.objects.update_or_create(studio_id=studio_id, user_id=user_id, defaults=expected)
+    return summary
+
+
+def rebuild_summaries(pairs):
+    """``rebuild_summary`` for many ``(studio_id, user_id)`` pairs: two reads and two bulk writes."""
+    expected = compute_summaries(pairs)
+    if not expected:
+        return
+    stored = {
+        _key(studio_id, user_id): pk
+        for pk, studio_id, user_id in EntitlementSummary.objects.filter(
+            studio_id__in={s for s, _ in expected}, user_id__in={u for _, u in expected}
+        ).values_list('pk', 'studio_id', 'user_id')
+    }
+    to_create, to_update = [], []
+    for key, fields in expected.items():
+        if key in stored:
+            to_update.append(EntitlementSummary(id=stored[key], studio_id=key[0], user_id=key[1], **fields))
+        else:
+            to_create.append(EntitlementSummary(studio_id=key[0], user_id=key[1], **fields))
+    with transaction.atomic():
+        EntitlementSummary.objects.bulk_create(to_create, ignore_conflicts=True, batch_size=1000)
+        EntitlementSummary.objects.bulk_update(to_update, SUMMARY_FIELDS, batch_size=1000)
+
+
+def get_summary(studio_id, user_id, *, for_update=False):
+    """The member's summary in one lookup, rebuilt if missing or past ``valid_until``."""
+    qs = EntitlementSummary.objects.filter(studio_id=studio_id, user_id=user_id)
+    if for_update:
+        qs = qs.select_for_update()
+    summary = qs.first()
+    if summary is None or (summary.valid_until and summary.valid_until <= timezone.now()):
+        summary = rebuild_summary(studio_id, user_id)
+    return summary
+
+
+BALANCE_FIELDS = ('credits_available', 'next_credit_expiration', 'membership_id', 'membership_ends_at', 'valid_until')
+
+
+def _balance(row):
+    return {
+        'credits_available': row['credits_available'],
+        'has_active_membership': row['membership_id'] is not None,
+        'membership_ends_at': row['membership_ends_at'],
+        'next_credit_expiration': row['next_credit_expiration'],
+    }
+
+
+def get_balances(studio_id, user_ids):
+    """Balances of many members keyed by user id.
+
+    One narrow read of the summaries; members without a current summary are
+    rebuilt together (two more queries) and stored for the next call.
+    """
+    now = timezone.now()
+    user_ids = list(user_ids)
+    rows = {
+        str(row['user_id']): row
+        for row in EntitlementSummary.objects.filter(studio_id=studio_id, user_id__in=user_ids).values('user_id', *BALANCE_FIELDS)
+    }
+    pending = [
+        user_id for user_id in {str(user_id) for user_id in user_ids}
+        if user_id not in rows or (rows[user_id]['valid_until'] and rows[user_id]['valid_until'] <= now)
+    ]
+    if pending:
+        expected = compute_summaries([(studio_id, user_id) for user_id in pending], now=now)
+        stale = [user_id for user_id in pending if user_id in rows]
+        stale_ids = {
+            str(user_id): pk
+            for user_id, pk in EntitlementSummary.objects.filter(studio_id=studio_id, user_id__in=stale).values_list('user_id', 'id')
+        } if stale else {}
+        to_create, to_update = [], []
+        for user_id in pending:
+            fields = expected[_key(studio_id, user_id)]
+            if user_id in stale_ids:
+                to_update.append(EntitlementSummary(id=stale_ids[user_id], studio_id=studio_id, user_id=user_id, **fields))
+            else:
+                to_create.append(EntitlementSummary(studio_id=studio_id, user_id=user_id, **fields))
+            rows[user_id] = fields
+        with transaction.atomic():
+            EntitlementSummary.objects.bulk_create(to_create, ignore_conflicts=True, batch_size=1000)
+            EntitlementSummary.objects.bulk_update(to_update, SUMMARY_FIELDS, batch_size=1000)
+    return {user_id: _balance(row) for user_id, row in rows.items()}
+
+
+def next_credit_id(summary):
+    return summary.credit_buckets[0]['credit'] if summary.credit_buckets else None
+
+
+def take_credit(summary, credit_id):
+    """Record one consumed credit on a (locked) summary without touching the source rows."""
+    buckets = []
+    for bucket in summary.credit_buckets:
+        if bucket['credit'] == str(credit_id):
+            bucket = {**bucket, 'remaining': bucket['remaining'] - 1}
+        if bucket['remaining'] > 0:
+            buckets.append(bucket)
+    for name, value in _derive(buckets, summary.membership_id, summary.membership_ends_at).items():
+        setattr(summary, name, value)
+    summary.save(update_fields=['credits_available', 'credit_buckets', 'next_credit_expiration', 'valid_until', 'updated_at'])
+    return summary
+
+
+def balance_from_summary(summary):
+    return {
+        **_balance({name: getattr(summary, name) for name in BALANCE_FIELDS}),
+        'credit_buckets': [
+            {'remaining': bucket['remaining'], 'expires_at': bucket['expires_at']} for bucket in summary.credit_buckets
+        ],
+    }
+
+
+def _differs(summary, expected):
+    return any(getattr(summary, name) != value for name, value in expected.items())
+
+
+def check_entitlements(*, studio_id=None, repair=False, batch_size=500):
+    """Compare stored summaries against source rows in batches; optionally fix them.
+
+    Returns counters: ``checked`` pairs, ``missing`` summaries for members
+    with entitlements, ``mismatched`` summaries and how many were ``repaired``.
+    """
+    scope = {'studio_id': studio_id} if studio_id else {}
+    pairs = set()
+    for model in (UserCredit, UserMembership, EntitlementSummary):
+        pairs |= {_key(*pair) for pair in model.objects.filter(**scope).values_list('studio_id', 'user_id').distinct()}
+    pairs = sorted(pairs)
+
+    stats = {'checked': 0, 'missing': 0, 'mismatched': 0, 'repaired': 0}
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start:start + batch_size]
+        expected = compute_summaries(batch)
+        stored = {
+            _key(summary.studio_id, summary.user_id): summary
+            for summary in EntitlementSummary.objects.filter(
+                studio_id__in={s for s, _ in batch}, user_id__in={u for _, u in batch}
+            )
+        }
+        to_create, to_update = [], []
+        for key in batch:
+            stats['checked'] += 1
+            summary, fields = stored.get(key), expected[key]
+            if summary is None:
+                if fields['credit_buckets'] or fields['membership_id']:
+                    stats['missing'] += 1
+                    to_create.append(EntitlementSummary(studio_id=key[0], user_id=key[1], **fields))
+            elif _differs(summary, fields):
+                stats['mismatched'] += 1
+                for name, value in fields.items():
+                    setattr(summary, name, value)
+                to_update.append(summary)
+        if repair:
+            with transaction.atomic():
+                EntitlementSummary.objects.bulk_create(to_create, ignore_conflicts=True)
+                EntitlementSummary.objects.bulk_update(to_update, SUMMARY_FIELDS)
+            stats['repaired'] += len(to_create) + len(to_update)
+    return stats
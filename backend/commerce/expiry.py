@@ -0,0 +1,97 @@
+"""Expiry sweeper for credits and memberships.
+
+Marks credits past ``expires_at`` and memberships past ``ends_at`` as
+expired with set-based UPDATEs, one short transaction per chunk, and writes
+one audit row per changed record. Afterwards the live rows are exactly the
+ones with ``status='active'``, and the partial indexes only cover those.
+
+A membership that recurring billing still owns (``next_billing_at`` set) is
+left alone for ``billing.GRACE`` past ``ends_at`` so its renewal and the
+retries of a declined card can still run; billing clears
+``next_billing_at`` when it gives up, and the next sweep expires it.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.concurrency import bulk_transition
+from core.models import AuditLog
+from .billing import GRACE as BILLING_GRACE
+from .models import UserCredit, UserMembership
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+
+
+def _sweep(model, live, order_field, expired_status, action, entity, fields, chunk_size, allowed=None):
+    """Expire rows matching ``live`` chunk by chunk; returns how many changed."""
+    total = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked: una fila que otro proceso está usando se barre en la siguiente pasada;
+            # ordenar por la fecha recorre el índice parcial en vez de ordenar todo el rezago
+            rows = list(
+                model.objects.select_for_update(skip_locked=True)
+                .filter(live)
+                .order_by(order_field)
+                .values('pk', 'studio_id', 'user_id', *fields)[:chunk_size]
+            )
+            if not rows:
+                break
+            locked = model.objects.filter(pk__in=[row['pk'] for row in rows])
+            if allowed:
+                bulk_transition(locked, expired_status, allowed=allowed)
+            else:
+                locked.update(status=expired_status, version=F('version') + 1)
+            AuditLog.objects.bulk_create([
+                AuditLog(
+                    studio_id=row['studio_id'],
+                    action=action,
+                    entity=entity,
+                    entity_id=row['pk'],
+                    meta={'user': str(row['user_id']), **{name: _jsonable(row[name]) for name in fields}},
+                )
+                for row in rows
+            ])
+        total += len(rows)
+        if len(rows) < chunk_size:
+            break
+    return total
+
+
+def _jsonable(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def expire_entitlements(*, now=None, chunk_size=CHUNK_SIZE):
+    """Expire lapsed credits and memberships; returns how many of each changed."""
+    now = now or timezone.now()
+    credits = _sweep(
+        UserCredit,
+        Q(status=UserCredit.Status.ACTIVE, expires_at__lt=now),
+        'expires_at',
+        UserCredit.Status.EXPIRED,
+        'credit_expired',
+        'user_credit',
+        ('expires_at', 'credits_total', 'credits_used'),
+        chunk_size,
+    )
+    memberships = _sweep(
+        UserMembership,
+        Q(status__in=['active', 'paused'], ends_at__lt=now)
+        & (Q(next_billing_at__isnull=True) | Q(ends_at__lt=now - BILLING_GRACE)),
+        'ends_at',
+        'expired',
+        'membership_expired',
+        'user_membership',
+        ('ends_at', 'status'),
+        chunk_size,
+        allowed=UserMembership.TRANSITIONS,
+    )
+    stats = {'credits': credits, 'memberships': memberships}
+    if credits or memberships:
+        logger.info('entitlements expired', extra=stats)
+    return stats
@@ -0,0 +1,129 @@
+"""Credit movement ledger and its nightly integrity check.
+
+Every change to ``UserCredit.credits_used`` appends a ``CreditMovement`` in
+the same transaction: +1 when a booking takes a credit, -1 when a
+cancellation gives it back. For each credit, ``credits_used`` must then equal
+both the sum of its movements and the number of live bookings holding it.
+``check_credit_ledger`` compares the three with grouped queries over keyset
+batches of credits. On repair, the bookings are taken as the truth.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .entitlements import rebuild_summaries
+from .models import CreditMovement, UserCredit
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+MAX_SAMPLES = 100
+# Reservas que mantienen consumido su crédito; la cancelación lo devuelve
+HOLDING_STATUSES = ('booked', 'attended', 'no_show')
+
+Kind = CreditMovement.Kind
+
+
+def record_movement(credit, delta, kind, booking=None):
+    """Append one movement for ``credit``; call inside the transaction that changed ``credits_used``."""
+    CreditMovement.objects.create(
+        studio_id=credit.studio_id,
+        user_id=credit.user_id,
+        credit_id=credit.pk,
+        booking_id=booking.pk if booking is not None else None,
+        delta=delta,
+        kind=kind,
+    )
+
+
+def _totals(credit_ids):
+    """``(ledger, holds)`` per credit id, from one grouped query each."""
+    from scheduling.models import Booking
+
+    ledger = dict(
+        CreditMovement.objects.filter(credit_id__in=credit_ids)
+        .values('credit_id').annotate(total=Sum('delta')).values_list('credit_id', 'total')
+    )
+    holds = dict(
+        Booking.objects.filter(credit_id__in=credit_ids, status__in=HOLDING_STATUSES)
+        .values('credit_id').annotate(total=Count('pk')).values_list('credit_id', 'total')
+    )
+    return ledger, holds
+
+
+def _drifted(credits, ledger, holds):
+    return [
+        credit for credit in credits
+        if credit['credits_used'] != ledger.get(credit['id'], 0) or credit['credits_used'] != holds.get(credit['id'], 0)
+    ]
+
+
+@transaction.atomic
+def _confirm_and_repair(candidate_ids, repair, stats, samples):
+    """Re-read drifted credits under lock, so bookings in flight do not count as drift, and fix them."""
+    # Reservar o cancelar actualiza la fila del crédito: con el candado tomado, lo confirmado es consistente
+    credits = list(
+        UserCredit.objects.select_for_update().filter(pk__in=candidate_ids)
+        .order_by('pk').values('id', 'studio_id', 'user_id', 'credits_total', 'credits_used')
+    )
+    ledger, holds = _totals(candidate_ids)
+    movements, pairs = [], set()
+    for credit in _drifted(credits, ledger, holds):
+        logged, held = ledger.get(credit['id'], 0), holds.get(credit['id'], 0)
+        stats['ledger_drift'] += credit['credits_used'] != logged
+        stats['booking_drift'] += credit['credits_used'] != held
+        stats['overdrawn'] += held > credit['credits_total']
+        if len(samples) < MAX_SAMPLES:
+            samples.append({
+                'credit': str(credit['id']),
+                'user': str(credit['user_id']),
+                'credits_used': credit['credits_used'],
+                'ledger': logged,
+                'bookings': held,
+            })
+        if not repair:
+            continue
+        target = min(held, credit['credits_total'])
+        if target != credit['credits_used']:
+            UserCredit.objects.filter(pk=credit['id']).update(credits_used=target, version=F('version') + 1)
+            pairs.add((credit['studio_id'], credit['user_id']))
+        if target != logged:
+            movements.append(CreditMovement(
+                studio_id=credit['studio_id'], user_id=credit['user_id'], credit_id=credit['id'],
+                delta=target - logged, kind=Kind.REPAIR,
+            ))
+        stats['repaired'] += 1
+    CreditMovement.objects.bulk_create(movements)
+    if pairs:
+        rebuild_summaries(pairs)
+
+
+def check_credit_ledger(*, studio_id=None, repair=False, batch_size=BATCH_SIZE):
+    """Compare ``credits_used`` with the ledger and the bookings of every credit; optionally fix the drift.
+
+    Returns counters (``credits`` checked, ``ledger_drift``, ``booking_drift``,
+    ``overdrawn`` credits held by more bookings than they have, ``repaired``)
+    plus up to ``MAX_SAMPLES`` drifted credits under ``samples``.
+    """
+    scope = {'studio_id': studio_id} if studio_id else {}
+    stats = {'credits': 0, 'ledger_drift': 0, 'booking_drift': 0, 'overdrawn': 0, 'repaired': 0}
+    samples = []
+    after = None
+    while True:
+        qs = UserCredit.objects.filter(**scope).order_by('pk')
+        if after is not None:
+            qs = qs.filter(pk__gt=after)
+        credits = list(qs.values('id', 'credits_total', 'credits_used')[:batch_size])
+        if not credits:
+            break
+        after = credits[-1]['id']
+        stats['credits'] += len(credits)
+        candidates = _drifted(credits, *_totals([credit['id'] for credit in credits]))
+        if candidates:
+            _confirm_and_repair([credit['id'] for credit in candidates], repair, stats, samples)
+        if len(credits) < batch_size:
+            break
+    if stats['ledger_drift'] or stats['booking_drift']:
+        logger.warning('credit ledger drift', extra={**stats, 'samples': samples[:10]})
+    return {**stats, 'samples': samples}
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from commerce.ledger import check_credit_ledger
+
+
+class Command(BaseCommand):
+    help = 'Compara credits_used contra el libro de movimientos y las reservas; con --repair corrige los desfases.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--studio', help='Limitar a un studio (id)')
+        parser.add_argument('--repair', action='store_true', help='Corregir tomando las reservas como verdad')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        stats = check_credit_ledger(studio_id=options['studio'], repair=options['repair'], batch_size=options['batch_size'])
+        for sample in stats['samples']:
+            self.stdout.write(
+                f"{sample['credit']}: usados {sample['credits_used']} | libro {sample['ledger']} | reservas {sample['bookings']}"
+            )
+        self.stdout.write(
+            f"Créditos: {stats['credits']} | desfase libro: {stats['ledger_drift']} | "
+            f"desfase reservas: {stats['booking_drift']} | sobregirados: {stats['overdrawn']} | corregidos: {stats['repaired']}"
+        )
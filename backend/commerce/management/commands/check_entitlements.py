@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from commerce.entitlements import check_entitlements
+
+
+class Command(BaseCommand):
+    help = 'Compara los resúmenes de saldo contra créditos y membresías; con --repair los reconstruye.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--studio', help='Limitar a un studio (id)')
+        parser.add_argument('--repair', action='store_true', help='Corregir los resúmenes desfasados')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        stats = check_entitlements(studio_id=options['studio'], repair=options['repair'], batch_size=options['batch_size'])
+        self.stdout.write(
+            f"Revisados: {stats['checked']} | faltantes: {stats['missing']} | "
+            f"desfasados: {stats['mismatched']} | corregidos: {stats['repaired']}"
+        )
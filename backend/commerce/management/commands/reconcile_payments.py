@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from commerce.reconciliation import BATCH_SIZE, MAX_WORKERS, reconcile_pending_orders, report
+
+
+class Command(BaseCommand):
+    help = 'Consulta a Mercado Pago las órdenes pendientes y aplica pagos o fallos no notificados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='Consultas simultáneas al proveedor')
+        parser.add_argument('--restart', action='store_true', help='Ignorar una corrida interrumpida y empezar de cero')
+
+    def handle(self, *args, **options):
+        run = reconcile_pending_orders(batch_size=options['batch_size'], max_workers=options['workers'], restart=options['restart'])
+        if run is None:
+            self.stdout.write('Ya hay una conciliación en curso')
+            return
+        stats = report(run)
+        self.stdout.write(
+            f"Estado: {stats['status']} | revisadas: {stats['checked']} | pagadas: {stats['paid']} | "
+            f"fallidas: {stats['failed']} | sin cambio: {stats['unchanged']} | errores: {stats['errors']} | "
+            f"discrepancias: {stats['discrepancies']}"
+        )
+        for item in run.discrepancies:
+            self.stdout.write(f"  {item['kind']}: orden {item['order']} pago {item['payment']} ({item['provider_status']})")
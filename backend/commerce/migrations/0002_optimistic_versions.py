@@ -0,0 +1,23 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercredit',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='usermembership',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
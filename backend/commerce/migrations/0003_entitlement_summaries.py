@@ -0,0 +1,42 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studios', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('commerce', '0002_optimistic_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntitlementSummary',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('credits_available', models.PositiveIntegerField(default=0)),
+                ('credit_buckets', models.JSONField(blank=True, default=list)),
+                ('next_credit_expiration', models.DateTimeField(blank=True, null=True)),
+                ('membership_ends_at', models.DateTimeField(blank=True, null=True)),
+                ('valid_until', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('membership', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='commerce.usermembership')),
+                ('studio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entitlement_summaries', to='studios.studio')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entitlement_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'entitlement_summaries',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='entitlementsummary',
+            constraint=models.UniqueConstraint(fields=('studio', 'user'), name='entitlement_summary_unique'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0003_entitlement_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usermembership',
+            name='source_order_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='memberships', to='commerce.orderitem'),
+        ),
+        migrations.AddConstraint(
+            model_name='usercredit',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_order_item__isnull', False)), fields=('source_order_item',), name='credit_once_per_order_item'),
+        ),
+        migrations.AddConstraint(
+            model_name='usermembership',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_order_item__isnull', False)), fields=('source_order_item',), name='membership_once_per_order_item'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0004_idempotent_fulfillment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentNotification',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('provider', models.CharField(default='mercadopago', max_length=50)),
+                ('payment_id', models.CharField(max_length=100)),
+                ('topic', models.CharField(blank=True, default='', max_length=50)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('received', 'Recibida'), ('processing', 'Procesando'), ('processed', 'Procesada'), ('failed', 'Fallida')], default='received', max_length=20)),
+                ('provider_status', models.CharField(blank=True, default='', max_length=50)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_notifications', to='commerce.order')),
+            ],
+            options={
+                'db_table': 'payment_notifications',
+                'indexes': [models.Index(fields=['status', 'received_at'], name='payment_not_status_6c07d6_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='paymentnotification',
+            constraint=models.UniqueConstraint(fields=('provider', 'payment_id'), name='payment_notification_unique'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:40
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0005_payment_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('status', models.CharField(choices=[('running', 'En curso'), ('completed', 'Completada')], default='running', max_length=20)),
+                ('cursor', models.UUIDField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('checked', models.PositiveIntegerField(default=0)),
+                ('paid', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('unchanged', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('discrepancies', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'db_table': 'payment_reconciliation_runs',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['id'], name='orders_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reconciliationrun',
+            index=models.Index(fields=['status', 'started_at'], name='payment_rec_status_ca5b0c_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0006_payment_reconciliation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercredit',
+            name='status',
+            field=models.CharField(choices=[('active', 'Vigente'), ('expired', 'Vencido')], default='active', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='usercredit',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['user', 'studio'], name='credits_live_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercredit',
+            index=models.Index(condition=models.Q(('expires_at__isnull', False), ('status', 'active')), fields=['expires_at'], name='credits_live_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usermembership',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['user', 'studio'], name='memberships_live_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usermembership',
+            index=models.Index(condition=models.Q(('ends_at__isnull', False), ('status__in', ['active', 'paused'])), fields=['ends_at'], name='memberships_live_ends_idx'),
+        ),
+    ]
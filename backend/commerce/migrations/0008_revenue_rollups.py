@@ -0,0 +1,42 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_dedupe_classtypes_ci_unique'),
+        ('studios', '0001_initial'),
+        ('commerce', '0007_expiry_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='refunded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RevenueDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('product_type', models.CharField(max_length=20)),
+                ('lines', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('gross_cents', models.BigIntegerField(default=0)),
+                ('refunded_cents', models.BigIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.product')),
+                ('studio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_days', to='studios.studio')),
+            ],
+            options={
+                'db_table': 'revenue_daily',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='revenuedaily',
+            constraint=models.UniqueConstraint(fields=('studio', 'day', 'product'), name='revenue_daily_unique'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0008_revenue_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['studio', 'status', 'paid_at'], name='orders_studio_status_paid_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0009_order_list_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MembershipRenewal',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('billing_at', models.DateTimeField()),
+                ('period_end', models.DateTimeField()),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('charged', 'Cobrada'), ('failed', 'Rechazada'), ('abandoned', 'Abandonada')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('retry_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('charged_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'membership_renewals',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='usermembership',
+            index=models.Index(condition=models.Q(('next_billing_at__isnull', False), ('status', 'active')), fields=['next_billing_at', 'id'], name='memberships_billing_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='membershiprenewal',
+            name='membership',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renewals', to='commerce.usermembership'),
+        ),
+        migrations.AddField(
+            model_name='membershiprenewal',
+            name='order',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='renewal', to='commerce.order'),
+        ),
+        migrations.AddConstraint(
+            model_name='membershiprenewal',
+            constraint=models.UniqueConstraint(fields=('membership', 'billing_at'), name='membership_renewal_once_per_period'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def open_ledger(apps, schema_editor):
+    """One opening movement per credit already in use, so the ledger starts balanced."""
+    UserCredit = apps.get_model('commerce', 'UserCredit')
+    CreditMovement = apps.get_model('commerce', 'CreditMovement')
+    rows = UserCredit.objects.filter(credits_used__gt=0).values_list('id', 'studio_id', 'user_id', 'credits_used').iterator(chunk_size=5000)
+    batch = []
+    for credit_id, studio_id, user_id, used in rows:
+        batch.append(CreditMovement(credit_id=credit_id, studio_id=studio_id, user_id=user_id, delta=used, kind='opening'))
+        if len(batch) == 5000:
+            CreditMovement.objects.bulk_create(batch)
+            batch = []
+    CreditMovement.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studios', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('commerce', '0010_membership_billing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditMovement',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('booking_id', models.UUIDField(blank=True, null=True)),
+                ('delta', models.SmallIntegerField()),
+                ('kind', models.CharField(choices=[('opening', 'Saldo inicial'), ('consume', 'Consumo'), ('refund', 'Devolución'), ('repair', 'Corrección')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('credit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='commerce.usercredit')),
+                ('studio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='studios.studio')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'credit_movements',
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0011_credit_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='membershiprenewal',
+            name='payment_ref',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
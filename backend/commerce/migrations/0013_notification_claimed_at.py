@@ -0,0 +1,26 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:34
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def claim_in_flight(apps, schema_editor):
+    """Rows already in processing take their arrival time, so a lost one is still requeued."""
+    PaymentNotification = apps.get_model('commerce', 'PaymentNotification')
+    PaymentNotification.objects.filter(status='processing').update(claimed_at=F('received_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0012_renewal_payment_ref'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentnotification',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(claim_in_flight, migrations.RunPython.noop),
+    ]
@@ -18,12 +18,16 @@ class Order(BaseModel):
     provider = models.CharField(max_length=50, null=True, blank=True)
     provider_ref = models.CharField(max_length=100, null=True, blank=True)
     paid_at = models.DateTimeField(null=True, blank=True)
+    refunded_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = 'orders'
         indexes = [
             models.Index(fields=['user']),
             models.Index(fields=['status']),
+            models.Index(fields=['studio', 'status', 'paid_at'], name='orders_studio_status_paid_idx'),
+            # Recorrido por llave de la conciliación: solo órdenes pendientes
+            models.Index(fields=['id'], condition=models.Q(status='pending'), name='orders_pending_idx'),
         ]
 
 class OrderItem(BaseModel):
@@ -39,17 +43,53 @@ class OrderItem(BaseModel):
         indexes = [models.Index(fields=['order'])]
 
 class UserCredit(BaseModel):
+    class Status(models.TextChoices):
+        ACTIVE = 'active', 'Vigente'
+        EXPIRED = 'expired', 'Vencido'
+
     studio = models.ForeignKey('studios.Studio', on_delete=models.CASCADE, related_name='user_credits')
     user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='credits')
     source_order_item = models.ForeignKey(OrderItem, on_delete=models.SET_NULL, null=True, blank=True, related_name='credits')
     credits_total = models.PositiveIntegerField()
     credits_used = models.PositiveIntegerField(default=0)
     expires_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.ACTIVE)
+    version = models.PositiveIntegerField(default=0)
 
     class Meta:
         db_table = 'user_credits'
-        indexes = [models.Index(fields=['user'])]
-        constraints = [models.CheckConstraint(check=models.Q(credits_used__lte=models.F('credits_total')), name='credits_not_overflow')]
+        indexes = [
+            models.Index(fields=['user']),
+            # Índices parciales sobre filas vigentes: las consultas calientes y el barrido no tocan las vencidas
+            models.Index(fields=['user', 'studio'], condition=models.Q(status='active'), name='credits_live_user_idx'),
+            models.Index(fields=['expires_at'], condition=models.Q(status='active', expires_at__isnull=False), name='credits_live_expiry_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(credits_used__lte=models.F('credits_total')), name='credits_not_overflow'),
+            # Una línea de orden otorga créditos una sola vez
+            models.UniqueConstraint(fields=['source_order_item'], condition=models.Q(source_order_item__isnull=False), name='credit_once_per_order_item'),
+        ]
+
+class CreditMovement(models.Model):
+    """Append-only change of a credit's ``credits_used``; rows are never updated or deleted."""
+    class Kind(models.TextChoices):
+        OPENING = 'opening', 'Saldo inicial'
+        CONSUME = 'consume', 'Consumo'
+        REFUND = 'refund', 'Devolución'
+        REPAIR = 'repair', 'Corrección'
+
+    id = models.BigAutoField(primary_key=True)
+    studio = models.ForeignKey('studios.Studio', on_delete=models.CASCADE, related_name='+')
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='+')
+    credit = models.ForeignKey(UserCredit, on_delete=models.CASCADE, related_name='movements')
+    # Sin llave foránea: borrar una reserva no reescribe el historial
+    booking_id = models.UUIDField(null=True, blank=True)
+    delta = models.SmallIntegerField()
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'credit_movements'
 
 class UserMembership(BaseModel):
     STATUS_CHOICES = (
@@ -61,13 +101,146 @@ class UserMembership(BaseModel):
     studio = models.ForeignKey('studios.Studio', on_delete=models.CASCADE, related_name='user_memberships')
     user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='memberships')
     product = models.ForeignKey('catalog.Product', on_delete=models.PROTECT, related_name='memberships')
+    source_order_item = models.ForeignKey(OrderItem, on_delete=models.SET_NULL, null=True, blank=True, related_name='memberships')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     starts_at = models.DateTimeField(default=timezone.now)
     ends_at = models.DateTimeField(null=True, blank=True)
     next_billing_at = models.DateTimeField(null=True, blank=True)
     provider = models.CharField(max_length=50, null=True, blank=True)
     provider_ref = models.CharField(max_length=100, null=True, blank=True)
+    version = models.PositiveIntegerField(default=0)
+
+    # Transiciones permitidas; se aplican con transition()/bulk_transition() sobre `version`
+    TRANSITIONS = {
+        'active': {'paused', 'cancelled', 'expired'},
+        'paused': {'active', 'cancelled', 'expired'},
+        # Un reembolso cancela también una membresía ya vencida
+        'expired': {'active', 'cancelled'},
+        'cancelled': set(),
+    }
 
     class Meta:
         db_table = 'user_memberships'
-        indexes = [models.Index(fields=['user']), models.Index(fields=['status'])]
+        indexes = [
+            models.Index(fields=['user']),
+            models.Index(fields=['status']),
+            models.Index(fields=['user', 'studio'], condition=models.Q(status='active'), name='memberships_live_user_idx'),
+            models.Index(fields=['ends_at'], condition=models.Q(status__in=['active', 'paused'], ends_at__isnull=False), name='memberships_live_ends_idx'),
+            # Selección del cobro recurrente: solo membresías activas con renovación automática
+            models.Index(fields=['next_billing_at', 'id'], condition=models.Q(status='active', next_billing_at__isnull=False), name='memberships_billing_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['source_order_item'], condition=models.Q(source_order_item__isnull=False), name='membership_once_per_order_item'),
+        ]
+
+class MembershipRenewal(BaseModel):
+    """One billing of a membership period; unique per ``billing_at`` so a retried run never bills twice."""
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pendiente'
+        CHARGED = 'charged', 'Cobrada'
+        FAILED = 'failed', 'Rechazada'
+        ABANDONED = 'abandoned', 'Abandonada'
+
+    membership = models.ForeignKey(UserMembership, on_delete=models.CASCADE, related_name='renewals')
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='renewal')
+    billing_at = models.DateTimeField()
+    period_end = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    retry_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    charged_at = models.DateTimeField(null=True, blank=True)
+    # Pago en proceso en el proveedor: se consulta en vez de cobrar de nuevo
+    payment_ref = models.CharField(max_length=100, blank=True, default='')
+
+    class Meta:
+        db_table = 'membership_renewals'
+        constraints = [models.UniqueConstraint(fields=['membership', 'billing_at'], name='membership_renewal_once_per_period')]
+
+class EntitlementSummary(BaseModel):
+    """Wallet view of a member's credits and membership in one studio.
+
+    Derived from ``UserCredit``/``UserMembership``; ``credit_buckets`` lists the
+    usable credits in consumption order (soonest expiry first). ``valid_until``
+    is the next moment an expiry changes the balance.
+    """
+    studio = models.ForeignKey('studios.Studio', on_delete=models.CASCADE, related_name='entitlement_summaries')
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='entitlement_summaries')
+    credits_available = models.PositiveIntegerField(default=0)
+    credit_buckets = models.JSONField(default=list, blank=True)
+    next_credit_expiration = models.DateTimeField(null=True, blank=True)
+    membership = models.ForeignKey(UserMembership, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    membership_ends_at = models.DateTimeField(null=True, blank=True)
+    valid_until = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'entitlement_summaries'
+        constraints = [models.UniqueConstraint(fields=['studio', 'user'], name='entitlement_summary_unique')]
+
+class PaymentNotification(BaseModel):
+    """Raw provider webhook, stored before any processing; one row per payment."""
+    class Status(models.TextChoices):
+        RECEIVED = 'received', 'Recibida'
+        PROCESSING = 'processing', 'Procesando'
+        PROCESSED = 'processed', 'Procesada'
+        FAILED = 'failed', 'Fallida'
+
+    provider = models.CharField(max_length=50, default='mercadopago')
+    payment_id = models.CharField(max_length=100)
+    topic = models.CharField(max_length=50, blank=True, default='')
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.RECEIVED)
+    provider_status = models.CharField(max_length=50, blank=True, default='')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='payment_notifications')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    received_at = models.DateTimeField(default=timezone.now)
+    # Cuándo un worker la tomó; mide si quedó atascada en processing
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'payment_notifications'
+        constraints = [models.UniqueConstraint(fields=['provider', 'payment_id'], name='payment_notification_unique')]
+        indexes = [models.Index(fields=['status', 'received_at'])]
+
+class ReconciliationRun(BaseModel):
+    """One pass of the pending-order reconciliation; ``cursor`` lets an interrupted run resume."""
+    class Status(models.TextChoices):
+        RUNNING = 'running', 'En curso'
+        COMPLETED = 'completed', 'Completada'
+
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.RUNNING)
+    cursor = models.UUIDField(null=True, blank=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    checked = models.PositiveIntegerField(default=0)
+    paid = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    unchanged = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    discrepancies = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        db_table = 'payment_reconciliation_runs'
+        indexes = [models.Index(fields=['status', 'started_at'])]
+
+class RevenueDaily(models.Model):
+    """Sales of one product in a studio on one local day.
+
+    ``gross_cents`` counts orders paid that day (even if refunded later) and
+    ``refunded_cents`` orders refunded that day.
+    """
+    studio = models.ForeignKey('studios.Studio', on_delete=models.CASCADE, related_name='revenue_days')
+    day = models.DateField()
+    product = models.ForeignKey('catalog.Product', on_delete=models.CASCADE, related_name='+')
+    product_type = models.CharField(max_length=20)
+    lines = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    gross_cents = models.BigIntegerField(default=0)
+    refunded_cents = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'revenue_daily'
+        constraints = [models.UniqueConstraint(fields=['studio', 'day', 'product'], name='revenue_daily_unique')]
@@ -0,0 +1,128 @@
+"""Mercado Pago webhook ingestion.
+
+The webhook only validates the notification, stores it (one row per payment)
+and queues ``process_payment_notification``; a Celery worker fetches the
+payment from the provider and fulfills the order. Provider latency never
+holds a web worker.
+"""
+import hashlib
+import hmac
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Order, PaymentNotification
+from .services import PaymentProviderError, fetch_mp_payment, mark_order_paid
+
+PROVIDER = 'mercadopago'
+# Estados después de los cuales una nueva notificación del mismo pago no cambia nada
+FINAL_STATUSES = ('approved', 'rejected', 'cancelled', 'refunded', 'charged_back')
+STALE_PROCESSING = timedelta(minutes=5)
+MAX_ATTEMPTS = 8
+
+Status = PaymentNotification.Status
+
+
+def verify_signature(payment_id, signature_header, request_id):
+    """Check the ``x-signature`` header when ``MP_WEBHOOK_SECRET`` is configured."""
+    secret = getattr(settings, 'MP_WEBHOOK_SECRET', None)
+    if not secret:
+        return True
+    parts = dict(part.strip().split('=', 1) for part in (signature_header or '').split(',') if '=' in part)
+    if 'ts' not in parts or 'v1' not in parts:
+        return False
+    manifest = f'id:{payment_id};request-id:{request_id or ""};ts:{parts["ts"]};'
+    expected = hmac.new(secret.encode(), manifest.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, parts['v1'])
+
+
+def _enqueue(notification_id):
+    from .tasks import process_payment_notification
+
+    transaction.on_commit(lambda: process_payment_notification.delay(str(notification_id)))
+
+
+@transaction.atomic
+def record_notification(payment_id, *, topic='', payload=None):
+    """Store the notification and queue its processing; returns ``(notification, queued)``.
+
+    Repeated notifications of a payment share one row. They only queue work
+    again when the last fetch failed or saw a non-final payment status.
+    """
+    notification, created = PaymentNotification.objects.get_or_create(
+        provider=PROVIDER,
+        payment_id=payment_id,
+        defaults={'topic': topic, 'payload': payload or {}},
+    )
+    if created:
+        queued = True
+    else:
+        queued = bool(
+            PaymentNotification.objects.filter(pk=notification.pk, status__in=[Status.PROCESSED, Status.FAILED])
+            .exclude(provider_status__in=FINAL_STATUSES)
+            .update(status=Status.RECEIVED, payload=payload or {}, received_at=timezone.now())
+        )
+    if queued:
+        _enqueue(notification.pk)
+    return notification, queued
+
+
+def _order_for(data):
+    try:
+        order_id = uuid.UUID(str(data.get('external_reference')))
+    except ValueError:
+        return None
+    return Order.objects.filter(id=order_id).first()
+
+
+def process_notification(notification_id):
+    """Fetch the payment and apply it; returns the provider status or ``None`` if skipped.
+
+    Raises ``PaymentProviderError`` after recording the failure so the task
+    can retry.
+    """
+    claimed = PaymentNotification.objects.filter(pk=notification_id, status__in=[Status.RECEIVED, Status.FAILED]).update(
+        status=Status.PROCESSING, attempts=F('attempts') + 1, claimed_at=timezone.now()
+    )
+    if not claimed:
+        return None
+    notification = PaymentNotification.objects.get(pk=notification_id)
+    try:
+        data = fetch_mp_payment(notification.payment_id)
+    except PaymentProviderError as exc:
+        notification.status = Status.FAILED
+        notification.last_error = str(exc)[:1000]
+        notification.save(update_fields=['status', 'last_error'])
+        raise
+
+    order = _order_for(data)
+    provider_status = data.get('status') or ''
+    if order is not None and provider_status == 'approved':
+        mark_order_paid(order, provider=PROVIDER, provider_ref=str(notification.payment_id))
+    notification.status = Status.PROCESSED
+    notification.provider_status = provider_status
+    notification.order = order
+    notification.last_error = ''
+    notification.processed_at = timezone.now()
+    notification.save(update_fields=['status', 'provider_status', 'order', 'last_error', 'processed_at'])
+    return provider_status
+
+
+def requeue_stalled(now=None):
+    """Queue failed notifications and those stuck in processing (worker lost); returns how many.
+
+    Staleness counts from when a worker claimed the row, not from when it
+    arrived: a notification that waited in a long Celery queue is still held.
+    """
+    now = now or timezone.now()
+    stuck = Q(status=Status.PROCESSING, claimed_at__lt=now - STALE_PROCESSING)
+    stalled = PaymentNotification.objects.filter(Q(status=Status.FAILED) | stuck, attempts__lt=MAX_ATTEMPTS)
+    ids = list(stalled.values_list('pk', flat=True))
+    PaymentNotification.objects.filter(stuck, pk__in=ids).update(status=Status.FAILED)
+    for notification_id in ids:
+        _enqueue(notification_id)
+    return len(ids)
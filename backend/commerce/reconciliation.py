@@ -0,0 +1,176 @@
+"""Reconciliation of pending Mercado Pago orders whose notification never arrived.
+
+Walks pending orders that have a payment link in primary-key order (keyset
+batches), asks the provider for each order's payments from a bounded thread
+pool and applies the outcomes per batch: an approved payment marks the order
+paid and fulfills it, only rejected/cancelled attempts mark it failed.
+Progress is saved after every batch, so an interrupted run resumes where it
+stopped.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+from django.utils import timezone
+
+from core.utils import log_action
+from .billing import settle_renewal
+from .models import Order, ReconciliationRun
+from .revenue import record_paid
+from .services import PaymentProviderError, fulfill_order, search_mp_payments
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+MAX_WORKERS = 8
+# Margen para que el webhook normal llegue antes de consultar al proveedor
+GRACE = timedelta(minutes=15)
+MAX_DISCREPANCIES = 1000
+LOCK_KEY = 'commerce:reconcile-payments'
+LOCK_SECONDS = 60 * 60
+DEAD_STATUSES = ('rejected', 'cancelled')
+
+Run = ReconciliationRun.Status
+
+
+def classify(order, payments):
+    """Return ``(outcome, payment, discrepancy)`` for a pending order and its provider payments."""
+    approved = next((payment for payment in payments if payment.get('status') == 'approved'), None)
+    if approved is not None:
+        amount = approved.get('transaction_amount')
+        if amount is not None and round(float(amount) * 100) != order['total_cents']:
+            # No se entrega nada si el monto cobrado no coincide; lo revisa staff
+            return 'unchanged', approved, 'amount_mismatch'
+        return 'paid', approved, 'paid_without_notification'
+    if payments and all(payment.get('status') in DEAD_STATUSES for payment in payments):
+        return 'failed', payments[0], None
+    return 'unchanged', payments[0] if payments else None, None
+
+
+def _lookup(order_id):
+    try:
+        return search_mp_payments(order_id), None
+    except PaymentProviderError as exc:
+        return None, str(exc)
+
+
+@transaction.atomic
+def _apply_paid(paid, now):
+    """Mark ``{order_id: payment_id}`` paid in one UPDATE and fulfill the orders this run won."""
+    won = list(
+        Order.objects.select_for_update(of=('self',))
+        .select_related('studio', 'user')
+        .filter(pk__in=paid, status=Order.OrderStatus.PENDING)
+        .order_by('pk')
+    )
+    if not won:
+        return 0
+    Order.objects.filter(pk__in=[order.pk for order in won]).update(
+        status=Order.OrderStatus.PAID,
+        paid_at=now,
+        provider='mercadopago',
+        provider_ref=Case(*[When(pk=order.pk, then=Value(paid[order.pk])) for order in won], output_field=CharField()),
+    )
+    for order in won:
+        order.status, order.paid_at, order.provider_ref = Order.OrderStatus.PAID, now, paid[order.pk]
+        fulfill_order(order, now)
+        # Igual que mark_order_paid: una orden de renovación extiende su membresía
+        settle_renewal(order, now)
+        record_paid(order)
+        log_action(order.studio, order.user, 'order_paid', 'order', order.id, {'source': 'reconciliation'})
+    return len(won)
+
+
+def _apply_failed(failed):
+    return Order.objects.filter(pk__in=failed, status=Order.OrderStatus.PENDING).update(status=Order.OrderStatus.FAILED)
+
+
+def _candidates(now):
+    return Order.objects.filter(
+        status=Order.OrderStatus.PENDING,
+        provider='mercadopago',
+        provider_ref__isnull=False,
+        created_at__lt=now - GRACE,
+    ).order_by('pk')
+
+
+def _process_batch(run, batch, pool, now):
+    """Check one batch; returns ``False`` when the provider failed for every order (stop and resume later)."""
+    lookups = list(pool.map(_lookup, [row['id'] for row in batch]))
+    if all(error is not None for _, error in lookups):
+        logger.warning('payment reconciliation paused, provider unavailable', extra={'error': lookups[0][1]})
+        return False
+
+    paid, failed = {}, []
+    for row, (payments, error) in zip(batch, lookups):
+        run.checked += 1
+        if error is not None:
+            run.errors += 1
+            continue
+        outcome, payment, discrepancy = classify(row, payments)
+        if outcome == 'paid':
+            paid[row['id']] = str(payment['id'])
+        elif outcome == 'failed':
+            failed.append(row['id'])
+        else:
+            run.unchanged += 1
+        if discrepancy and len(run.discrepancies) < MAX_DISCREPANCIES:
+            run.discrepancies.append({
+                'order': str(row['id']),
+                'payment': str(payment['id']),
+                'kind': discrepancy,
+                'provider_status': payment.get('status'),
+                'provider_amount': payment.get('transaction_amount'),
+                'total_cents': row['total_cents'],
+            })
+    run.paid += _apply_paid(paid, now) if paid else 0
+    run.failed += _apply_failed(failed) if failed else 0
+    run.cursor = batch[-1]['id']
+    run.save(update_fields=['cursor', 'checked', 'paid', 'failed', 'unchanged', 'errors', 'discrepancies'])
+    return True
+
+
+def reconcile_pending_orders(*, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS, restart=False, now=None):
+    """Run (or resume) a reconciliation pass; returns the run, or ``None`` if another one holds the lock."""
+    if not cache.add(LOCK_KEY, 1, LOCK_SECONDS):
+        return None
+    try:
+        now = now or timezone.now()
+        running = ReconciliationRun.objects.filter(status=Run.RUNNING).order_by('-started_at')
+        if restart:
+            running.update(status=Run.COMPLETED, finished_at=now)
+        run = running.first() or ReconciliationRun.objects.create()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while True:
+                qs = _candidates(now)
+                if run.cursor:
+                    qs = qs.filter(pk__gt=run.cursor)
+                batch = list(qs.values('id', 'total_cents')[:batch_size])
+                if not batch:
+                    break
+                if not _process_batch(run, batch, pool, now):
+                    return run
+        run.status = Run.COMPLETED
+        run.finished_at = timezone.now()
+        run.save(update_fields=['status', 'finished_at'])
+        if run.discrepancies:
+            logger.warning('payment reconciliation found discrepancies', extra=report(run))
+        return run
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def report(run):
+    return {
+        'run': str(run.id),
+        'status': run.status,
+        'checked': run.checked,
+        'paid': run.paid,
+        'failed': run.failed,
+        'unchanged': run.unchanged,
+        'errors': run.errors,
+        'discrepancies': len(run.discrepancies),
+    }
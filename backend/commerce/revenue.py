@@ -0,0 +1,206 @@
+"""Sales rollups and revenue reports for staff.
+
+``RevenueDaily`` keeps one row per studio, local day and product. Paying or
+refunding an order adds its lines to the row of that day in the same
+transaction; reports sum these rows, so a year-to-date query reads at most
+365 days × products rows whatever the order volume. ``reconcile_revenue``
+rebuilds a date range from the orders every night.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from catalog.pricing import get_price_book
+from .models import EntitlementSummary, Order, OrderItem, RevenueDaily, UserMembership
+
+ROLLUP_FIELDS = ('lines', 'units', 'gross_cents', 'refunded_cents')
+DAYS_PER_MONTH = 30
+
+
+def _apply(studio_id, day, deltas):
+    for (product_id, product_type), delta in deltas.items():
+        changes = {name: value for name, value in delta.items() if value}
+        if not changes:
+            continue
+        increments = {name: F(name) + value for name, value in changes.items()}
+        row = RevenueDaily.objects.filter(studio_id=studio_id, day=day, product_id=product_id)
+        if row.update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                RevenueDaily.objects.create(studio_id=studio_id, day=day, product_id=product_id, product_type=product_type, **changes)
+        except IntegrityError:
+            row.update(**increments)
+
+
+def _order_deltas(order, refund):
+    deltas = defaultdict(Counter)
+    for item in order.items.values('product_id', 'product__type', 'quantity', 'line_total_cents'):
+        delta = deltas[(item['product_id'], item['product__type'])]
+        if refund:
+            delta['refunded_cents'] += item['line_total_cents']
+        else:
+            delta['lines'] += 1
+            delta['units'] += item['quantity']
+            delta['gross_cents'] += item['line_total_cents']
+    return deltas
+
+
+def record_paid(order):
+    """Add a just-paid order to its day; call inside the transaction that marked it paid."""
+    _apply(order.studio_id, timezone.localdate(order.paid_at), _order_deltas(order, refund=False))
+
+
+def record_paid_orders(orders):
+    """``record_paid`` for many orders with one read of their lines."""
+    days = {order.pk: (order.studio_id, timezone.localdate(order.paid_at)) for order in orders}
+    grouped = defaultdict(lambda: defaultdict(Counter))
+    items = OrderItem.objects.filter(order_id__in=days).values('order_id', 'product_id', 'product__type', 'quantity', 'line_total_cents')
+    for item in items:
+        delta = grouped[days[item['order_id']]][(item['product_id'], item['product__type'])]
+        delta['lines'] += 1
+        delta['units'] += item['quantity']
+        delta['gross_cents'] += item['line_total_cents']
+    for (studio_id, day), deltas in grouped.items():
+        _apply(studio_id, day, deltas)
+
+
+def record_refund(order):
+    _apply(order.studio_id, timezone.localdate(order.refunded_at), _order_deltas(order, refund=True))
+
+
+def _local_bounds(start_day, end_day):
+    tz = timezone.get_current_timezone()
+    return (
+        datetime.datetime.combine(start_day, datetime.time.min, tzinfo=tz),
+        datetime.datetime.combine(end_day, datetime.time.min, tzinfo=tz),
+    )
+
+
+def _expected(start_day, end_day, scope):
+    start, end = _local_bounds(start_day, end_day)
+    tz = timezone.get_current_timezone()
+    items = OrderItem.objects.filter(**{f'order__{name}': value for name, value in scope.items()})
+    expected = defaultdict(Counter)
+    paid = (
+        items.filter(order__paid_at__gte=start, order__paid_at__lt=end,
+                     order__status__in=[Order.OrderStatus.PAID, Order.OrderStatus.REFUNDED])
+        .annotate(day=TruncDate('order__paid_at', tzinfo=tz))
+        .values('order__studio_id', 'day', 'product_id', 'product__type')
+        .annotate(lines=Count('pk'), units=Sum('quantity'), gross_cents=Sum('line_total_cents'))
+    )
+    for row in paid:
+        key = (row['order__studio_id'], row['day'], row['product_id'], row['product__type'])
+        expected[key].update({'lines': row['lines'], 'units': row['units'], 'gross_cents': row['gross_cents']})
+    refunded = (
+        items.filter(order__refunded_at__gte=start, order__refunded_at__lt=end, order__status=Order.OrderStatus.REFUNDED)
+        .annotate(day=TruncDate('order__refunded_at', tzinfo=tz))
+        .values('order__studio_id', 'day', 'product_id', 'product__type')
+        .annotate(refunded_cents=Sum('line_total_cents'))
+    )
+    for row in refunded:
+        key = (row['order__studio_id'], row['day'], row['product_id'], row['product__type'])
+        expected[key]['refunded_cents'] += row['refunded_cents']
+    return expected
+
+
+@transaction.atomic
+def reconcile_revenue(*, start, end, studio_id=None):
+    """Rebuild ``[start, end)`` (local dates) from the orders; returns counters of what drifted."""
+    scope = {'studio_id': studio_id} if studio_id else {}
+    expected = _expected(start, end, scope)
+    current = {
+        (row.studio_id, row.day, row.product_id): row
+        for row in RevenueDaily.objects.select_for_update().filter(day__gte=start, day__lt=end, **scope)
+    }
+    expected_keys = {key[:3] for key in expected}
+    stale = [row.pk for key, row in current.items() if key not in expected_keys]
+    to_create, to_update = [], []
+    for (row_studio, day, product_id, product_type), values in expected.items():
+        row = current.get((row_studio, day, product_id))
+        if row is None:
+            to_create.append(RevenueDaily(studio_id=row_studio, day=day, product_id=product_id, product_type=product_type,
+                                          **{name: values[name] for name in ROLLUP_FIELDS}))
+        elif any(getattr(row, name) != values[name] for name in ROLLUP_FIELDS):
+            for name in ROLLUP_FIELDS:
+                setattr(row, name, values[name])
+            to_update.append(row)
+    RevenueDaily.objects.filter(pk__in=stale).delete()
+    RevenueDaily.objects.bulk_create(to_create)
+    RevenueDaily.objects.bulk_update(to_update, ROLLUP_FIELDS)
+    return {'rows_checked': len(expected), 'rows_fixed': len(stale) + len(to_create) + len(to_update)}
+
+
+GROUPINGS = {
+    'day': ('day',),
+    'product': ('product_id', 'product__name', 'product_type'),
+    'type': ('product_type',),
+}
+
+
+def revenue_report(studio, start, end, group_by):
+    """Sales over ``[start, end)`` grouped by day, product or product type, from the rollups only."""
+    keys = GROUPINGS[group_by]
+    rows = (
+        RevenueDaily.objects.filter(studio=studio, day__gte=start, day__lt=end)
+        .values(*keys)
+        .annotate(**{name: Sum(name) for name in ROLLUP_FIELDS})
+        .order_by(*keys)
+    )
+    results = []
+    for row in rows:
+        results.append({
+            'key': str(row[keys[0]]),
+            'label': row.get('product__name', row[keys[0]]),
+            **({'product_type': row['product_type']} if group_by == 'product' else {}),
+            **{name: row[name] for name in ROLLUP_FIELDS},
+            'net_cents': row['gross_cents'] - row['refunded_cents'],
+        })
+    return results
+
+
+def monthly_recurring_revenue(studio, now=None):
+    """Active memberships normalized to 30 days, per plan."""
+    now = now or timezone.now()
+    rows = (
+        UserMembership.objects.filter(studio=studio, status='active')
+        .filter(Q(ends_at__isnull=True) | Q(ends_at__gte=now))
+        .values('product_id', 'product__name', 'product__price_cents', 'product__meta')
+        .annotate(members=Count('pk'))
+        .order_by('product__name')
+    )
+    plans = []
+    for row in rows:
+        duration = int((row['product__meta'] or {}).get('duration_days') or DAYS_PER_MONTH)
+        monthly = round(row['product__price_cents'] * DAYS_PER_MONTH / max(duration, 1))
+        plans.append({
+            'product': str(row['product_id']),
+            'name': row['product__name'],
+            'members': row['members'],
+            'mrr_cents': monthly * row['members'],
+        })
+    return {'mrr_cents': sum(plan['mrr_cents'] for plan in plans), 'plans': plans}
+
+
+def outstanding_credits(studio, now=None):
+    """Unused, unexpired credits (the studio's liability), from the entitlement summaries."""
+    now = now or timezone.now()
+    prices = get_price_book(studio.id)
+    credits = members = value = 0
+    summaries = EntitlementSummary.objects.filter(studio=studio, credits_available__gt=0).values_list('credit_buckets', flat=True)
+    for buckets in summaries:
+        live = [bucket for bucket in buckets if not bucket['expires_at'] or datetime.datetime.fromisoformat(bucket['expires_at']) > now]
+        if not live:
+            continue
+        members += 1
+        for bucket in live:
+            credits += bucket['remaining']
+            product = prices.get(bucket['product'] or '')
+            if product:
+                per_credit = product['price_cents'] / max(int(product['meta'].get('credits') or 1), 1)
+                value += bucket['remaining'] * per_credit
+    return {'credits': credits, 'members': members, 'value_cents': round(value)}
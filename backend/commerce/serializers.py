@@ -12,8 +12,17 @@ class OrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ['id', 'studio', 'user', 'status', 'total_cents', 'currency', 'provider', 'provider_ref', 'paid_at', 'items', 'created_at']
-        read_only_fields = ['id', 'status', 'total_cents', 'paid_at', 'created_at', 'studio', 'user']
+        fields = ['id', 'studio', 'user', 'status', 'total_cents', 'currency', 'provider', 'provider_ref', 'paid_at', 'refunded_at', 'items', 'created_at']
+        read_only_fields = ['id', 'status', 'total_cents', 'paid_at', 'refunded_at', 'created_at', 'studio', 'user']
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """Order without its lines, for long staff listings."""
+    item_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'user', 'status', 'total_cents', 'currency', 'provider', 'paid_at', 'refunded_at', 'item_count', 'created_at']
+        read_only_fields = fields
 
 class CreateOrderSerializer(serializers.Serializer):
     items = serializers.ListField(child=serializers.DictField(), allow_empty=False)
@@ -23,9 +32,12 @@ class CreateOrderSerializer(serializers.Serializer):
 class UserCreditSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserCredit
-        fields = ['id', 'studio', 'user', 'source_order_item', 'credits_total', 'credits_used', 'expires_at', 'created_at']
+        fields = ['id', 'studio', 'user', 'source_order_item', 'credits_total', 'credits_used', 'expires_at', 'status', 'created_at']
         read_only_fields = ['id', 'studio', 'user', 'created_at']
 
+class BalanceBatchSerializer(serializers.Serializer):
+    users = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=5000)
+
 class UserMembershipSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserMembership
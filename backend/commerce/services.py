@@ -1,116 +1,220 @@
-import requests
 from django.conf import settings
 from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 from catalog.models import Product
+from catalog.pricing import get_price_book
 from .models import Order, OrderItem, UserCredit, UserMembership
+from .revenue import record_paid, record_refund
+from .entitlements import get_summary, get_balances, balance_from_summary, rebuild_summary
+from core.concurrency import transition
+from core.provider_client import ProviderClient, ProviderError
 from core.utils import log_action
+from users.dashboard import invalidate_member
+
+MAX_LINE_QUANTITY = 100
+
+
+def _price_lines(studio, items_payload):
+    """Validate every line against the cached price book; report all bad lines at once."""
+    prices = get_price_book(studio.id)
+    lines, errors = [], []
+    for index, item in enumerate(items_payload):
+        product_id = str(item.get('product'))
+        product = prices.get(product_id)
+        try:
+            qty = int(item.get('quantity', 1))
+        except (TypeError, ValueError):
+            qty = 0
+        if product is None:
+            errors.append({'index': index, 'detail': 'Producto no encontrado'})
+        elif not product['is_active']:
+            errors.append({'index': index, 'detail': f"{product['name']} no está disponible"})
+        elif not 1 <= qty <= MAX_LINE_QUANTITY:
+            errors.append({'index': index, 'detail': f'Cantidad inválida (1 a {MAX_LINE_QUANTITY})'})
+        else:
+            lines.append((product_id, qty, product['price_cents']))
+    if errors:
+        raise ValidationError({'items': errors})
+    return lines
+
 
 @transaction.atomic
 def create_order(*, studio, user, items_payload, provider=None, provider_ref=None):
     if not items_payload:
         raise ValidationError('Se requieren productos')
+    lines = _price_lines(studio, items_payload)
     order = Order.objects.create(
         studio=studio,
         user=user,
         status=Order.OrderStatus.PENDING,
         provider=provider,
         provider_ref=provider_ref,
+        total_cents=sum(qty * price for _, qty, price in lines),
     )
-    total = 0
-    for item in items_payload:
-        product_id = item.get('product')
-        qty = int(item.get('quantity', 1))
-        try:
-            product = Product.objects.get(id=product_id, studio=studio)
-        except Product.DoesNotExist:
-            raise ValidationError('Producto no encontrado')
-        line_total = product.price_cents * qty
-        OrderItem.objects.create(
+    OrderItem.objects.bulk_create([
+        OrderItem(
             order=order,
-            product=product,
+            product_id=product_id,
             quantity=qty,
-            unit_price_cents=product.price_cents,
-            line_total_cents=line_total,
+            unit_price_cents=price,
+            line_total_cents=qty * price,
         )
-        total += line_total
-    order.total_cents = total
-    order.save(update_fields=['total_cents'])
-    log_action(studio, user, 'order_created', 'order', order.id, {'total_cents': total})
+        for product_id, qty, price in lines
+    ])
+    log_action(studio, user, 'order_created', 'order', order.id, {'total_cents': order.total_cents})
     return order
 
-@transaction.atomic
-def mark_order_paid(order: Order, provider=None, provider_ref=None):
-    if order.status == Order.OrderStatus.PAID:
-        return order
-    order.status = Order.OrderStatus.PAID
-    order.paid_at = timezone.now()
-    order.provider = provider or order.provider
-    order.provider_ref = provider_ref or order.provider_ref
-    order.save(update_fields=['status', 'paid_at', 'provider', 'provider_ref'])
-
-    for item in order.items.select_related('product'):
+def _entitlements_for(order, now):
+    """Unsaved credits and memberships for the order's lines not fulfilled yet."""
+    done = set(UserCredit.objects.filter(source_order_item__order=order).values_list('source_order_item_id', flat=True))
+    done |= set(UserMembership.objects.filter(source_order_item__order=order).values_list('source_order_item_id', flat=True))
+    credits, memberships = [], []
+    for item in order.items.select_related('product').exclude(pk__in=done):
+        if item.meta.get('renewal_of'):
+            # Renovación: el cobro recurrente ya extendió la membresía original
+            continue
         product = item.product
         meta = product.meta or {}
         if product.type == Product.ProductType.PACKAGE:
-            credits = int(meta.get('credits', 0)) * item.quantity
             expires_days = meta.get('expiry_days')
-            expires_at = timezone.now() + timezone.timedelta(days=int(expires_days)) if expires_days else None
-            UserCredit.objects.create(
-                studio=order.studio,
-                user=order.user,
+            credits.append(UserCredit(
+                studio_id=order.studio_id,
+                user_id=order.user_id,
                 source_order_item=item,
-                credits_total=credits,
+                credits_total=int(meta.get('credits', 0)) * item.quantity,
                 credits_used=0,
-                expires_at=expires_at,
-            )
+                expires_at=now + timezone.timedelta(days=int(expires_days)) if expires_days else None,
+            ))
         elif product.type == Product.ProductType.MEMBERSHIP:
             duration_days = meta.get('duration_days')
-            ends_at = timezone.now() + timezone.timedelta(days=int(duration_days)) if duration_days else None
-            UserMembership.objects.create(
-                studio=order.studio,
-                user=order.user,
+            memberships.append(UserMembership(
+                studio_id=order.studio_id,
+                user_id=order.user_id,
                 product=product,
+                source_order_item=item,
                 status='active',
-                starts_at=timezone.now(),
-                ends_at=ends_at,
-            )
+                starts_at=now,
+                ends_at=now + timezone.timedelta(days=int(duration_days)) if duration_days else None,
+            ))
         elif product.type == Product.ProductType.DROP_IN:
             # Cada drop-in otorga 1 crédito por unidad
-            UserCredit.objects.create(
-                studio=order.studio,
-                user=order.user,
+            credits.append(UserCredit(
+                studio_id=order.studio_id,
+                user_id=order.user_id,
                 source_order_item=item,
                 credits_total=item.quantity,
                 credits_used=0,
                 expires_at=None,
-            )
+            ))
+    return credits, memberships
+
+
+@transaction.atomic
+def fulfill_order(order: Order, now=None):
+    """Grant the order's entitlements; lines already fulfilled are skipped.
+
+    Safe to re-run: fulfilled lines are skipped, and the unique
+    ``source_order_item`` constraints turn racing inserts into no-ops.
+    """
+    credits, memberships = _entitlements_for(order, now or timezone.now())
+    UserCredit.objects.bulk_create(credits, ignore_conflicts=True)
+    UserMembership.objects.bulk_create(memberships, ignore_conflicts=True)
+    # bulk_create no dispara señales: el resumen se reconstruye una vez aquí
+    rebuild_summary(order.studio_id, order.user_id)
+    invalidate_member(order.user_id)
+
+
+@transaction.atomic
+def mark_order_paid(order: Order, provider=None, provider_ref=None):
+    """Mark the order paid and fulfill it; only the first of concurrent callers does the work."""
+    now = timezone.now()
+    changes = {
+        'status': Order.OrderStatus.PAID,
+        'paid_at': now,
+        'provider': provider or order.provider,
+        'provider_ref': provider_ref or order.provider_ref,
+    }
+    # Una orden reembolsada no vuelve a pagarse (ni a otorgar créditos) por un aviso tardío
+    won = Order.objects.filter(pk=order.pk).exclude(status__in=[Order.OrderStatus.PAID, Order.OrderStatus.REFUNDED]).update(**changes)
+    if not won:
+        order.refresh_from_db()
+        return order
+    for field, value in changes.items():
+        setattr(order, field, value)
+    fulfill_order(order, now)
+    # Orden de renovación cobrada fuera del ciclo de cobro: extiende la membresía igual que él
+    from .billing import settle_renewal
+    settle_renewal(order, now)
+    record_paid(order)
     log_action(order.studio, order.user, 'order_paid', 'order', order.id)
     return order
 
 
-def get_user_balance(*, studio, user):
+@transaction.atomic
+def refund_order(order: Order, actor=None, reason=None):
+    """Record a refund made at the provider: revoke what the order granted and book it in the rollups."""
     now = timezone.now()
-    credits_qs = UserCredit.objects.filter(studio=studio, user=user).filter(
-        models.Q(expires_at__isnull=True) | models.Q(expires_at__gte=now)
+    if not Order.objects.filter(pk=order.pk, status=Order.OrderStatus.PAID).update(status=Order.OrderStatus.REFUNDED, refunded_at=now):
+        raise ValidationError('Solo se pueden reembolsar órdenes pagadas')
+    order.status, order.refunded_at = Order.OrderStatus.REFUNDED, now
+    UserCredit.objects.filter(source_order_item__order=order, status=UserCredit.Status.ACTIVE).update(
+        status=UserCredit.Status.EXPIRED, version=F('version') + 1
     )
-    credits_qs = credits_qs.annotate(remaining=models.F('credits_total') - models.F('credits_used')).filter(remaining__gt=0)
-    credits_available = credits_qs.aggregate(total=models.Sum('remaining'))['total'] or 0
-    next_expiration = credits_qs.order_by('expires_at').values_list('expires_at', flat=True).first()
+    for membership in UserMembership.objects.filter(source_order_item__order=order).exclude(status='cancelled'):
+        transition(membership, 'cancelled', allowed=UserMembership.TRANSITIONS)
+    rebuild_summary(order.studio_id, order.user_id)
+    invalidate_member(order.user_id)
+    record_refund(order)
+    log_action(order.studio, actor, 'order_refunded', 'order', order.id, {'total_cents': order.total_cents, 'reason': reason})
+    return order
 
-    membership = UserMembership.objects.filter(
-        studio=studio,
-        user=user,
-        status='active',
-    ).filter(models.Q(ends_at__isnull=True) | models.Q(ends_at__gte=now)).order_by('ends_at').first()
 
-    return {
-        'credits_available': int(credits_available),
-        'has_active_membership': bool(membership),
-        'membership_ends_at': membership.ends_at if membership else None,
-        'next_credit_expiration': next_expiration,
-    }
+def get_user_balance(*, studio, user):
+    return balance_from_summary(get_summary(studio.id, user.id))
+
+
+def get_user_balances(*, studio, user_ids):
+    """Balances of many members (staff lists) without per-user queries."""
+    return get_balances(studio.id, user_ids)
+
+
+mp_client = ProviderClient('mercadopago')
+
+
+class PaymentProviderError(Exception):
+    """The payment provider could not be reached or answered with an error."""
+
+
+def fetch_mp_payment(payment_id):
+    access_token = getattr(settings, 'MP_ACCESS_TOKEN', None)
+    if not access_token:
+        raise PaymentProviderError('MP_ACCESS_TOKEN no configurado')
+    headers = {'Authorization': f'Bearer {access_token}'}
+    try:
+        resp = mp_client.get(f'{settings.MP_API_URL}/v1/payments/{payment_id}', headers=headers)
+    except ProviderError as exc:
+        raise PaymentProviderError(f'No se pudo obtener pago {payment_id}: {exc}') from exc
+    if not resp.ok:
+        raise PaymentProviderError(f'No se pudo obtener pago {payment_id}: {resp.status_code} {resp.text[:500]}')
+    return resp.json()
+
+
+def search_mp_payments(order_id):
+    """Payments Mercado Pago has for the order (its ``external_reference``), newest first."""
+    access_token = getattr(settings, 'MP_ACCESS_TOKEN', None)
+    if not access_token:
+        raise PaymentProviderError('MP_ACCESS_TOKEN no configurado')
+    headers = {'Authorization': f'Bearer {access_token}'}
+    params = {'external_reference': str(order_id), 'sort': 'date_created', 'criteria': 'desc'}
+    try:
+        resp = mp_client.get(f'{settings.MP_API_URL}/v1/payments/search', headers=headers, params=params)
+    except ProviderError as exc:
+        raise PaymentProviderError(f'No se pudieron buscar pagos de {order_id}: {exc}') from exc
+    if not resp.ok:
+        raise PaymentProviderError(f'No se pudieron buscar pagos de {order_id}: {resp.status_code} {resp.text[:500]}')
+    return resp.json().get('results') or []
 
 
 def create_mp_preference(*, order: Order, success_url: str, failure_url: str, notification_url: str | None = None):
@@ -145,7 +249,12 @@ def create_mp_preference(*, order: Order, success_url: str, failure_url: str, no
         'auto_return': 'approved',
     }
 
-    resp = requests.post('https://api.mercadopago.com/checkout/preferences', json=preference_payload, headers=headers, timeout=15)
+    try:
+        # La llave de idempotencia permite reintentar sin crear preferencias duplicadas
+        resp = mp_client.post(f'{settings.MP_API_URL}/checkout/preferences', json=preference_payload, headers=headers,
+                              idempotency_key=f'preference-{order.id}', timeout=(3.05, 15))
+    except ProviderError as exc:
+        raise ValidationError(f'Mercado Pago no disponible: {exc}') from exc
     if not resp.ok:
         detail = resp.text
         raise ValidationError(f'Error al crear preferencia de pago: {detail}')
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .entitlements import rebuild_summary
+from .models import UserCredit, UserMembership
+
+
+@receiver([post_save, post_delete], sender=UserCredit)
+@receiver([post_save, post_delete], sender=UserMembership)
+def entitlement_source_changed(sender, instance, **kwargs):
+    rebuild_summary(instance.studio_id, instance.user_id)
@@ -0,0 +1,129 @@
+"""Local stand-in for the Mercado Pago API, for tests and benchmarks.
+
+Serves ``GET /v1/payments/<id>``, ``GET /v1/payments/search``,
+``POST /v1/payments`` (charges, declined for customers in ``declined`` and
+left ``in_process`` for those in ``pending``) and
+``POST /checkout/preferences`` from a background thread on a free localhost
+port. ``delay`` adds latency to every response and ``fail_next`` answers that
+many requests with a 500.
+"""
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Cabeceras y cuerpo salen en escrituras separadas; sin esto Nagle añade ~40 ms por respuesta
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        stub = self.server.stub
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+        stub.requests.append((self.command, self.path))
+        stub.peers.add(self.client_address)
+        if stub.delay:
+            time.sleep(stub.delay)
+        with stub.lock:
+            failing = stub.fail_next > 0
+            stub.fail_next -= failing
+        if failing:
+            return self._reply(500, {'message': 'internal_error'})
+        url = urlsplit(self.path)
+        if self.command == 'GET' and url.path == '/v1/payments/search':
+            reference = parse_qs(url.query).get('external_reference', [''])[0]
+            results = [payment for payment in stub.payments.values() if payment['external_reference'] == reference]
+            return self._reply(200, {'results': results, 'paging': {'total': len(results)}})
+        if self.command == 'GET' and self.path.startswith('/v1/payments/'):
+            payment = stub.payments.get(self.path.rsplit('/', 1)[-1])
+            if payment is None:
+                return self._reply(404, {'message': 'Payment not found'})
+            return self._reply(200, payment)
+        if self.command == 'POST' and self.path == '/v1/payments':
+            return self._reply(201, stub.charge(body, self.headers.get('X-Idempotency-Key')))
+        if self.command == 'POST' and self.path == '/checkout/preferences':
+            preference_id = f'pref-{len(stub.requests)}'
+            return self._reply(201, {'id': preference_id, 'init_point': f'{stub.url}/checkout/{preference_id}'})
+        return self._reply(404, {'message': 'not_found'})
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clientes que abandonan por timeout cortan la conexión; no es un error del stub
+        pass
+
+
+class PaymentsApiStub:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.fail_next = 0
+        self.payments = {}
+        self.declined = set()
+        self.pending = set()
+        self.charges = {}
+        self.requests = []
+        # Direcciones de cliente vistas: una por conexión TCP
+        self.peers = set()
+        self.lock = threading.Lock()
+        self._server = None
+
+    def add_payment(self, payment_id, status='approved', external_reference=None, amount=None):
+        self.payments[str(payment_id)] = {
+            'id': payment_id,
+            'status': status,
+            'external_reference': external_reference,
+            'transaction_amount': amount,
+        }
+
+    def charge(self, body, idempotency_key=None):
+        """Create a payment for ``body``; a repeated idempotency key returns the first one."""
+        with self.lock:
+            if idempotency_key and idempotency_key in self.charges:
+                return self.charges[idempotency_key]
+            payment_id = str(len(self.payments) + 1)
+            while payment_id in self.payments:
+                payment_id = str(int(payment_id) + 1)
+            customer = (body.get('payer') or {}).get('id')
+            status = 'rejected' if customer in self.declined else 'in_process' if customer in self.pending else 'approved'
+            self.add_payment(payment_id, status,
+                             body.get('external_reference'), body.get('transaction_amount'))
+            payment = self.payments[payment_id]
+            if idempotency_key:
+                self.charges[idempotency_key] = payment
+            return payment
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.stub = self
+        self.url = f'http://127.0.0.1:{self._server.server_address[1]}'
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
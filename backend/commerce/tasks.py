@@ -0,0 +1,72 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+
+from .billing import run_billing
+from .expiry import expire_entitlements
+from .ledger import check_credit_ledger
+from .payments import process_notification, requeue_stalled
+from .reconciliation import reconcile_pending_orders, report
+from .revenue import reconcile_revenue
+from .services import PaymentProviderError
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=5)
+def process_payment_notification(self, notification_id):
+    """Fetch a notified payment from Mercado Pago and fulfill its order."""
+    try:
+        return process_notification(notification_id)
+    except PaymentProviderError as exc:
+        logger.warning('payment notification failed', extra={'notification': notification_id, 'error': str(exc)})
+        raise self.retry(exc=exc, countdown=min(30 * 2 ** self.request.retries, 600))
+
+
+@shared_task
+def retry_payment_notifications():
+    return requeue_stalled()
+
+
+@shared_task
+def reconcile_payments():
+    """Hourly check of pending Mercado Pago orders against the provider."""
+    run = reconcile_pending_orders()
+    return report(run) if run else 'already-running'
+
+
+@shared_task
+def bill_memberships():
+    """Hourly charge of memberships whose ``next_billing_at`` is due."""
+    return run_billing() or 'already-running'
+
+
+@shared_task
+def expire_entitlements_sweep():
+    return expire_entitlements()
+
+
+@shared_task
+def reconcile_revenue_rollups(past_days=3):
+    """Nightly rebuild of the last days of revenue rollups; logs what drifted"""
+    import datetime
+    from django.utils import timezone
+
+    today = timezone.localdate()
+    stats = reconcile_revenue(start=today - datetime.timedelta(days=past_days), end=today + datetime.timedelta(days=1))
+    if stats['rows_fixed']:
+        logger.warning('Revenue rollups drifted', extra=stats)
+    return stats
+
+
+@shared_task
+def check_credit_ledger_nightly(repair=None):
+    """Nightly comparison of credits_used with the ledger and the bookings; repairs only if CREDIT_LEDGER_AUTO_REPAIR is on"""
+    if repair is None:
+        repair = settings.CREDIT_LEDGER_AUTO_REPAIR
+    stats = check_credit_ledger(repair=repair)
+    samples = stats.pop('samples')
+    if stats['ledger_drift'] or stats['booking_drift'] or stats['overdrawn']:
+        logger.warning('Credit ledger drifted', extra={**stats, 'samples': samples})
+    return stats
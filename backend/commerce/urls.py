@@ -1,11 +1,12 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import OrderViewSet, UserCreditViewSet, UserMembershipViewSet, mp_webhook
+from .views import OrderViewSet, UserCreditViewSet, UserMembershipViewSet, RevenueAnalyticsViewSet, mp_webhook
 
 router = DefaultRouter()
 router.register('orders', OrderViewSet, basename='order')
 router.register('credits', UserCreditViewSet, basename='credit')
 router.register('memberships', UserMembershipViewSet, basename='membership')
+router.register('analytics/revenue', RevenueAnalyticsViewSet, basename='revenue-analytics')
 
 urlpatterns = router.urls
 
@@ -1,17 +1,49 @@
-import requests
-from rest_framework import viewsets, permissions, status
+from rest_framework import viewsets, permissions, status, filters
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view, permission_classes
 from django.views.decorators.csrf import csrf_exempt
 from .models import Order, UserCredit, UserMembership
-from .serializers import OrderSerializer, CreateOrderSerializer, UserCreditSerializer, UserMembershipSerializer
+from .serializers import OrderSerializer, OrderSummarySerializer, CreateOrderSerializer, UserCreditSerializer, UserMembershipSerializer, BalanceBatchSerializer
 from django.conf import settings
-from .services import create_order, mark_order_paid, get_user_balance, create_mp_preference
+from .services import create_order, mark_order_paid, refund_order, get_user_balance, get_user_balances, create_mp_preference
+from .revenue import GROUPINGS as REVENUE_GROUPINGS, revenue_report, monthly_recurring_revenue, outstanding_credits
+from .payments import record_notification, verify_signature
 from users.permissions import IsAdmin, IsStaff
+from users.models import User
+from django.db.models import Count, Q
+from django.utils import timezone
+from datetime import date, datetime, time, timedelta
+
+MAX_BALANCE_BATCH = 5000
+
+class OrderPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+def _local_day_start(value, param):
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({param: 'Formato esperado YYYY-MM-DD'})
+    return datetime.combine(day, time.min, tzinfo=timezone.get_current_timezone())
+
 
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OrderPagination
+    filter_backends = [filters.OrderingFilter]
+    ordering_fields = ['created_at', 'paid_at', 'total_cents']
+    ordering = ['-created_at']
+
+    def _summary(self):
+        return self.action == 'list' and self.request.query_params.get('view') == 'summary'
+
+    def get_serializer_class(self):
+        return OrderSummarySerializer if self._summary() else OrderSerializer
 
     def get_queryset(self):
         studio = self.request.studio
@@ -20,7 +52,20 @@ class OrderViewSet(viewsets.ModelViewSet):
         qs = Order.objects.filter(studio=studio)
         if not (self.request.user.has_role('staff') or self.request.user.has_role('admin')):
             qs = qs.filter(user=self.request.user)
-        return qs
+        params = self.request.query_params
+        if params.get('status'):
+            statuses = params['status'].split(',')
+            if not set(statuses) <= set(Order.OrderStatus.values):
+                raise ValidationError({'status': f'Valores permitidos: {", ".join(Order.OrderStatus.values)}'})
+            qs = qs.filter(status__in=statuses)
+        # Rango de pago en días locales; "paid_to" es inclusivo (usa el índice studio, status, paid_at)
+        if params.get('paid_from'):
+            qs = qs.filter(paid_at__gte=_local_day_start(params['paid_from'], 'paid_from'))
+        if params.get('paid_to'):
+            qs = qs.filter(paid_at__lt=_local_day_start(params['paid_to'], 'paid_to') + timedelta(days=1))
+        if self._summary():
+            return qs.annotate(item_count=Count('items'))
+        return qs.prefetch_related('items')
 
     def create(self, request, *args, **kwargs):
         serializer = CreateOrderSerializer(data=request.data)
@@ -47,6 +92,14 @@ class OrderViewSet(viewsets.ModelViewSet):
         mark_order_paid(order, provider=provider, provider_ref=provider_ref)
         return Response(OrderSerializer(order).data)
 
+    @action(detail=True, methods=['post'], permission_classes=[IsStaff | IsAdmin])
+    def refund(self, request, pk=None):
+        order = self.get_queryset().filter(pk=pk).first()
+        if not order:
+            return Response({'detail': 'Orden no encontrada'}, status=404)
+        refund_order(order, actor=request.user, reason=request.data.get('reason'))
+        return Response(OrderSerializer(order).data)
+
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def mp_link(self, request, pk=None):
         order = self.get_queryset().filter(pk=pk).first()
@@ -71,38 +124,26 @@ class OrderViewSet(viewsets.ModelViewSet):
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def mp_webhook(request):
+    """Store the notification and acknowledge; a worker fetches the payment later."""
     # Mercado Pago envía data.id en query o en el body
-    payment_id = request.query_params.get('data.id') or request.data.get('data', {}).get('id') or request.data.get('id')
+    data = request.data if isinstance(request.data, dict) else {}
+    payment_id = request.query_params.get('data.id') or (data.get('data') or {}).get('id') or data.get('id')
     if not payment_id:
         return Response({'detail': 'No payment id'}, status=status.HTTP_400_BAD_REQUEST)
+    payment_id = str(payment_id)
+    if len(payment_id) > 100 or not payment_id.isalnum():
+        return Response({'detail': 'payment id inválido'}, status=status.HTTP_400_BAD_REQUEST)
 
-    access_token = getattr(settings, 'MP_ACCESS_TOKEN', None)
-    if not access_token:
-        return Response({'detail': 'MP_ACCESS_TOKEN no configurado'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    topic = request.query_params.get('type') or request.query_params.get('topic') or data.get('type') or ''
+    if topic and topic != 'payment':
+        # merchant_order y otros tópicos no traen un id de pago
+        return Response({'detail': f'Tópico {topic} ignorado'}, status=status.HTTP_200_OK)
 
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-    }
-    resp = requests.get(f'https://api.mercadopago.com/v1/payments/{payment_id}', headers=headers, timeout=10)
-    if not resp.ok:
-        return Response({'detail': f'No se pudo obtener pago {payment_id}', 'mp_response': resp.text}, status=status.HTTP_502_BAD_GATEWAY)
+    if not verify_signature(payment_id, request.headers.get('x-signature'), request.headers.get('x-request-id')):
+        return Response({'detail': 'Firma inválida'}, status=status.HTTP_401_UNAUTHORIZED)
 
-    data = resp.json()
-    external_ref = data.get('external_reference')
-    status_mp = data.get('status')
-    if not external_ref:
-        return Response({'detail': 'Sin external_reference'}, status=status.HTTP_200_OK)
-
-    order = Order.objects.filter(id=external_ref).first()
-    if not order:
-        return Response({'detail': 'Orden no encontrada para external_reference'}, status=status.HTTP_200_OK)
-
-    if status_mp == 'approved':
-        mark_order_paid(order, provider='mercadopago', provider_ref=str(payment_id))
-        return Response({'detail': 'Orden marcada pagada'}, status=status.HTTP_200_OK)
-
-    # Para otros estados, solo acuse recibo
-    return Response({'detail': f'Estado MP {status_mp}'}, status=status.HTTP_200_OK)
+    record_notification(payment_id, topic=topic, payload={'query': request.query_params.dict(), 'body': data})
+    return Response({'detail': 'Notificación recibida'}, status=status.HTTP_200_OK)
 
 class UserCreditViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = UserCreditSerializer
@@ -132,6 +173,37 @@ class UserCreditViewSet(viewsets.ReadOnlyModelViewSet):
         data = get_user_balance(studio=studio, user=user)
         return Response(data)
 
+    @action(detail=False, methods=['get', 'post'], permission_classes=[IsStaff | IsAdmin])
+    def balances(self, request):
+        """Balances for many members: POST {"users": [...]} or GET with the member directory filters"""
+        studio = request.studio
+        if not studio:
+            return Response({'detail': 'Studio requerido'}, status=400)
+        unknown = []
+        if request.method == 'POST':
+            serializer = BalanceBatchSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            requested = {str(user_id) for user_id in serializer.validated_data['users']}
+            # Solo miembros del studio: un id ajeno o inexistente no debe crear resúmenes aquí
+            user_ids = [str(user_id) for user_id in User.objects.filter(studio=studio, id__in=requested).values_list('id', flat=True)]
+            unknown = sorted(requested - set(user_ids))
+        else:
+            members = User.objects.filter(studio=studio)
+            params = request.query_params
+            if params.get('role'):
+                members = members.filter(user_roles__role__code=params['role'])
+            if params.get('is_active') is not None:
+                members = members.filter(is_active=params['is_active'].lower() == 'true')
+            if params.get('search'):
+                term = params['search']
+                members = members.filter(Q(email__icontains=term) | Q(full_name__icontains=term) | Q(phone__icontains=term))
+            user_ids = members.values_list('id', flat=True).distinct()[:MAX_BALANCE_BATCH]
+        balances = get_user_balances(studio=studio, user_ids=user_ids)
+        data = {'results': [{'user': user_id, **balance} for user_id, balance in balances.items()]}
+        if unknown:
+            data['unknown'] = unknown
+        return Response(data)
+
 class UserMembershipViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = UserMembershipSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -144,3 +216,45 @@ class UserMembershipViewSet(viewsets.ReadOnlyModelViewSet):
         if not (self.request.user.has_role('staff') or self.request.user.has_role('admin')):
             qs = qs.filter(user=self.request.user)
         return qs
+
+
+class RevenueAnalyticsViewSet(viewsets.ViewSet):
+    """Sales by day, product or product type, MRR and outstanding credits, read from rollups"""
+    permission_classes = [IsStaff | IsAdmin]
+
+    def list(self, request):
+        studio = request.studio
+        if not studio:
+            return Response({'detail': 'Studio requerido'}, status=400)
+        params = request.query_params
+        today = timezone.localdate()
+        try:
+            end = date.fromisoformat(params['to']) if params.get('to') else today + timedelta(days=1)
+            start = date.fromisoformat(params['from']) if params.get('from') else date(end.year, 1, 1)
+        except ValueError:
+            return Response({'detail': 'from/to deben tener formato YYYY-MM-DD'}, status=400)
+        group_by = params.get('group_by', 'day')
+        if group_by not in REVENUE_GROUPINGS:
+            return Response({'detail': f'group_by debe ser uno de: {", ".join(REVENUE_GROUPINGS)}'}, status=400)
+        if start >= end or (end - start).days > 400:
+            return Response({'detail': 'Rango inválido (máximo 400 días)'}, status=400)
+        results = revenue_report(studio, start, end, group_by)
+        return Response({
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'group_by': group_by,
+            'totals': {name: sum(row[name] for row in results) for name in ('gross_cents', 'refunded_cents', 'net_cents')},
+            'results': results,
+        })
+
+    @action(detail=False, methods=['get'])
+    def mrr(self, request):
+        if not request.studio:
+            return Response({'detail': 'Studio requerido'}, status=400)
+        return Response(monthly_recurring_revenue(request.studio))
+
+    @action(detail=False, methods=['get'])
+    def credits(self, request):
+        if not request.studio:
+            return Response({'detail': 'Studio requerido'}, status=400)
+        return Response(outstanding_credits(request.studio))
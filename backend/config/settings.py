@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 from datetime import timedelta
+from celery.schedules import crontab
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -75,6 +76,24 @@ DATABASES = {
     }
 }
 
+# Shared by the web workers and Celery: versioned invalidations, run locks and stream slots
+# only hold across processes with Redis. Defaults to the broker's Redis; CACHE_URL=locmem://
+# keeps it in process memory (single-process development only).
+CACHE_URL = os.environ.get('CACHE_URL') or os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # Per-member entries (dashboard, calendar feeds) outgrow the 300-entry default
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    } if CACHE_URL.startswith('locmem://') else {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+    }
+}
+
+# Pub/sub for live availability; without it events only reach clients of the same process
+PUBSUB_URL = os.environ.get('PUBSUB_URL') or (None if CACHE_URL.startswith('locmem://') else CACHE_URL)
+
 AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
@@ -145,6 +164,7 @@ FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
 MP_ACCESS_TOKEN = os.environ.get('MP_ACCESS_TOKEN')
 MP_NOTIFICATION_URL = os.environ.get('MP_NOTIFICATION_URL')
 MP_WEBHOOK_SECRET = os.environ.get('MP_WEBHOOK_SECRET')
+MP_API_URL = os.environ.get('MP_API_URL', 'https://api.mercadopago.com')
 
 LOGGING = {
     'version': 1,
@@ -172,6 +192,45 @@ CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_BEAT_SCHEDULE = {}
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-occupancy-rollups': {
+        'task': 'scheduling.tasks.reconcile_occupancy_rollups',
+        'schedule': crontab(hour=3, minute=10),
+    },
+    'prune-sync-changes': {
+        'task': 'scheduling.tasks.prune_sync_changes',
+        'schedule': crontab(hour=3, minute=20),
+    },
+    'retry-payment-notifications': {
+        'task': 'commerce.tasks.retry_payment_notifications',
+        'schedule': crontab(minute='*/5'),
+    },
+    'expire-entitlements': {
+        'task': 'commerce.tasks.expire_entitlements_sweep',
+        'schedule': crontab(minute='*/10'),
+    },
+    'reconcile-revenue-rollups': {
+        'task': 'commerce.tasks.reconcile_revenue_rollups',
+        'schedule': crontab(hour=3, minute=40),
+    },
+    'reconcile-payments': {
+        'task': 'commerce.tasks.reconcile_payments',
+        'schedule': crontab(minute=20),
+    },
+    'check-credit-ledger': {
+        'task': 'commerce.tasks.check_credit_ledger_nightly',
+        'schedule': crontab(hour=3, minute=50),
+    },
+    'bill-memberships': {
+        'task': 'commerce.tasks.bill_memberships',
+        'schedule': crontab(minute=5),
+    },
+    'schedule-reminders': {
+        'task': 'notifications.tasks.schedule_reminders',
+        'schedule': crontab(minute='*/10'),
+    },
+}
+# El chequeo nocturno del libro de créditos solo reporta; con esto también corrige
+CREDIT_LEDGER_AUTO_REPAIR = os.environ.get('CREDIT_LEDGER_AUTO_REPAIR', 'False').lower() == 'true'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -0,0 +1,88 @@
+"""Tiny benchmark registry used by ``manage.py benchmark``.
+
+Apps declare scenarios in a ``benchmarks`` module with the ``@scenario``
+decorator. Each scenario receives the requested size and returns a dict of
+measurements; it runs inside a transaction that is rolled back afterwards.
+"""
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_registry = {}
+
+
+def scenario(name):
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def autodiscover():
+    for app_config in apps.get_app_configs():
+        try:
+            import_module(f'{app_config.name}.benchmarks')
+        except ModuleNotFoundError as exc:
+            if exc.name != f'{app_config.name}.benchmarks':
+                raise
+    return dict(_registry)
+
+
+def measure(func, repeat):
+    """Run ``func`` ``repeat`` times and return timing stats in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'runs': repeat,
+        'mean_ms': round(statistics.mean(samples), 4),
+        'p50_ms': round(samples[len(samples) // 2], 4),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+    }
+
+
+def burst(func, calls, workers):
+    """Run ``func`` ``calls`` times at once over ``workers`` threads, like a burst hitting a worker pool.
+
+    The threads share this thread's database connection, as Django's live
+    server does, so they see the scenario's transaction. ``func`` receives a
+    lock to hold around its database work so queries and savepoints never
+    interleave; everything else (provider calls) overlaps. Reports the wall
+    time until the burst drains, the worker time it kept busy and per-call
+    latency, all measured.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    lock = threading.Lock()
+
+    def share():
+        connections[DEFAULT_DB_ALIAS] = connection
+
+    def call(_):
+        start = time.perf_counter()
+        func(lock)
+        return (time.perf_counter() - start) * 1000
+
+    connection.inc_thread_sharing()
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers, initializer=share) as pool:
+            samples = sorted(pool.map(call, range(calls)))
+        wall = time.perf_counter() - start
+    finally:
+        connection.dec_thread_sharing()
+    return {
+        'calls': calls,
+        'workers': workers,
+        'wall_s': round(wall, 3),
+        'busy_s': round(sum(samples) / 1000, 3),
+        'mean_ms': round(statistics.mean(samples), 4),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+    }
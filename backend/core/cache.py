@@ -0,0 +1,40 @@
+"""Versioned cache keys.
+
+Cached payloads are stored under a key that embeds a version number; writers
+invalidate by bumping the version instead of deleting keys, so readers never
+see a half-invalidated set of entries.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def _version_key(namespace, key):
+    return f'v:{namespace}:{key}'
+
+
+def get_version(namespace, key):
+    version_key = _version_key(namespace, key)
+    version = cache.get(version_key)
+    if version is None:
+        # Arranca en un valor basado en el reloj para no reutilizar versiones si la llave se pierde
+        version = int(time.time() * 1000)
+        if not cache.add(version_key, version, None):
+            version = cache.get(version_key, version)
+    return version
+
+
+def bump_version(namespace, key):
+    version_key = _version_key(namespace, key)
+    try:
+        return cache.incr(version_key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(version_key, version, None)
+        return version
+
+
+def versioned_key(namespace, key, *parts):
+    suffix = ':'.join(str(part) for part in parts)
+    base = f'{namespace}:{key}:{get_version(namespace, key)}'
+    return f'{base}:{suffix}' if suffix else base
@@ -0,0 +1,60 @@
+"""Optimistic concurrency helpers for models with a ``version`` column."""
+from django.db.models import F
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+DEFAULT_RETRIES = 3
+
+
+class ConcurrencyConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'El registro cambió mientras se procesaba. Intenta de nuevo.'
+    default_code = 'conflict'
+
+
+def compare_and_swap(instance, **changes):
+    """UPDATE ... WHERE pk = %s AND version = %s; returns ``True`` if this caller won.
+
+    On success the instance reflects ``changes`` and its new version.
+    """
+    updated = type(instance)._default_manager.filter(pk=instance.pk, version=instance.version).update(
+        version=F('version') + 1, **changes
+    )
+    if not updated:
+        return False
+    for field, value in changes.items():
+        setattr(instance, field, value)
+    instance.version += 1
+    return True
+
+
+def transition(instance, to_status, *, allowed, expected=None, retries=DEFAULT_RETRIES, **changes):
+    """Move ``instance.status`` to ``to_status`` following the ``allowed`` state machine.
+
+    Retries with a fresh copy when another writer got there first. Returns the
+    previous status, or ``None`` when the instance already is in ``to_status``
+    (the transition was done concurrently and must not be applied twice).
+    Raises ``ValueError`` for transitions the state machine does not allow, or
+    when the status is not one of ``expected`` (for callers that only move
+    rows out of specific states).
+    """
+    for _ in range(retries):
+        previous = instance.status
+        if previous == to_status:
+            return None
+        if to_status not in allowed.get(previous, ()) or (expected is not None and previous not in expected):
+            raise ValueError(f'{previous} -> {to_status}')
+        if compare_and_swap(instance, status=to_status, **changes):
+            return previous
+        instance.refresh_from_db()
+    raise ConcurrencyConflict()
+
+
+def bulk_transition(queryset, to_status, *, allowed, **changes):
+    """Set-based ``transition``: move every row of ``queryset`` whose current status may go to ``to_status``.
+
+    The status condition is part of the UPDATE, so a row another writer moved
+    first is skipped instead of overwritten. Returns how many rows changed.
+    """
+    sources = [status for status, targets in allowed.items() if to_status in targets]
+    return queryset.filter(status__in=sources).update(status=to_status, version=F('version') + 1, **changes)
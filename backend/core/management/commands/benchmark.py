@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.benchmarks import autodiscover
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta escenarios de benchmark (los datos generados se revierten al terminar).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help='Escenarios a ejecutar (por defecto, todos)')
+        parser.add_argument('--size', type=int, default=None, help='Tamaño del escenario (filas, usuarios, etc.)')
+        parser.add_argument('--list', action='store_true', help='Lista los escenarios disponibles')
+
+    def handle(self, *args, **options):
+        registry = autodiscover()
+        if options['list']:
+            for name in sorted(registry):
+                self.stdout.write(name)
+            return
+        names = options['scenarios'] or sorted(registry)
+        unknown = [name for name in names if name not in registry]
+        if unknown:
+            raise CommandError(f"Escenarios desconocidos: {', '.join(unknown)}")
+
+        for name in names:
+            result = {}
+            try:
+                with transaction.atomic():
+                    result = registry[name](size=options['size'])
+                    raise _Rollback
+            except _Rollback:
+                pass
+            self.stdout.write(json.dumps({'scenario': name, **result}, default=str))
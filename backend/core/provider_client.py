@@ -0,0 +1,183 @@
+"""Shared HTTP client for third-party providers (payments, messaging).
+
+One ``ProviderClient`` per provider and process keeps a keep-alive
+connection pool, retries idempotent calls with jittered exponential backoff,
+and trips a circuit breaker after consecutive failures so a degraded
+provider fails fast instead of holding workers for the full timeout.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = (3.05, 10)
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+LATENCY_SAMPLES = 1024
+
+
+class ProviderError(Exception):
+    """The provider could not be reached (network error, timeout or open circuit)."""
+
+
+class CircuitOpen(ProviderError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures; lets one trial call through after ``reset_after`` seconds."""
+
+    def __init__(self, threshold=5, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.reset_after else 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning('provider circuit opened', extra={'failures': self.failures})
+                self.opened_at = time.monotonic()
+
+
+class ClientMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'requests': 0, 'attempts': 0, 'retries': 0, 'errors': 0, 'short_circuits': 0}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def incr(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def observe(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self.latencies)
+            data = dict(self.counts)
+        if samples:
+            data.update({
+                'p50_ms': round(samples[len(samples) // 2], 2),
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+                'max_ms': round(samples[-1], 2),
+            })
+        return data
+
+
+class ProviderClient:
+    """Pooled, retrying, circuit-broken ``requests`` wrapper for one provider.
+
+    HTTP error responses are returned to the caller; transport failures and
+    an open circuit raise ``ProviderError``. Only GET/HEAD calls and calls
+    carrying an ``idempotency_key`` are retried.
+    """
+
+    def __init__(self, name, *, timeout=DEFAULT_TIMEOUT, retries=2, backoff=0.2, backoff_cap=2.0,
+                 failure_threshold=5, reset_after=30.0, pool_size=10):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.pool_size = pool_size
+        self.breaker = CircuitBreaker(failure_threshold, reset_after)
+        self.metrics = ClientMetrics()
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Los workers de Celery y gunicorn hacen fork: cada proceso abre su propio pool
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session, self._pid = session, os.getpid()
+        return self._session
+
+    def _sleep_before_retry(self, attempt):
+        # Backoff exponencial con jitter completo para no sincronizar reintentos entre workers
+        time.sleep(random.uniform(0, min(self.backoff_cap, self.backoff * 2 ** attempt)))
+
+    def request(self, method, url, *, idempotency_key=None, headers=None, timeout=None, **kwargs):
+        method = method.upper()
+        headers = dict(headers or {})
+        if idempotency_key:
+            headers['X-Idempotency-Key'] = idempotency_key
+        retryable = method in ('GET', 'HEAD') or bool(idempotency_key)
+        attempts = self.retries + 1 if retryable else 1
+        self.metrics.incr('requests')
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self.metrics.incr('short_circuits')
+                raise CircuitOpen(f'{self.name}: proveedor no disponible (circuito abierto)')
+            if attempt:
+                self.metrics.incr('retries')
+            self.metrics.incr('attempts')
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, headers=headers, timeout=timeout or self.timeout, **kwargs)
+            except requests.RequestException as exc:
+                self.metrics.observe(time.perf_counter() - start)
+                self.metrics.incr('errors')
+                self.breaker.record(False)
+                if attempt + 1 >= attempts:
+                    raise ProviderError(f'{self.name}: {exc}') from exc
+                self._sleep_before_retry(attempt)
+                continue
+            self.metrics.observe(time.perf_counter() - start)
+            failed = response.status_code in RETRY_STATUSES
+            self.breaker.record(not failed)
+            if failed:
+                self.metrics.incr('errors')
+            if not failed or attempt + 1 >= attempts:
+                return response
+            response.close()
+            self._sleep_before_retry(attempt)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        return {'provider': self.name, 'circuit': self.breaker.state, **self.metrics.snapshot()}
@@ -0,0 +1,169 @@
+"""Process-local fan-out of small messages to async subscribers (SSE streams).
+
+Each server process keeps one ``LocalHub`` with a bounded queue per open
+connection. Publishers are plain sync code (usually ``on_commit`` callbacks);
+with ``PUBSUB_URL`` set, messages travel through Redis and a single pattern
+subscription per process feeds the hub, so idle connections cost one queue
+each and no Redis connection.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100
+CHANNEL_PREFIX = 'pubsub:'
+
+
+class Subscription:
+    def __init__(self, hub, channel, maxsize=QUEUE_SIZE):
+        self.hub = hub
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def offer(self, message):
+        # Un cliente lento pierde los mensajes más viejos en vez de bloquear a los demás
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """Next message, or ``None`` when ``timeout`` seconds pass without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class LocalHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._subscribers.get(channel, ()))
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def dispatch(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        by_loop = defaultdict(list)
+        for subscription in subscribers:
+            by_loop[subscription.loop].append(subscription)
+        # Un solo despertar por event loop, no uno por conexión
+        for loop, group in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_offer_all, group, message)
+            except RuntimeError:
+                # El loop de estos suscriptores ya cerró
+                for subscription in group:
+                    self.unsubscribe(subscription)
+
+
+def _offer_all(subscriptions, message):
+    for subscription in subscriptions:
+        subscription.offer(message)
+
+
+class InMemoryBroker:
+    """Single-process broker: publish goes straight to the local hub."""
+
+    def __init__(self):
+        self.hub = LocalHub()
+
+    def publish(self, channel, message):
+        self.hub.dispatch(channel, message)
+
+    def subscribe(self, channel):
+        return self.hub.subscribe(channel)
+
+
+class RedisBroker:
+    """Cross-process broker over Redis pub/sub with one listener per process."""
+
+    def __init__(self, url):
+        import redis
+
+        self.url = url
+        self.hub = LocalHub()
+        self._client = redis.Redis.from_url(url)
+        self._listener = None
+
+    def publish(self, channel, message):
+        try:
+            self._client.publish(f'{CHANNEL_PREFIX}{channel}', json.dumps(message))
+        except Exception:
+            # Sin pub/sub los clientes siguen funcionando con refrescos; no se falla la escritura
+            logger.exception('pubsub publish failed', extra={'channel': channel})
+
+    def subscribe(self, channel):
+        self._ensure_listener()
+        return self.hub.subscribe(channel)
+
+    def _ensure_listener(self):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        import redis.asyncio as aioredis
+
+        while True:
+            client = aioredis.Redis.from_url(self.url)
+            try:
+                pubsub = client.pubsub()
+                await pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+                async for item in pubsub.listen():
+                    if item['type'] != 'pmessage':
+                        continue
+                    channel = item['channel'].decode()[len(CHANNEL_PREFIX):]
+                    self.hub.dispatch(channel, json.loads(item['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('pubsub listener failed, reconnecting')
+                await asyncio.sleep(1)
+            finally:
+                await client.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                url = getattr(settings, 'PUBSUB_URL', None)
+                _broker = RedisBroker(url) if url else InMemoryBroker()
+    return _broker
+
+
+def publish(channel, message):
+    get_broker().publish(channel, message)
@@ -0,0 +1,91 @@
+from django.core.mail import send_mail
+from django.test.utils import override_settings
+
+from core.benchmarks import scenario, measure
+from . import mailer
+from .stubs import SmtpSink
+
+
+@scenario('email_fanout')
+def email_fanout(size=None):
+    """Session update e-mail to many members through a local SMTP sink: send_mail per member vs one connection per chunk."""
+    members = size or 1000
+    recipients = [(f'bench-mail-{i}@example.com', f'Miembro {i}') for i in range(members)]
+    shared = 'Te informamos que hubo cambios en la clase:\n\n🏋️ HIIT\n📅 lunes 01 de enero a las 07:00\n\nRevisa los detalles en tu portal.'
+    sender = mailer.from_email()
+    result = {'messages': members}
+
+    def per_message():
+        for email, greeting in recipients:
+            send_mail('📝 Actualización: HIIT', f'Hola {greeting},\n\n{shared}', sender, [email])
+
+    def batched():
+        for chunk in mailer.chunks(recipients):
+            mailer.send_batch(mailer.personalized('📝 Actualización: HIIT', shared, chunk))
+
+    # 0 ms: sink local; 20 ms: saludo lento, como el establecimiento de conexión con un relay real
+    for delay in (0.0, 0.02):
+        with SmtpSink(greeting_delay=delay) as sink, override_settings(**sink.settings()):
+            batched()  # calienta el nombre DNS local que cachea el backend SMTP
+            for name, run in (('send_mail', per_message), ('batched', batched)):
+                sink.reset()
+                timing = measure(run, 1)
+                timing['msgs_per_s'] = round(members / (timing['mean_ms'] / 1000), 1)
+                timing['connections'] = sink.connections
+                result[f'{name}_{int(delay * 1000)}ms'] = timing
+    return result
+
+
+@scenario('reminder_dispatch')
+def reminder_dispatch(size=None):
+    """10k due reminders through a local SMTP sink: one task per booking vs ledger plus chunk tasks, and a second beat run."""
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from catalog.models import ClassType
+    from scheduling.models import Booking, Session
+    from studios.models import Studio
+    from users.models import User
+    from .models import ReminderDispatch
+    from .reminders import queue_due_reminders, send_reminders
+    from .tasks import send_booking_reminder
+
+    reminders = size or 10000
+    per_session = 100
+    now = timezone.now()
+    studio = Studio.objects.create(name='Bench Reminders', brand_json={})
+    class_type = ClassType.objects.create(studio=studio, name='HIIT', duration_minutes=45)
+    sessions = Session.objects.bulk_create([
+        Session(studio=studio, class_type=class_type, starts_at=now + timedelta(hours=3, minutes=i % 600), capacity=per_session)
+        for i in range(reminders // per_session)
+    ])
+    users = User.objects.bulk_create([
+        User(email=f'bench-reminder-{i}@example.com', password='!', full_name=f'Miembro {i}') for i in range(per_session)
+    ])
+    Booking.objects.bulk_create([
+        Booking(studio=studio, session=session, user=user, booked_at=now - timedelta(days=2)) for session in sessions for user in users
+    ], batch_size=2000)
+    booking_ids = list(Booking.objects.filter(studio=studio).values_list('pk', flat=True))
+    result = {'reminders': len(booking_ids)}
+
+    def per_booking():
+        for booking_id in booking_ids:
+            send_booking_reminder(str(booking_id))
+
+    def ledger():
+        _, ids = queue_due_reminders(now)
+        for chunk in mailer.chunks(ids):
+            send_reminders(chunk)
+
+    with SmtpSink() as sink, override_settings(**sink.settings()):
+        mailer.send_batch(mailer.personalized('warmup', '', [('warmup@example.com', 'warmup')]))
+        for name, run in (('per_booking', per_booking), ('ledger_chunks', ledger), ('ledger_rerun', ledger)):
+            sink.reset()
+            timing = measure(run, 1)
+            timing['msgs_per_s'] = round(len(sink.messages) / (timing['mean_ms'] / 1000), 1)
+            timing['messages'] = len(sink.messages)
+            timing['connections'] = sink.connections
+            result[name] = timing
+    result['sent'] = ReminderDispatch.objects.filter(status=ReminderDispatch.Status.SENT).count()
+    return result
@@ -0,0 +1,70 @@
+"""Batched e-mail sending.
+
+``send_batch`` delivers a list of messages over one SMTP connection
+(``get_connection`` + ``send_messages``) instead of one connection per
+``send_mail`` call. Fan-outs render the shared text once and only prepend the
+greeting per member; large ones are split into chunks that separate workers
+send in parallel.
+"""
+import logging
+import smtplib
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 200
+
+
+def from_email():
+    return getattr(settings, 'DEFAULT_FROM_EMAIL', 'no-reply@33ftstudio.local')
+
+
+def greeting_for(full_name, email):
+    return full_name or email
+
+
+def personalized(subject, shared_body, recipients):
+    """One message per ``(email, greeting)``; ``shared_body`` is rendered once by the caller."""
+    sender = from_email()
+    return [EmailMessage(subject, f"Hola {greeting},\n\n{shared_body}", sender, [email]) for email, greeting in recipients]
+
+
+def chunks(items, size=None):
+    size = size or CHUNK_SIZE
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def send_batch(messages):
+    """Send ``messages`` over one connection; returns ``(sent, failed_messages)``.
+
+    A message the server rejects is logged and skipped; if the server drops
+    the connection the batch reconnects once and carries on.
+    """
+    sent, failed = 0, []
+    if not messages:
+        return sent, failed
+    connection = get_connection()
+    connection.open()
+    try:
+        for message in messages:
+            for attempt in range(2):
+                try:
+                    sent += connection.send_messages([message])
+                    break
+                except smtplib.SMTPServerDisconnected as exc:
+                    if attempt:
+                        logger.error(f"Failed to send email to {', '.join(message.to)}: {exc}")
+                        failed.append(message)
+                    else:
+                        connection.close()
+                        connection.open()
+                except Exception as exc:
+                    logger.error(f"Failed to send email to {', '.join(message.to)}: {exc}")
+                    failed.append(message)
+                    break
+    finally:
+        connection.close()
+    return sent, failed
+
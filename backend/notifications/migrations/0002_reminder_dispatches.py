@@ -0,0 +1,36 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0009_occupancy_rollups'),
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderDispatch',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('kind', models.CharField(choices=[('24h', '24 horas antes'), ('2h', '2 horas antes')], max_length=10)),
+                ('status', models.CharField(choices=[('queued', 'En cola'), ('sent', 'Enviado'), ('failed', 'Fallido'), ('skipped', 'Omitido')], default='queued', max_length=20)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='scheduling.booking')),
+            ],
+            options={
+                'db_table': 'reminder_dispatches',
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['created_at'], name='reminders_queued_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reminderdispatch',
+            constraint=models.UniqueConstraint(fields=('booking', 'kind'), name='reminder_once_per_booking_kind'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_reminder_dispatches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminderdispatch',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='reminderdispatch',
+            name='status',
+            field=models.CharField(choices=[('queued', 'En cola'), ('sending', 'Enviando'), ('sent', 'Enviado'), ('failed', 'Fallido'), ('skipped', 'Omitido')], default='queued', max_length=20),
+        ),
+    ]
@@ -26,3 +26,29 @@ class WebhookEndpoint(BaseModel):
     class Meta:
         db_table = 'webhook_endpoints'
         indexes = [models.Index(fields=['studio', 'event'])]
+
+class ReminderDispatch(BaseModel):
+    """One reminder of one booking; the unique pair keeps overlapping scheduler runs from sending it twice."""
+    class Kind(models.TextChoices):
+        DAY_BEFORE = '24h', '24 horas antes'
+        TWO_HOURS = '2h', '2 horas antes'
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'En cola'
+        SENDING = 'sending', 'Enviando'
+        SENT = 'sent', 'Enviado'
+        FAILED = 'failed', 'Fallido'
+        SKIPPED = 'skipped', 'Omitido'
+
+    booking = models.ForeignKey('scheduling.Booking', on_delete=models.CASCADE, related_name='reminders')
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    # Cuándo una tarea la tomó para enviarla; una en sending más vieja que STALE_AFTER se reencola
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'reminder_dispatches'
+        constraints = [models.UniqueConstraint(fields=['booking', 'kind'], name='reminder_once_per_booking_kind')]
+        # Reencolado de lotes perdidos: solo las pendientes
+        indexes = [models.Index(fields=['created_at'], condition=models.Q(status='queued'), name='reminders_queued_idx')]
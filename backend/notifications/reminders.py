@@ -0,0 +1,138 @@
+"""Booking reminders with a dispatch ledger.
+
+Every reminder sent is a ``ReminderDispatch`` row, unique per booking and
+kind. The scheduler selects the due reminders in one query that skips the
+ones already in the ledger, inserts them (overlapping runs collide on the
+unique pair instead of sending twice) and queues them in chunks; each chunk
+task loads its bookings together and sends them over one SMTP connection.
+Because due means "starts within the lead time and not sent yet", no window
+is missed or repeated whatever the beat frequency. A booking made inside a
+reminder's lead time does not get that reminder (its confirmation just went
+out), and the subject states the actual time left.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from . import mailer
+from .models import ReminderDispatch
+
+logger = logging.getLogger(__name__)
+
+Kind = ReminderDispatch.Kind
+Status = ReminderDispatch.Status
+
+LEAD = {Kind.DAY_BEFORE: timedelta(hours=24), Kind.TWO_HOURS: timedelta(hours=2)}
+# Una fila en cola más vieja que esto perdió su tarea (worker caído) y se reencola
+STALE_AFTER = timedelta(minutes=15)
+
+
+def due_reminders(now):
+    """``(booking_id, kind)`` pairs due at ``now``, in one query.
+
+    A booking starting within two hours is due for the 2h reminder only;
+    otherwise, within 24 hours, for the 24h one. Either only if the booking
+    was made before that reminder's lead time began.
+    """
+    from scheduling.models import Booking
+
+    sent = ReminderDispatch.objects.filter(booking=OuterRef('pk'))
+    soon = now + LEAD[Kind.TWO_HOURS]
+    rows = (
+        Booking.objects.filter(status=Booking.BookingStatus.BOOKED, session__starts_at__gt=now,
+                               session__starts_at__lte=now + LEAD[Kind.DAY_BEFORE])
+        .annotate(sent_day=Exists(sent.filter(kind=Kind.DAY_BEFORE)), sent_soon=Exists(sent.filter(kind=Kind.TWO_HOURS)))
+        .filter(
+            Q(session__starts_at__lte=soon, sent_soon=False, booked_at__lte=F('session__starts_at') - LEAD[Kind.TWO_HOURS])
+            | Q(session__starts_at__gt=soon, sent_day=False, booked_at__lte=F('session__starts_at') - LEAD[Kind.DAY_BEFORE])
+        )
+        .values_list('pk', 'session__starts_at')
+    )
+    return [(booking_id, Kind.TWO_HOURS if starts_at <= soon else Kind.DAY_BEFORE) for booking_id, starts_at in rows]
+
+
+def queue_due_reminders(now=None):
+    """Record the due reminders and return the dispatch ids to send (new ones plus stale queued ones)."""
+    now = now or timezone.now()
+    due = due_reminders(now)
+    ReminderDispatch.objects.bulk_create(
+        [ReminderDispatch(booking_id=booking_id, kind=kind, created_at=now) for booking_id, kind in due],
+        ignore_conflicts=True,
+        batch_size=2000,
+    )
+    # Una tarea que tomó filas y no registró el resultado (worker caído) las devuelve a la cola
+    ReminderDispatch.objects.filter(status=Status.SENDING, claimed_at__lt=now - STALE_AFTER).update(status=Status.QUEUED)
+    # Las filas de esta corrida llevan su `now`; las de otra corrida simultánea las envía esa corrida
+    ids = list(
+        ReminderDispatch.objects.filter(status=Status.QUEUED)
+        .filter(Q(created_at=now) | Q(created_at__lt=now - STALE_AFTER))
+        .order_by('created_at', 'pk')
+        .values_list('pk', flat=True)
+    )
+    return len(due), ids
+
+
+def time_left(starts_at, now):
+    """``'23h'``, ``'1h 30 min'`` or ``'45 min'`` until ``starts_at``, rounded to 5 minutes."""
+    minutes = max(int(round((starts_at - now).total_seconds() / 300)) * 5, 5)
+    hours, minutes = divmod(minutes, 60)
+    if not hours:
+        return f'{minutes} min'
+    return f'{hours}h {minutes} min' if minutes else f'{hours}h'
+
+
+def _message(dispatch, now):
+    booking = dispatch.booking
+    user, session = booking.user, booking.session
+    studio_name = session.studio.name if session.studio else '33 F/T Studio'
+    class_name = session.class_type.name if session.class_type else 'Clase'
+    local_time = session.starts_at.strftime('%A %d de %B a las %H:%M')
+    body = (
+        f"Te recordamos que tienes una clase reservada:\n\n"
+        f"🏋️ {class_name}\n"
+        f"📅 {local_time}\n"
+        f"📍 {studio_name}\n\n"
+        f"¡Te esperamos puntual!\n\n"
+        f"Si no puedes asistir, cancela con anticipación desde tu portal."
+    )
+    subject = f"📅 Recordatorio: {class_name} en {time_left(session.starts_at, now)}"
+    return mailer.personalized(subject, body, [(user.email, mailer.greeting_for(user.full_name, user.email))])[0]
+
+
+def send_reminders(dispatch_ids):
+    """Send one chunk of queued reminders over one connection; returns counters by outcome.
+
+    The rows are claimed (``sending``) in a short transaction and the outcome
+    recorded in another: no lock or transaction stays open during SMTP.
+    """
+    from scheduling.models import Booking
+
+    now = timezone.now()
+    with transaction.atomic():
+        # skip_locked: si una tarea reencolada coincide con la original, cada fila la envía solo una
+        dispatches = list(
+            ReminderDispatch.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(pk__in=dispatch_ids, status=Status.QUEUED)
+            .select_related('booking__user', 'booking__session__class_type', 'booking__session__studio')
+        )
+        live = [d for d in dispatches if d.booking.status == Booking.BookingStatus.BOOKED]
+        skipped = [d.pk for d in dispatches if d.booking.status != Booking.BookingStatus.BOOKED]
+        ReminderDispatch.objects.filter(pk__in=[d.pk for d in live]).update(status=Status.SENDING, claimed_at=now)
+        ReminderDispatch.objects.filter(pk__in=skipped).update(status=Status.SKIPPED)
+
+    messages = [_message(dispatch, now) for dispatch in live]
+    _, failed = mailer.send_batch(messages)
+    failed = {id(message) for message in failed}
+    failed_ids = [d.pk for d, message in zip(live, messages) if id(message) in failed]
+    sent_ids = [d.pk for d, message in zip(live, messages) if id(message) not in failed]
+    # Solo las que siguen tomadas: si se reencolaron por lentas, el resultado lo registra la otra tarea
+    claimed = ReminderDispatch.objects.filter(status=Status.SENDING, claimed_at=now)
+    claimed.filter(pk__in=sent_ids).update(status=Status.SENT, sent_at=timezone.now())
+    claimed.filter(pk__in=failed_ids).update(status=Status.FAILED)
+    stats = {'sent': len(sent_ids), 'failed': len(failed_ids), 'skipped': len(skipped)}
+    if failed_ids:
+        logger.warning('reminders failed', extra=stats)
+    return stats
@@ -0,0 +1,106 @@
+"""Local SMTP sink for tests and benchmarks.
+
+Accepts every message on a free localhost port from a background thread and
+keeps count of connections and delivered messages. ``greeting_delay`` holds
+the 220 greeting that long, like the connection setup of a real relay.
+"""
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def _reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        if sink.greeting_delay:
+            time.sleep(sink.greeting_delay)
+        self._reply('220 sink ESMTP')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self._reply('250-sink')
+                self._reply('250 8BITMIME')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip(' <>'))
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while (chunk := self.rfile.readline()) not in (b'.\r\n', b''):
+                    data.append(chunk)
+                with sink.lock:
+                    sink.messages.append((recipients, b''.join(data)))
+                recipients = []
+                self._reply('250 OK queued')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            elif verb == 'RSET':
+                recipients = []
+                self._reply('250 OK')
+            else:
+                # HELO, MAIL, NOOP
+                self._reply('250 OK')
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class SmtpSink:
+    def __init__(self, greeting_delay=0.0):
+        self.greeting_delay = greeting_delay
+        self.connections = 0
+        self.messages = []
+        self.lock = threading.Lock()
+        self._server = None
+
+    def reset(self):
+        with self.lock:
+            self.connections = 0
+            self.messages = []
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def settings(self):
+        """Overrides that point Django's SMTP backend at the sink."""
+        return {
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': self.host,
+            'EMAIL_PORT': self.port,
+            'EMAIL_USE_TLS': False,
+            'EMAIL_USE_SSL': False,
+            'EMAIL_HOST_USER': '',
+            'EMAIL_HOST_PASSWORD': '',
+        }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
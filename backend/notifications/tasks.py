@@ -1,10 +1,10 @@
 from celery import shared_task
 from django.conf import settings
-from django.core.mail import send_mail
-from django.utils import timezone
-from datetime import timedelta
+from django.core.mail import EmailMessage, send_mail
 import logging
 
+from . import mailer, reminders
+
 logger = logging.getLogger(__name__)
 
 
@@ -54,37 +54,23 @@ def send_booking_reminder(booking_id, hours_before=24):
 
 @shared_task
 def schedule_reminders():
-    """Schedule reminders for upcoming bookings - run periodically via celery beat"""
-    from scheduling.models import Booking
-    from django_celery_beat.models import PeriodicTask  # Optional
-    
-    now = timezone.now()
-    
-    # Bookings in the next 24 hours (send 24h reminder)
-    window_24h_start = now + timedelta(hours=23)
-    window_24h_end = now + timedelta(hours=25)
-    upcoming_24h = Booking.objects.filter(
-        status='booked',
-        session__starts_at__gte=window_24h_start,
-        session__starts_at__lt=window_24h_end
-    ).values_list('id', flat=True)
-    
-    for booking_id in upcoming_24h:
-        send_booking_reminder.delay(str(booking_id), hours_before=24)
-    
-    # Bookings in the next 2 hours (send 2h reminder)
-    window_2h_start = now + timedelta(hours=1, minutes=45)
-    window_2h_end = now + timedelta(hours=2, minutes=15)
-    upcoming_2h = Booking.objects.filter(
-        status='booked',
-        session__starts_at__gte=window_2h_start,
-        session__starts_at__lt=window_2h_end
-    ).values_list('id', flat=True)
-    
-    for booking_id in upcoming_2h:
-        send_booking_reminder.delay(str(booking_id), hours_before=2)
-    
-    return f'Scheduled: {len(upcoming_24h)} x 24h + {len(upcoming_2h)} x 2h reminders'
+    """Queue the due 24h/2h reminders in chunks - run periodically via celery beat.
+
+    The dispatch ledger (``ReminderDispatch``) keeps each reminder to one send
+    however often beat runs this.
+    """
+    due, dispatch_ids = reminders.queue_due_reminders()
+    batches = mailer.chunks([str(pk) for pk in dispatch_ids])
+    for batch in batches:
+        send_reminder_batch.delay(batch)
+    return f'queued: {len(dispatch_ids)} reminders ({due} new) in {len(batches)} chunks'
+
+
+@shared_task
+def send_reminder_batch(dispatch_ids):
+    """Send one chunk of queued reminders over one SMTP connection."""
+    stats = reminders.send_reminders(dispatch_ids)
+    return f"sent: {stats['sent']}, failed: {stats['failed']}, skipped: {stats['skipped']}"
 
 
 @shared_task
@@ -193,8 +179,12 @@ def send_cancellation_email(booking_id, user_email, user_name, class_name, sessi
 
 
 @shared_task
-def send_session_update_notification(session_id, change_type='update'):
-    """Notify all booked users when a session is modified or cancelled"""
+def send_session_update_notification(session_id, change_type='update', user_ids=None):
+    """Notify all booked users when a session is modified or cancelled.
+
+    Sends over one SMTP connection; with more members than one chunk, each
+    chunk of ``user_ids`` is queued as its own task.
+    """
     from scheduling.models import Session, Booking
     
     session = Session.objects.filter(id=session_id).select_related(
@@ -207,11 +197,20 @@ def send_session_update_notification(session_id, change_type='update'):
     bookings = Booking.objects.filter(
         session=session,
         status__in=['booked', 'waitlist']
-    ).select_related('user')
+    )
+    if user_ids is not None:
+        bookings = bookings.filter(user_id__in=user_ids)
+    recipients = list(bookings.order_by('user_id').values_list('user_id', 'user__email', 'user__full_name'))
     
-    if not bookings.exists():
+    if not recipients:
         return 'no-bookings'
     
+    if user_ids is None and len(recipients) > mailer.CHUNK_SIZE:
+        batches = mailer.chunks([str(user_id) for user_id, _, _ in recipients])
+        for batch in batches:
+            send_session_update_notification.delay(str(session_id), change_type, batch)
+        return f'queued: {len(recipients)} users in {len(batches)} chunks'
+    
     studio_name = session.studio.name if session.studio else '33 F/T Studio'
     class_name = session.class_type.name if session.class_type else 'Clase'
     local_time = session.starts_at.strftime('%A %d de %B a las %H:%M')
@@ -234,19 +233,79 @@ def send_session_update_notification(session_id, change_type='update'):
             f"Revisa los detalles en tu portal."
         )
     
-    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'no-reply@33ftstudio.local')
-    sent_count = 0
-    
-    for booking in bookings:
-        user = booking.user
-        greeting = user.full_name or user.email
-        body = f"Hola {greeting},\n\n{message_body}"
-        
-        try:
-            send_mail(subject, body, from_email, [user.email], fail_silently=False)
-            sent_count += 1
-        except Exception as e:
-            logger.error(f"Failed to notify {user.email} about session {session_id}: {e}")
+    messages = mailer.personalized(
+        subject, message_body, [(email, mailer.greeting_for(full_name, email)) for _, email, full_name in recipients]
+    )
+    try:
+        sent_count, _ = mailer.send_batch(messages)
+    except Exception as e:
+        logger.error(f"Failed to notify users about session {session_id}: {e}")
+        return f'error: {str(e)}'
     
     return f'notified: {sent_count} users'
 
+
+@shared_task
+def send_sessions_digest_notification(changes, user_ids=None):
+    """Notify each affected member once about a batch of session changes.
+
+    ``changes`` maps session id -> change type ('update' or 'cancelled').
+    Large digests are split into chunks of ``user_ids`` sent by separate tasks.
+    """
+    from scheduling.models import Session, Booking
+
+    sessions = Session.objects.filter(id__in=list(changes)).select_related('class_type', 'studio').in_bulk()
+    if not sessions:
+        return 'sessions-not-found'
+
+    bookings = Booking.objects.filter(
+        session_id__in=sessions.keys(),
+        status__in=['booked', 'waitlist']
+    )
+    if user_ids is not None:
+        bookings = bookings.filter(user_id__in=user_ids)
+
+    per_user = {}
+    for user_id, email, full_name, session_id in bookings.order_by('user_id').values_list(
+        'user_id', 'user__email', 'user__full_name', 'session_id'
+    ):
+        per_user.setdefault(user_id, (email, full_name, []))[2].append(sessions[session_id])
+
+    if not per_user:
+        return 'no-bookings'
+
+    if user_ids is None and len(per_user) > mailer.CHUNK_SIZE:
+        batches = mailer.chunks([str(user_id) for user_id in per_user])
+        for batch in batches:
+            send_sessions_digest_notification.delay(changes, batch)
+        return f'queued: {len(per_user)} users in {len(batches)} chunks'
+
+    # Cada línea de sesión se arma una vez y se reutiliza en todos los correos que la incluyen
+    lines = {}
+    for session in sessions.values():
+        class_name = session.class_type.name if session.class_type else 'Clase'
+        local_time = session.starts_at.strftime('%A %d de %B a las %H:%M')
+        label = 'Cancelada' if changes.get(str(session.id)) == 'cancelled' else 'Actualizada'
+        lines[session.id] = f"• {label}: 🏋️ {class_name} — 📅 {local_time}"
+
+    sender = mailer.from_email()
+    messages = []
+    for email, full_name, user_sessions in per_user.values():
+        user_sessions.sort(key=lambda s: s.starts_at)
+        studio_name = user_sessions[0].studio.name if user_sessions[0].studio else '33 F/T Studio'
+        subject = f"📝 Cambios en tus clases de {studio_name}"
+        body = (
+            f"Hola {mailer.greeting_for(full_name, email)},\n\n"
+            f"Hubo cambios en clases que tienes reservadas:\n\n"
+            + "\n".join(lines[session.id] for session in user_sessions)
+            + "\n\nRevisa los detalles en tu portal."
+        )
+        messages.append(EmailMessage(subject, body, sender, [email]))
+
+    try:
+        sent_count, _ = mailer.send_batch(messages)
+    except Exception as e:
+        logger.error(f"Failed to notify users about session changes: {e}")
+        return f'error: {str(e)}'
+
+    return f'notified: {sent_count} users'
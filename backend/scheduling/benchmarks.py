@@ -0,0 +1,202 @@
+import asyncio
+import time
+import tracemalloc
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import RequestFactory
+from django.utils import timezone
+
+from catalog.models import ClassType, Product
+from commerce.models import UserCredit
+from core.benchmarks import scenario, measure
+from core.pubsub import InMemoryBroker
+from studios.models import Studio
+from users.models import User
+from .ical import make_feed_token, get_member_feed
+from .models import Session, Booking, BookingPolicy
+from .occupancy import reconcile_occupancy, occupancy_report, GROUPINGS
+from .realtime import availability_events, channel_for
+from .policies import check_booking_window, check_usage_limits, record_usage
+from .views import member_calendar_feed
+from . import services
+
+
+@scenario('booking_policy')
+def booking_policy(size=None):
+    """Cost of evaluating booking policies on the booking path."""
+    runs = size or 5000
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    class_type = ClassType.objects.create(studio=studio, name='BENCH', duration_minutes=50)
+    product = Product.objects.create(studio=studio, type=Product.ProductType.MEMBERSHIP, name='Bench', price_cents=1000)
+    session = Session.objects.create(studio=studio, class_type=class_type, starts_at=timezone.now() + timedelta(days=2), capacity=20)
+    user = User.objects.create_user(email='bench-policy@example.com', password='pass')
+    BookingPolicy.objects.bulk_create([
+        BookingPolicy(studio=studio, kind=BookingPolicy.PolicyKind.MAX_PER_DAY, value=2),
+        BookingPolicy(studio=studio, kind=BookingPolicy.PolicyKind.MAX_PER_WEEK, value=8, product=product),
+        BookingPolicy(studio=studio, kind=BookingPolicy.PolicyKind.OPENS_BEFORE, value=7 * 24 * 60),
+        BookingPolicy(studio=studio, kind=BookingPolicy.PolicyKind.CLOSES_BEFORE, value=30),
+    ])
+    scope = str(product.id)
+    record_usage(studio=studio, user=user, session=session, scope=scope)
+
+    def evaluate():
+        check_booking_window(studio=studio, session=session)
+        check_usage_limits(studio=studio, user=user, session=session, scope=scope)
+
+    return {
+        'window_rules': measure(lambda: check_booking_window(studio=studio, session=session), runs),
+        'full_evaluation': measure(evaluate, runs),
+    }
+
+
+@scenario('booking_lock_hold')
+def booking_lock_hold(size=None):
+    """How long booking and cancelling hold the session row lock.
+
+    Requests for the same session queue on that lock, so the Nth one in a
+    burst waits about N times the hold time. Measured from the moment the
+    lock is taken to the end of the call, one request at a time.
+    """
+    runs = size or 500
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    class_type = ClassType.objects.create(studio=studio, name='BENCH', duration_minutes=50)
+    session = Session.objects.create(studio=studio, class_type=class_type, starts_at=timezone.now() + timedelta(days=2), capacity=runs)
+    users = User.objects.bulk_create([User(email=f'bench-lock-{i}@example.com', password='!', studio=studio) for i in range(runs)])
+    UserCredit.objects.bulk_create([UserCredit(studio=studio, user=user, credits_total=5) for user in users])
+    lock_session = services._lock_session
+    held = {}
+
+    def timed_lock(target):
+        held.setdefault('at', time.perf_counter())
+        lock_session(target)
+
+    def hold_stats(call, items):
+        samples = []
+        for item in items:
+            held.clear()
+            call(item)
+            samples.append((time.perf_counter() - held['at']) * 1000)
+        samples.sort()
+        return {'runs': len(samples), 'mean_ms': round(sum(samples) / len(samples), 4),
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4)}
+
+    with patch.object(services, '_lock_session', timed_lock), \
+            patch('notifications.tasks.send_booking_confirmation.delay'), \
+            patch('notifications.tasks.send_cancellation_email.delay'):
+        bookings = []
+        book = hold_stats(lambda user: bookings.append(services.book_session(studio=studio, session=session, user=user)), users)
+        cancel = hold_stats(lambda booking: services.cancel_booking(booking=booking), list(bookings))
+    return {'book_hold': book, 'cancel_hold': cancel}
+
+
+@scenario('ical_feeds')
+def ical_feeds(size=None):
+    """Render and serve per-member .ics feeds: cold render, cache hit and 304 revalidation."""
+    members = size or 10000
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    class_type = ClassType.objects.create(studio=studio, name='BENCH', duration_minutes=50)
+    now = timezone.now()
+    sessions = Session.objects.bulk_create([
+        Session(studio=studio, class_type=class_type, starts_at=now + timedelta(hours=12 * i), capacity=members)
+        for i in range(1, 11)
+    ])
+    users = User.objects.bulk_create([
+        User(email=f'bench-ical-{i}@example.com', password='!') for i in range(members)
+    ])
+    Booking.objects.bulk_create([
+        Booking(studio=studio, session=sessions[(i + j) % len(sessions)], user=user)
+        for i, user in enumerate(users) for j in range(3)
+    ])
+    cache.clear()
+    tokens = [make_feed_token(studio.id, user.id) for user in users]
+    factory = RequestFactory()
+
+    def render_all():
+        for user in users:
+            get_member_feed(str(studio.id), str(user.id))
+
+    def serve_all(etags=None):
+        for index, token in enumerate(tokens):
+            headers = {'HTTP_IF_NONE_MATCH': etags[index]} if etags else {}
+            member_calendar_feed(factory.get(f'/api/scheduling/calendar/{token}.ics', **headers), token)
+
+    cold = measure(render_all, 1)
+    etags = [get_member_feed(str(studio.id), str(user.id))['etag'] for user in users]
+    return {
+        'feeds': members,
+        'cold_render_all': cold,
+        'cached_serve_all': measure(serve_all, 1),
+        'revalidate_304_all': measure(lambda: serve_all(etags), 1),
+    }
+
+
+@scenario('availability_fanout')
+def availability_fanout(size=None):
+    """Memory per idle SSE stream and time to fan one occupancy delta out to all of them."""
+    connections = size or 5000
+    broker = InMemoryBroker()
+    channel = channel_for('bench')
+
+    async def run():
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        streams = [availability_events('bench') for _ in range(connections)]
+        await asyncio.gather(*(anext(stream) for stream in streams))
+        per_connection = (tracemalloc.get_traced_memory()[0] - before) / connections
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        broker.publish(channel, {'session': 'bench', 'spots_left': 1})
+        await asyncio.gather(*(anext(stream) for stream in streams))
+        fanout_ms = (time.perf_counter() - start) * 1000
+        await asyncio.gather(*(stream.aclose() for stream in streams))
+        return {
+            'connections': connections,
+            'bytes_per_idle_connection': round(per_connection),
+            'fanout_ms': round(fanout_ms, 2),
+        }
+
+    with patch('scheduling.realtime.get_broker', return_value=broker):
+        return asyncio.run(run())
+
+
+@scenario('occupancy_analytics')
+def occupancy_analytics(size=None):
+    """A year of sessions: rollup build cost and analytics reads vs scanning bookings."""
+    per_session = size or 12
+    studio = Studio.objects.create(name='Bench Studio', brand_json={})
+    class_types = [ClassType.objects.create(studio=studio, name=f'BENCH {i}', duration_minutes=50) for i in range(5)]
+    members = User.objects.bulk_create([User(email=f'bench-occ-{i}@example.com', password='!') for i in range(per_session)])
+    start = timezone.localdate() - timedelta(days=365)
+    first = timezone.make_aware(timezone.datetime.combine(start, timezone.datetime.min.time()))
+    sessions = Session.objects.bulk_create([
+        Session(studio=studio, class_type=class_types[slot % 5], starts_at=first + timedelta(days=day, hours=6 + slot), capacity=20)
+        for day in range(365) for slot in range(20)
+    ])
+    statuses = [Booking.BookingStatus.ATTENDED] * 8 + [Booking.BookingStatus.NO_SHOW, Booking.BookingStatus.CANCELLED]
+    Booking.objects.bulk_create([
+        Booking(studio=studio, session=session, user=member, status=statuses[index % len(statuses)])
+        for session in sessions for index, member in enumerate(members)
+    ], batch_size=5000)
+    end = timezone.localdate() + timedelta(days=1)
+    build = measure(lambda: reconcile_occupancy(start=start, end=end, studio_id=studio.id), 1)
+
+    def scan_bookings():
+        from django.db.models import Count, Q
+        list(
+            Booking.objects.filter(studio=studio, session__starts_at__gte=first)
+            .values('session__class_type_id')
+            .annotate(attended=Count('id', filter=Q(status=Booking.BookingStatus.ATTENDED)))
+        )
+
+    result = {
+        'sessions': len(sessions),
+        'bookings': len(sessions) * per_session,
+        'rollup_build_year': build,
+        'scan_bookings_by_class_type': measure(scan_bookings, 5),
+    }
+    for group_by in GROUPINGS:
+        result[f'rollup_by_{group_by}'] = measure(lambda: occupancy_report(studio, start, end, group_by), 20)
+    return result
@@ -0,0 +1,175 @@
+"""iCalendar feeds: a tokenized per-member feed and a public studio timetable.
+
+Rendered feeds are cached under the member and timetable cache versions, so a
+calendar app polling every few minutes is answered from the cache (or with a
+304) until the member's own bookings or the studio's sessions change; other
+members booking does not touch them.
+"""
+import datetime
+import hashlib
+
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+
+from core.cache import get_version, versioned_key
+from users.dashboard import CACHE_NAMESPACE as MEMBER_NAMESPACE
+from .models import Session, Booking
+from .schedule import TIMETABLE_NAMESPACE
+
+CACHE_SECONDS = 60 * 60
+MEMBER_PAST_DAYS = 30
+MEMBER_FUTURE_DAYS = 90
+STUDIO_PAST_DAYS = 7
+STUDIO_FUTURE_DAYS = 28
+TOKEN_SALT = 'scheduling.ical'
+PRODID = '-//33 Fit Studio//Agenda//ES'
+
+
+def make_feed_token(studio_id, user_id):
+    return signing.Signer(salt=TOKEN_SALT).sign(f'{studio_id}.{user_id}')
+
+
+def read_feed_token(token):
+    """Return ``(studio_id, user_id)`` or ``None`` if the signature does not match."""
+    try:
+        studio_id, user_id = signing.Signer(salt=TOKEN_SALT).unsign(token).split('.', 1)
+    except (signing.BadSignature, ValueError):
+        return None
+    return studio_id, user_id
+
+
+def _escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _fold(line):
+    # RFC 5545: líneas de máximo 75 octetos, las continuaciones empiezan con un espacio
+    raw = line.encode('utf-8')
+    if len(raw) <= 75:
+        return line
+    parts, chunk = [], b''
+    for char in line:
+        encoded = char.encode('utf-8')
+        if len(chunk) + len(encoded) > (75 if not parts else 74):
+            parts.append(chunk.decode('utf-8'))
+            chunk = b''
+        chunk += encoded
+    parts.append(chunk.decode('utf-8'))
+    return '\r\n '.join(parts)
+
+
+def _stamp(value):
+    return value.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _event(uid, session, stamp, cancelled=False):
+    ends_at = session.starts_at + datetime.timedelta(minutes=session.class_type.duration_minutes)
+    description = f'Instructor: {session.instructor.full_name}' if session.instructor else ''
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}@33fitstudio',
+        f'DTSTAMP:{_stamp(stamp)}',
+        f'DTSTART:{_stamp(session.starts_at)}',
+        f'DTEND:{_stamp(ends_at)}',
+        f'SUMMARY:{_escape(session.class_type.name)}',
+        f'STATUS:{"CANCELLED" if cancelled else "CONFIRMED"}',
+    ]
+    if description:
+        lines.append(f'DESCRIPTION:{_escape(description)}')
+    if session.location:
+        lines.append(f'LOCATION:{_escape(session.location.name)}')
+    lines.append('END:VEVENT')
+    return lines
+
+
+def _calendar(name, events):
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN', f'X-WR-CALNAME:{_escape(name)}']
+    for event in events:
+        lines.extend(event)
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
+
+
+def render_member_feed(studio, user):
+    now = timezone.now()
+    bookings = (
+        Booking.objects.filter(
+            studio=studio,
+            user=user,
+            status__in=[Booking.BookingStatus.BOOKED, Booking.BookingStatus.ATTENDED],
+            session__starts_at__gte=now - datetime.timedelta(days=MEMBER_PAST_DAYS),
+            session__starts_at__lt=now + datetime.timedelta(days=MEMBER_FUTURE_DAYS),
+        )
+        .select_related('session__class_type', 'session__instructor', 'session__location')
+        .order_by('session__starts_at')
+    )
+    events = [
+        _event(booking.id, booking.session, booking.booked_at, booking.session.status == Session.SessionStatus.CANCELLED)
+        for booking in bookings
+    ]
+    return _calendar(f'{studio.name} - Mis clases', events)
+
+
+def render_studio_feed(studio):
+    now = timezone.now()
+    sessions = (
+        Session.objects.filter(
+            studio=studio,
+            starts_at__gte=now - datetime.timedelta(days=STUDIO_PAST_DAYS),
+            starts_at__lt=now + datetime.timedelta(days=STUDIO_FUTURE_DAYS),
+        )
+        .select_related('class_type', 'instructor', 'location')
+        .order_by('starts_at')
+    )
+    events = [
+        _event(session.id, session, session.created_at, session.status == Session.SessionStatus.CANCELLED)
+        for session in sessions
+    ]
+    return _calendar(f'{studio.name} - Horario', events)
+
+
+def _cached_feed(key, render):
+    """Return ``{'body', 'etag', 'last_modified'}`` from the cache, rendering on a miss.
+
+    ``render`` returns the body or ``None`` when the feed does not exist.
+    """
+    feed = cache.get(key)
+    if feed is None:
+        body = render()
+        if body is None:
+            return None
+        feed = {
+            'body': body,
+            'etag': '"%s"' % hashlib.md5(body.encode('utf-8')).hexdigest(),
+            'last_modified': int(timezone.now().timestamp()),
+        }
+        cache.set(key, feed, CACHE_SECONDS)
+    return feed
+
+
+def get_member_feed(studio_id, user_id):
+    # Depende de las reservas del miembro y de los cambios de horario del studio, no de su ocupación
+    key = versioned_key(MEMBER_NAMESPACE, user_id, 'ical', studio_id, get_version(TIMETABLE_NAMESPACE, studio_id))
+
+    def render():
+        from studios.models import Studio
+        from users.models import User
+
+        studio = Studio.objects.filter(id=studio_id).first()
+        user = User.objects.filter(id=user_id, is_active=True).first()
+        return render_member_feed(studio, user) if studio and user else None
+
+    return _cached_feed(key, render)
+
+
+def get_studio_feed(studio_id):
+    key = versioned_key(TIMETABLE_NAMESPACE, studio_id, 'ical')
+
+    def render():
+        from studios.models import Studio
+
+        studio = Studio.objects.filter(id=studio_id).first()
+        return render_studio_feed(studio) if studio else None
+
+    return _cached_feed(key, render)
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studios', '0001_initial'),
+        ('catalog', '0003_dedupe_classtypes_ci_unique'),
+        ('scheduling', '0004_dedupe_and_unique_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionSpotMap',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='spot_map', serialize=False, to='scheduling.session')),
+                ('bitmap', models.BinaryField(default=bytes)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'session_spot_maps',
+            },
+        ),
+        migrations.CreateModel(
+            name='SpotLayout',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('name', models.CharField(max_length=100)),
+                ('spots', models.PositiveSmallIntegerField()),
+                ('labels', models.JSONField(blank=True, default=list)),
+                ('preferred_order', models.JSONField(blank=True, default=list)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'db_table': 'spot_layouts',
+            },
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='spot',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(condition=models.Q(('spot__isnull', False)), fields=('session', 'spot'), name='booking_unique_spot_per_session'),
+        ),
+        migrations.AddField(
+            model_name='spotlayout',
+            name='class_type',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='spot_layouts', to='catalog.classtype'),
+        ),
+        migrations.AddField(
+            model_name='spotlayout',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='spot_layouts', to='studios.location'),
+        ),
+        migrations.AddField(
+            model_name='spotlayout',
+            name='studio',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spot_layouts', to='studios.studio'),
+        ),
+        migrations.AddField(
+            model_name='sessionspotmap',
+            name='layout',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_maps', to='scheduling.spotlayout'),
+        ),
+        migrations.AddIndex(
+            model_name='spotlayout',
+            index=models.Index(fields=['studio', 'is_active'], name='spot_layout_studio__9839b8_idx'),
+        ),
+    ]
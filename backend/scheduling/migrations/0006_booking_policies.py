@@ -0,0 +1,58 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studios', '0001_initial'),
+        ('catalog', '0003_dedupe_classtypes_ci_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('scheduling', '0005_spot_layouts_and_maps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingUsageCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Día'), ('week', 'Semana')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('scope', models.CharField(blank=True, default='', max_length=40)),
+                ('count', models.IntegerField(default=0)),
+                ('studio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_usage_counters', to='studios.studio')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_usage_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'booking_usage_counters',
+            },
+        ),
+        migrations.CreateModel(
+            name='BookingPolicy',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('kind', models.CharField(choices=[('max_per_day', 'Máximo de reservas por día'), ('max_per_week', 'Máximo de reservas por semana'), ('opens_minutes_before', 'Reservas abren X minutos antes'), ('closes_minutes_before', 'Reservas cierran X minutos antes')], max_length=30)),
+                ('value', models.PositiveIntegerField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='booking_policies', to='catalog.product')),
+                ('studio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_policies', to='studios.studio')),
+            ],
+            options={
+                'db_table': 'booking_policies',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bookingusagecounter',
+            constraint=models.UniqueConstraint(fields=('user', 'studio', 'period', 'period_start', 'scope'), name='booking_usage_counter_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingpolicy',
+            index=models.Index(fields=['studio', 'is_active'], name='booking_pol_studio__c0d045_idx'),
+        ),
+    ]
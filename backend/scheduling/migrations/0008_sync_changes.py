@@ -0,0 +1,31 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studios', '0001_initial'),
+        ('scheduling', '0007_optimistic_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('entity', models.CharField(choices=[('session', 'Sesión'), ('booking', 'Reserva'), ('waitlist', 'Lista de espera'), ('checkin', 'Check-in')], max_length=20)),
+                ('entity_id', models.UUIDField()),
+                ('op', models.CharField(choices=[('upsert', 'Alta/cambio'), ('delete', 'Baja')], default='upsert', max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('studio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_changes', to='studios.studio')),
+            ],
+            options={
+                'db_table': 'sync_changes',
+                'indexes': [models.Index(fields=['studio', 'seq'], name='sync_change_studio__36d17b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.8 on 2026-10-19 12:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_dedupe_classtypes_ci_unique'),
+        ('studios', '0001_initial'),
+        ('scheduling', '0008_sync_changes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancyBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('weekday', models.PositiveSmallIntegerField()),
+                ('sessions', models.IntegerField(default=0)),
+                ('capacity', models.IntegerField(default=0)),
+                ('booked', models.IntegerField(default=0)),
+                ('attended', models.IntegerField(default=0)),
+                ('no_show', models.IntegerField(default=0)),
+                ('waitlisted', models.IntegerField(default=0)),
+                ('studio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy_buckets', to='studios.studio')),
+            ],
+            options={
+                'db_table': 'occupancy_buckets',
+            },
+        ),
+        migrations.CreateModel(
+            name='SessionOccupancy',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='occupancy', serialize=False, to='scheduling.session')),
+                ('day', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('session_cancelled', models.BooleanField(default=False)),
+                ('capacity', models.PositiveIntegerField(default=0)),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('attended', models.PositiveIntegerField(default=0)),
+                ('no_show', models.PositiveIntegerField(default=0)),
+                ('waitlisted', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('class_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_occupancy', to='catalog.classtype')),
+                ('instructor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='session_occupancy', to='catalog.instructor')),
+                ('studio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_occupancy', to='studios.studio')),
+            ],
+            options={
+                'db_table': 'session_occupancy',
+                'indexes': [models.Index(fields=['studio', 'day'], name='session_occ_studio__42e9fc_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='occupancybucket',
+            constraint=models.UniqueConstraint(fields=('studio', 'day', 'hour'), name='occupancy_bucket_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-19 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0009_occupancy_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncchange',
+            name='owner_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
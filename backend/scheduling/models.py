@@ -48,6 +48,17 @@ class Booking(BaseModel):
     booked_at = models.DateTimeField(default=timezone.now)
     cancelled_at = models.DateTimeField(null=True, blank=True)
     source = models.CharField(max_length=30, null=True, blank=True)
+    spot = models.PositiveSmallIntegerField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=0)
+
+    # Transiciones permitidas; todas se aplican con compare-and-swap sobre `version`
+    TRANSITIONS = {
+        BookingStatus.BOOKED: {BookingStatus.CANCELLED, BookingStatus.ATTENDED, BookingStatus.NO_SHOW},
+        BookingStatus.WAITLIST: {BookingStatus.BOOKED, BookingStatus.CANCELLED},
+        BookingStatus.CANCELLED: {BookingStatus.BOOKED, BookingStatus.WAITLIST},
+        BookingStatus.ATTENDED: {BookingStatus.BOOKED, BookingStatus.NO_SHOW},
+        BookingStatus.NO_SHOW: {BookingStatus.BOOKED, BookingStatus.ATTENDED},
+    }
 
     class Meta:
         db_table = 'bookings'
@@ -57,6 +68,9 @@ class Booking(BaseModel):
             models.Index(fields=['user']),
             models.Index(fields=['status']),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'spot'], condition=models.Q(spot__isnull=False), name='booking_unique_spot_per_session'),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.session_id}"
@@ -83,3 +97,137 @@ class Checkin(BaseModel):
     class Meta:
         db_table = 'checkins'
         indexes = [models.Index(fields=['studio'])]
+
+class SpotLayout(BaseModel):
+    studio = models.ForeignKey('studios.Studio', on_delete=models.CASCADE, related_name='spot_layouts')
+    location = models.ForeignKey('studios.Location', on_delete=models.CASCADE, null=True, blank=True, related_name='spot_layouts')
+    class_type = models.ForeignKey('catalog.ClassType', on_delete=models.CASCADE, null=True, blank=True, related_name='spot_layouts')
+    name = models.CharField(max_length=100)
+    spots = models.PositiveSmallIntegerField()
+    # Etiquetas opcionales por lugar (p.ej. "T1"), y orden de preferencia para "mejor disponible"
+    labels = models.JSONField(default=list, blank=True)
+    preferred_order = models.JSONField(default=list, blank=True)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        db_table = 'spot_layouts'
+        indexes = [models.Index(fields=['studio', 'is_active'])]
+
+    def __str__(self):
+        return self.name
+
+class SessionSpotMap(models.Model):
+    """Occupied spots of a session packed as a bitmap (bit i = spot i taken)."""
+    session = models.OneToOneField(Session, on_delete=models.CASCADE, primary_key=True, related_name='spot_map')
+    layout = models.ForeignKey(SpotLayout, on_delete=models.CASCADE, related_name='session_maps')
+    bitmap = models.BinaryField(default=bytes)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'session_spot_maps'
+
+class BookingPolicy(BaseModel):
+    class PolicyKind(models.TextChoices):
+        MAX_PER_DAY = 'max_per_day', 'Máximo de reservas por día'
+        MAX_PER_WEEK = 'max_per_week', 'Máximo de reservas por semana'
+        OPENS_BEFORE = 'opens_minutes_before', 'Reservas abren X minutos antes'
+        CLOSES_BEFORE = 'closes_minutes_before', 'Reservas cierran X minutos antes'
+
+    studio = models.ForeignKey('studios.Studio', on_delete=models.CASCADE, related_name='booking_policies')
+    # Si se indica producto, la regla solo aplica a reservas hechas con esa membresía/paquete
+    product = models.ForeignKey('catalog.Product', on_delete=models.CASCADE, null=True, blank=True, related_name='booking_policies')
+    kind = models.CharField(max_length=30, choices=PolicyKind.choices)
+    value = models.PositiveIntegerField()
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        db_table = 'booking_policies'
+        indexes = [models.Index(fields=['studio', 'is_active'])]
+
+    def __str__(self):
+        return f"{self.kind}={self.value}"
+
+class BookingUsageCounter(models.Model):
+    """Bookings per user and calendar window, kept up to date by the booking services."""
+    class Period(models.TextChoices):
+        DAY = 'day', 'Día'
+        WEEK = 'week', 'Semana'
+
+    studio = models.ForeignKey('studios.Studio', on_delete=models.CASCADE, related_name='booking_usage_counters')
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='booking_usage_counters')
+    period = models.CharField(max_length=10, choices=Period.choices)
+    period_start = models.DateField()
+    # '' cuenta todas las reservas; un id de producto cuenta solo las hechas con ese producto
+    scope = models.CharField(max_length=40, blank=True, default='')
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'booking_usage_counters'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'studio', 'period', 'period_start', 'scope'], name='booking_usage_counter_unique'),
+        ]
+
+class SyncChange(models.Model):
+    """Append-only change feed for kiosk/mobile sync; ``seq`` is the cursor."""
+    class Entity(models.TextChoices):
+        SESSION = 'session', 'Sesión'
+        BOOKING = 'booking', 'Reserva'
+        WAITLIST = 'waitlist', 'Lista de espera'
+        CHECKIN = 'checkin', 'Check-in'
+
+    class Op(models.TextChoices):
+        UPSERT = 'upsert', 'Alta/cambio'
+        DELETE = 'delete', 'Baja'
+
+    seq = models.BigAutoField(primary_key=True)
+    studio = models.ForeignKey('studios.Studio', on_delete=models.CASCADE, related_name='sync_changes')
+    entity = models.CharField(max_length=20, choices=Entity.choices)
+    entity_id = models.UUIDField()
+    op = models.CharField(max_length=10, choices=Op.choices, default=Op.UPSERT)
+    # Miembro dueño de la fila (reservas, lista de espera): un miembro solo recibe sus propias bajas
+    owner_id = models.UUIDField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'sync_changes'
+        indexes = [models.Index(fields=['studio', 'seq'])]
+
+class SessionOccupancy(models.Model):
+    """Per-session occupancy rollup; analytics read this instead of scanning bookings."""
+    session = models.OneToOneField(Session, on_delete=models.CASCADE, primary_key=True, related_name='occupancy')
+    studio = models.ForeignKey('studios.Studio', on_delete=models.CASCADE, related_name='session_occupancy')
+    class_type = models.ForeignKey('catalog.ClassType', on_delete=models.CASCADE, related_name='session_occupancy')
+    instructor = models.ForeignKey('catalog.Instructor', on_delete=models.SET_NULL, null=True, blank=True, related_name='session_occupancy')
+    # Día y hora locales del inicio de la sesión
+    day = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    session_cancelled = models.BooleanField(default=False)
+    capacity = models.PositiveIntegerField(default=0)
+    booked = models.PositiveIntegerField(default=0)
+    attended = models.PositiveIntegerField(default=0)
+    no_show = models.PositiveIntegerField(default=0)
+    waitlisted = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'session_occupancy'
+        indexes = [models.Index(fields=['studio', 'day'])]
+
+class OccupancyBucket(models.Model):
+    """Occupancy of a studio summed per local day and hour (non-cancelled sessions only)."""
+    studio = models.ForeignKey('studios.Studio', on_delete=models.CASCADE, related_name='occupancy_buckets')
+    day = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    weekday = models.PositiveSmallIntegerField()  # 0 = lunes
+    sessions = models.IntegerField(default=0)
+    capacity = models.IntegerField(default=0)
+    booked = models.IntegerField(default=0)
+    attended = models.IntegerField(default=0)
+    no_show = models.IntegerField(default=0)
+    waitlisted = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'occupancy_buckets'
+        constraints = [
+            models.UniqueConstraint(fields=['studio', 'day', 'hour'], name='occupancy_bucket_unique'),
+        ]
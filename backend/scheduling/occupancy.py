@@ -0,0 +1,246 @@
+"""Occupancy rollups for staff analytics.
+
+``SessionOccupancy`` keeps the booking counts of each session and
+``OccupancyBucket`` sums them per studio, local day and hour. Booking and
+session changes refresh the affected sessions after commit, applying only the
+difference to the buckets; ``reconcile_occupancy`` rebuilds a date range from
+the source tables every night and reports what it had to fix.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import Session, Booking, SessionOccupancy, OccupancyBucket
+
+BUCKET_FIELDS = ('sessions', 'capacity', 'booked', 'attended', 'no_show', 'waitlisted')
+COUNT_FIELDS = ('session_cancelled', 'capacity', 'booked', 'attended', 'no_show', 'waitlisted', 'class_type_id', 'instructor_id', 'day', 'hour')
+RECONCILE_CHUNK_DAYS = 7
+
+
+def track_occupancy(*session_ids):
+    """Refresh the rollups of these sessions once the current transaction commits."""
+    ids = {session_id for session_id in session_ids if session_id}
+    if ids:
+        # robust: la reserva ya se confirmó; si el refresco falla se registra y la reconciliación nocturna lo corrige
+        transaction.on_commit(lambda: refresh_occupancy(ids), robust=True)
+
+
+def _compute(session_ids):
+    """Fresh (unsaved) ``SessionOccupancy`` rows for the sessions, in one query."""
+    status = Booking.BookingStatus
+    rows = (
+        Session.objects.filter(pk__in=session_ids)
+        .annotate(
+            n_booked=Count('bookings', filter=Q(bookings__status=status.BOOKED)),
+            n_attended=Count('bookings', filter=Q(bookings__status=status.ATTENDED)),
+            n_no_show=Count('bookings', filter=Q(bookings__status=status.NO_SHOW)),
+            n_waitlisted=Count('bookings', filter=Q(bookings__status=status.WAITLIST)),
+        )
+        .values('id', 'studio_id', 'class_type_id', 'instructor_id', 'starts_at', 'status', 'capacity',
+                'n_booked', 'n_attended', 'n_no_show', 'n_waitlisted')
+    )
+    fresh = {}
+    for row in rows:
+        local = timezone.localtime(row['starts_at'])
+        fresh[row['id']] = SessionOccupancy(
+            session_id=row['id'],
+            studio_id=row['studio_id'],
+            class_type_id=row['class_type_id'],
+            instructor_id=row['instructor_id'],
+            day=local.date(),
+            hour=local.hour,
+            session_cancelled=row['status'] == Session.SessionStatus.CANCELLED,
+            capacity=row['capacity'],
+            booked=row['n_booked'],
+            attended=row['n_attended'],
+            no_show=row['n_no_show'],
+            waitlisted=row['n_waitlisted'],
+        )
+    return fresh
+
+
+def _contribution(row):
+    if row is None or row.session_cancelled:
+        return {}
+    return {
+        'sessions': 1,
+        'capacity': row.capacity,
+        'booked': row.booked,
+        'attended': row.attended,
+        'no_show': row.no_show,
+        'waitlisted': row.waitlisted,
+    }
+
+
+def _differs(old, new):
+    return any(getattr(old, name) != getattr(new, name) for name in COUNT_FIELDS)
+
+
+def _apply_bucket_deltas(deltas):
+    for (studio_id, day, hour), delta in deltas.items():
+        changes = {name: value for name, value in delta.items() if value}
+        if not changes:
+            continue
+        increments = {name: F(name) + value for name, value in changes.items()}
+        bucket = OccupancyBucket.objects.filter(studio_id=studio_id, day=day, hour=hour)
+        if bucket.update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                OccupancyBucket.objects.create(studio_id=studio_id, day=day, hour=hour, weekday=day.weekday(), **changes)
+        except IntegrityError:
+            bucket.update(**increments)
+
+
+def _add_deltas(deltas, row, sign):
+    for name, value in _contribution(row).items():
+        deltas[(row.studio_id, row.day, row.hour)][name] += sign * value
+
+
+@transaction.atomic
+def refresh_occupancy(session_ids):
+    # El candado de la sesión serializa los refrescos concurrentes y evita aplicar dos veces un delta
+    ids = list(Session.objects.select_for_update().filter(pk__in=session_ids).order_by('pk').values_list('pk', flat=True))
+    if not ids:
+        return 0
+    fresh = _compute(ids)
+    existing = SessionOccupancy.objects.in_bulk(ids)
+    deltas = defaultdict(Counter)
+    to_create, to_update = [], []
+    for session_id, new in fresh.items():
+        old = existing.get(session_id)
+        if old is not None and not _differs(old, new):
+            continue
+        if old is None:
+            to_create.append(new)
+        else:
+            _add_deltas(deltas, old, -1)
+            to_update.append(new)
+        _add_deltas(deltas, new, 1)
+    SessionOccupancy.objects.bulk_create(to_create)
+    SessionOccupancy.objects.bulk_update(to_update, COUNT_FIELDS)
+    _apply_bucket_deltas(deltas)
+    return len(to_create) + len(to_update)
+
+
+def remove_occupancy(row):
+    """Subtract a deleted session's rollup from its bucket."""
+    deltas = defaultdict(Counter)
+    _add_deltas(deltas, row, -1)
+    _apply_bucket_deltas(deltas)
+
+
+def _local_bounds(start_day, end_day):
+    tz = timezone.get_current_timezone()
+    return (
+        datetime.datetime.combine(start_day, datetime.time.min, tzinfo=tz),
+        datetime.datetime.combine(end_day, datetime.time.min, tzinfo=tz),
+    )
+
+
+def _bucket_values(bucket):
+    return tuple(getattr(bucket, name) for name in BUCKET_FIELDS)
+
+
+@transaction.atomic
+def _reconcile_chunk(start_day, end_day, studio_id=None):
+    stats = Counter()
+    range_start, range_end = _local_bounds(start_day, end_day)
+    scope = {'studio_id': studio_id} if studio_id else {}
+    sessions = Session.objects.filter(starts_at__gte=range_start, starts_at__lt=range_end, **scope)
+    rolled = SessionOccupancy.objects.filter(day__gte=start_day, day__lt=end_day, **scope)
+    # Incluye sesiones cuyo rollup quedó en estos días aunque la sesión se haya movido
+    candidates = set(sessions.values_list('pk', flat=True)) | set(rolled.values_list('session_id', flat=True))
+    ids = list(Session.objects.select_for_update().filter(pk__in=candidates).order_by('pk').values_list('pk', flat=True))
+
+    fresh = _compute(ids)
+    existing = SessionOccupancy.objects.in_bulk(ids)
+    to_create = [row for session_id, row in fresh.items() if session_id not in existing]
+    to_update = [row for session_id, row in fresh.items() if session_id in existing and _differs(existing[session_id], row)]
+    SessionOccupancy.objects.bulk_create(to_create)
+    SessionOccupancy.objects.bulk_update(to_update, COUNT_FIELDS)
+    stats['sessions_checked'] += len(fresh)
+    stats['sessions_fixed'] += len(to_create) + len(to_update)
+
+    days = {start_day + datetime.timedelta(days=offset) for offset in range((end_day - start_day).days)}
+    days |= {row.day for row in fresh.values()} | {row.day for row in existing.values()}
+    expected = {
+        (row['studio_id'], row['day'], row['hour']): row
+        for row in SessionOccupancy.objects.filter(day__in=days, session_cancelled=False, **scope)
+        .values('studio_id', 'day', 'hour')
+        .annotate(sessions=Count('pk'), **{name: Sum(name) for name in BUCKET_FIELDS if name != 'sessions'})
+    }
+    current = {
+        (bucket.studio_id, bucket.day, bucket.hour): bucket
+        for bucket in OccupancyBucket.objects.select_for_update().filter(day__in=days, **scope)
+    }
+    stale = [bucket.pk for key, bucket in current.items() if key not in expected]
+    to_create, to_update = [], []
+    for key, row in expected.items():
+        values = {name: row[name] for name in BUCKET_FIELDS}
+        bucket = current.get(key)
+        if bucket is None:
+            to_create.append(OccupancyBucket(studio_id=key[0], day=key[1], hour=key[2], weekday=key[1].weekday(), **values))
+        elif _bucket_values(bucket) != tuple(values.values()):
+            for name, value in values.items():
+                setattr(bucket, name, value)
+            to_update.append(bucket)
+    OccupancyBucket.objects.filter(pk__in=stale).delete()
+    OccupancyBucket.objects.bulk_create(to_create)
+    OccupancyBucket.objects.bulk_update(to_update, BUCKET_FIELDS)
+    stats['buckets_fixed'] += len(stale) + len(to_create) + len(to_update)
+    return stats
+
+
+def reconcile_occupancy(*, start=None, end=None, studio_id=None):
+    """Recompute rollups for ``[start, end)`` (local dates) from bookings and sessions.
+
+    Works in weekly chunks, each in its own transaction. Returns counters of
+    what was checked and fixed; non-zero ``*_fixed`` values point at a write
+    path that skipped ``track_occupancy``.
+    """
+    today = timezone.localdate()
+    start = start or today - datetime.timedelta(days=7)
+    end = end or today + datetime.timedelta(days=30)
+    stats = Counter()
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + datetime.timedelta(days=RECONCILE_CHUNK_DAYS), end)
+        stats.update(_reconcile_chunk(chunk_start, chunk_end, studio_id))
+        chunk_start = chunk_end
+    return {name: stats[name] for name in ('sessions_checked', 'sessions_fixed', 'buckets_fixed')}
+
+
+GROUPINGS = {
+    'class_type': ('session', ('class_type_id', 'class_type__name')),
+    'instructor': ('session', ('instructor_id', 'instructor__full_name')),
+    'weekday': ('bucket', ('weekday',)),
+    'hour': ('bucket', ('hour',)),
+    'day': ('bucket', ('day',)),
+}
+
+
+def occupancy_report(studio, start, end, group_by):
+    """Occupancy over ``[start, end)`` grouped by ``group_by``, read from the rollups only."""
+    source, keys = GROUPINGS[group_by]
+    if source == 'session':
+        qs = SessionOccupancy.objects.filter(studio=studio, day__gte=start, day__lt=end, session_cancelled=False)
+        totals = {'sessions': Count('pk'), **{name: Sum(name) for name in BUCKET_FIELDS if name != 'sessions'}}
+    else:
+        qs = OccupancyBucket.objects.filter(studio=studio, day__gte=start, day__lt=end)
+        totals = {name: Sum(name) for name in BUCKET_FIELDS}
+    rows = []
+    for row in qs.values(*keys).annotate(**totals).order_by(*keys):
+        reserved = row['booked'] + row['attended'] + row['no_show']
+        finished = row['attended'] + row['no_show']
+        rows.append({
+            'key': str(row[keys[0]]) if row[keys[0]] is not None else None,
+            'label': row[keys[1]] if len(keys) > 1 else row[keys[0]],
+            **{name: row[name] for name in BUCKET_FIELDS},
+            'occupancy': round(reserved / row['capacity'], 4) if row['capacity'] else 0,
+            'attendance_rate': round(row['attended'] / finished, 4) if finished else None,
+        })
+    return rows
@@ -0,0 +1,210 @@
+"""Booking policy engine.
+
+Rules are compiled per studio into a small immutable structure and kept in
+process memory; a version stored in the shared cache tells every process when
+to recompile. Usage limits are checked against ``BookingUsageCounter`` rows
+that the booking services keep up to date (and cache per user and week), so
+evaluation never counts bookings. A booking takes its place under a cap with a
+conditional increment (``count < limit``), so concurrent bookings of one
+member cannot pass it; moving a session moves its bookings' counters along.
+"""
+import logging
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from core.cache import bump_version, get_version
+from .models import Booking, BookingPolicy, BookingUsageCounter
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAMESPACE = 'booking-policies'
+# Cuánto tiempo confía cada proceso en su versión local antes de consultar la caché compartida
+VERSION_CHECK_SECONDS = 2
+USAGE_CACHE_SECONDS = 60 * 60
+# Reservas que ocupan lugar en los contadores (una cancelación desde BOOKED lo devuelve)
+COUNTED_STATUSES = (Booking.BookingStatus.BOOKED, Booking.BookingStatus.ATTENDED, Booking.BookingStatus.NO_SHOW)
+
+CompiledPolicies = namedtuple('CompiledPolicies', ['opens_before', 'closes_before', 'day_caps', 'week_caps'])
+EMPTY_POLICIES = CompiledPolicies(None, None, (), ())
+
+_compiled = {}
+
+
+def invalidate_policies(studio_id):
+    bump_version(CACHE_NAMESPACE, studio_id)
+    _compiled.pop(studio_id, None)
+
+
+def compile_policies(studio_id):
+    opens_before = closes_before = None
+    day_caps, week_caps = [], []
+    for kind, value, product_id in BookingPolicy.objects.filter(studio_id=studio_id, is_active=True).values_list('kind', 'value', 'product_id'):
+        scope = str(product_id) if product_id else ''
+        if kind == BookingPolicy.PolicyKind.OPENS_BEFORE:
+            opens_before = value if opens_before is None else min(opens_before, value)
+        elif kind == BookingPolicy.PolicyKind.CLOSES_BEFORE:
+            closes_before = max(closes_before or 0, value)
+        elif kind == BookingPolicy.PolicyKind.MAX_PER_DAY:
+            day_caps.append((scope, value))
+        elif kind == BookingPolicy.PolicyKind.MAX_PER_WEEK:
+            week_caps.append((scope, value))
+    if opens_before is None and closes_before is None and not day_caps and not week_caps:
+        return EMPTY_POLICIES
+    return CompiledPolicies(opens_before, closes_before, tuple(day_caps), tuple(week_caps))
+
+
+def get_policies(studio_id):
+    now = time.monotonic()
+    entry = _compiled.get(studio_id)
+    if entry and now - entry[2] < VERSION_CHECK_SECONDS:
+        return entry[1]
+    version = get_version(CACHE_NAMESPACE, studio_id)
+    if entry and entry[0] == version:
+        _compiled[studio_id] = (version, entry[1], now)
+        return entry[1]
+    policies = compile_policies(studio_id)
+    _compiled[studio_id] = (version, policies, now)
+    return policies
+
+
+def usage_periods(starts_at):
+    day = timezone.localtime(starts_at).date()
+    return day, day - timezone.timedelta(days=day.weekday())
+
+
+def entitlement_scope(credit=None, membership=None):
+    if membership is not None:
+        return str(membership.product_id)
+    if credit is not None and credit.source_order_item_id:
+        return str(credit.source_order_item.product_id)
+    return None
+
+
+def check_booking_window(*, studio, session, now=None):
+    """Timing rules; raises ``ValidationError`` when the session can't be booked yet/anymore."""
+    policies = get_policies(studio.id)
+    if policies is EMPTY_POLICIES:
+        return
+    minutes_left = (session.starts_at - (now or timezone.now())).total_seconds() / 60
+    if policies.opens_before is not None and minutes_left > policies.opens_before:
+        raise ValidationError('Las reservas para esta clase aún no están abiertas.')
+    if policies.closes_before is not None and minutes_left < policies.closes_before:
+        raise ValidationError('Las reservas para esta clase ya cerraron.')
+
+
+def _usage_cache_key(studio_id, user_id, week_start):
+    return f'booking-usage:{studio_id}:{user_id}:{week_start.isoformat()}'
+
+
+def _week_usage(studio, user, week_start):
+    """Counters of one user for one week (daily and weekly), read through the cache."""
+    key = _usage_cache_key(studio.id, user.id, week_start)
+    usage = cache.get(key)
+    if usage is None:
+        usage = {
+            (period, period_start.isoformat(), scope): count
+            for period, period_start, scope, count in BookingUsageCounter.objects.filter(
+                studio=studio,
+                user=user,
+                period_start__gte=week_start,
+                period_start__lt=week_start + timezone.timedelta(days=7),
+            ).values_list('period', 'period_start', 'scope', 'count')
+        }
+        cache.set(key, usage, USAGE_CACHE_SECONDS)
+    return usage
+
+
+def check_usage_limits(*, studio, user, session, scope=None):
+    """Usage caps for the day/week of the session, read from the counters."""
+    policies = get_policies(studio.id)
+    if not policies.day_caps and not policies.week_caps:
+        return
+    day, week = usage_periods(session.starts_at)
+    usage = _week_usage(studio, user, week)
+    for period, caps, start in (('day', policies.day_caps, day), ('week', policies.week_caps, week)):
+        for counter_scope, limit in caps:
+            if counter_scope not in ('', scope):
+                continue
+            if usage.get((period, start.isoformat(), counter_scope), 0) >= limit:
+                label = 'día' if period == 'day' else 'semana'
+                raise ValidationError(f'Alcanzaste el máximo de {limit} reservas por {label}.')
+
+
+def _caps(studio_id, scope):
+    """``{(period, counter_scope): limit}`` of the caps that apply to a booking made with ``scope``."""
+    policies = get_policies(studio_id)
+    caps = {}
+    for period, period_caps in (('day', policies.day_caps), ('week', policies.week_caps)):
+        for counter_scope, limit in period_caps:
+            if counter_scope in ('', scope):
+                key = (period, counter_scope)
+                caps[key] = min(limit, caps.get(key, limit))
+    return caps
+
+
+def _bump(lookup, delta, limit=None):
+    """Add ``delta`` to one counter; with ``limit`` only while it stays within it. Returns ``False`` when full."""
+    counters = BookingUsageCounter.objects.filter(**lookup)
+    if delta < 0:
+        if not counters.filter(count__gte=-delta).update(count=F('count') + delta):
+            logger.warning('booking usage counter would go below zero', extra={k: str(v) for k, v in lookup.items()})
+        return True
+    capped = counters if limit is None else counters.filter(count__lte=limit - delta)
+    if capped.update(count=F('count') + delta):
+        return True
+    if limit is not None and (delta > limit or counters.exists()):
+        return False
+    try:
+        with transaction.atomic():
+            BookingUsageCounter.objects.create(count=delta, **lookup)
+    except IntegrityError:
+        # Otra reserva creó el contador primero: se reintenta el incremento condicional
+        return bool(capped.update(count=F('count') + delta))
+    return True
+
+
+def _apply_usage(studio_id, user_id, periods, scope, delta, caps):
+    day, week = periods
+    for scope_key in {'', scope or ''}:
+        for period, period_start in (('day', day), ('week', week)):
+            lookup = dict(studio_id=studio_id, user_id=user_id, period=period, period_start=period_start, scope=scope_key)
+            limit = caps.get((period, scope_key))
+            if not _bump(lookup, delta, limit):
+                label = 'día' if period == 'day' else 'semana'
+                raise ValidationError(f'Alcanzaste el máximo de {limit} reservas por {label}.')
+    # Se borra antes y después del commit para que ningún lector deje en caché un conteo viejo
+    key = _usage_cache_key(studio_id, user_id, week)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def record_usage(*, studio, user, session, scope=None, delta=1, enforce=False):
+    """Move the user's counters for the session's day and week by ``delta``.
+
+    With ``enforce`` every capped counter is incremented only while it is
+    under its limit; raises ``ValidationError`` (the caller's transaction rolls
+    back the counters already moved) when one is full.
+    """
+    caps = _caps(studio.id, scope) if enforce and delta > 0 else {}
+    _apply_usage(studio.id, user.id, usage_periods(session.starts_at), scope, delta, caps)
+
+
+def move_usage(session, previous_starts_at):
+    """Move the counters of the session's bookings after ``starts_at`` changed to another day or week."""
+    old, new = usage_periods(previous_starts_at), usage_periods(session.starts_at)
+    if old == new:
+        return
+    bookings = (
+        Booking.objects.filter(session=session, status__in=COUNTED_STATUSES)
+        .select_related('credit__source_order_item', 'membership')
+    )
+    for booking in bookings:
+        scope = entitlement_scope(booking.credit, booking.membership)
+        _apply_usage(booking.studio_id, booking.user_id, old, scope, -1, {})
+        _apply_usage(booking.studio_id, booking.user_id, new, scope, 1, {})
@@ -0,0 +1,131 @@
+"""Live availability: occupancy deltas pushed to clients over Server-Sent Events.
+
+EventSource cannot send an Authorization header, so the authenticated API
+hands out a signed, expiring stream token (``make_stream_token``) that the
+stream URL carries. Each member may keep ``MAX_STREAMS_PER_CLIENT`` streams
+open; the count lives in the cache and expires with the longest stream.
+"""
+import asyncio
+import json
+
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from core.pubsub import get_broker
+from .models import Session, Booking
+
+HEARTBEAT_SECONDS = 25
+RETRY_MS = 5000
+# Django 4.2 no avisa al generador cuando el cliente se desconecta; cerrar cada
+# stream periódicamente acota las suscripciones huérfanas (EventSource reconecta solo)
+MAX_STREAM_SECONDS = 5 * 60
+MAX_STREAMS_PER_CLIENT = 3
+TOKEN_SALT = 'scheduling.availability-stream'
+# EventSource reconecta con la misma URL: el token debe durar varias vidas de stream
+TOKEN_MAX_AGE = 60 * 60
+
+
+def make_stream_token(studio_id, user_id):
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(f'{studio_id}.{user_id}')
+
+
+def read_stream_token(token):
+    """Return ``(studio_id, user_id)`` or ``None`` if the token is forged or expired."""
+    try:
+        studio_id, user_id = signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=TOKEN_MAX_AGE).split('.', 1)
+    except (signing.BadSignature, ValueError):
+        return None
+    return studio_id, user_id
+
+
+def _slots_key(client_id):
+    return f'availability-streams:{client_id}'
+
+
+async def acquire_stream(client_id):
+    """Reserve one of the client's stream slots; ``False`` when all are in use."""
+    key = _slots_key(client_id)
+    ttl = MAX_STREAM_SECONDS + 60
+    await cache.aadd(key, 0, ttl)
+    try:
+        count = await cache.aincr(key)
+    except ValueError:
+        # Expiró entre el add y el incr
+        await cache.aadd(key, 0, ttl)
+        count = await cache.aincr(key)
+    # Cada toma renueva el TTL: la clave dura lo que el stream más nuevo, y los lugares
+    # que dejó un worker caído se liberan solos al expirar
+    await cache.atouch(key, ttl)
+    if count > MAX_STREAMS_PER_CLIENT:
+        await cache.adecr(key)
+        return False
+    return True
+
+
+async def release_stream(client_id):
+    try:
+        await cache.adecr(_slots_key(client_id))
+    except ValueError:
+        # La clave expiró: no queda nada que liberar
+        pass
+
+
+def channel_for(studio_id):
+    return f'availability:{studio_id}'
+
+
+def session_occupancy(session_id):
+    row = (
+        Session.objects.filter(pk=session_id)
+        .annotate(
+            booked=Count('bookings', filter=Q(bookings__status=Booking.BookingStatus.BOOKED)),
+            waitlisted=Count('bookings', filter=Q(bookings__status=Booking.BookingStatus.WAITLIST)),
+        )
+        .values('id', 'studio_id', 'capacity', 'status', 'booked', 'waitlisted')
+        .first()
+    )
+    if row is None:
+        return None
+    return {
+        'session': str(row['id']),
+        'status': row['status'],
+        'capacity': row['capacity'],
+        'booked': row['booked'],
+        'spots_left': max(row['capacity'] - row['booked'], 0),
+        'waitlist': row['waitlisted'],
+    }
+
+
+def publish_availability(session):
+    """Push the session's occupancy to its studio channel once the transaction commits."""
+    session_id, studio_id = session.pk, session.studio_id
+
+    def send():
+        delta = session_occupancy(session_id)
+        if delta is not None:
+            get_broker().publish(channel_for(studio_id), delta)
+
+    transaction.on_commit(send)
+
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+async def availability_events(studio_id, client_id=None):
+    """Async SSE body for one client; only holds a queue while idle and frees the client's slot at the end."""
+    subscription = get_broker().subscribe(channel_for(studio_id))
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MAX_STREAM_SECONDS
+    try:
+        yield f'retry: {RETRY_MS}\n: conectado\n\n'
+        while (remaining := deadline - loop.time()) > 0:
+            message = await subscription.get(timeout=min(HEARTBEAT_SECONDS, remaining))
+            # Los comentarios periódicos mantienen viva la conexión a través de proxies
+            yield ': ping\n\n' if message is None else _event('availability', message)
+    finally:
+        subscription.close()
+        if client_id is not None:
+            await release_stream(client_id)
@@ -0,0 +1,101 @@
+"""Week-view schedule: a studio-wide cached base layer plus a per-user overlay."""
+import datetime
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from core.cache import bump_version, versioned_key
+from .models import Session, Booking, WaitlistEntry
+
+CACHE_NAMESPACE = 'schedule'
+# Solo cambios de las sesiones (hora, instructor, estado), no de la ocupación
+TIMETABLE_NAMESPACE = 'timetable'
+CACHE_SECONDS = 10 * 60
+
+
+def invalidate_schedule(studio_id, timetable=False):
+    """Drop the studio's cached schedule on commit; ``timetable`` also drops the views that only show sessions."""
+    transaction.on_commit(lambda: bump_version(CACHE_NAMESPACE, studio_id))
+    if timetable:
+        transaction.on_commit(lambda: bump_version(TIMETABLE_NAMESPACE, studio_id))
+
+
+def _range_bounds(start_date, days):
+    tz = timezone.get_current_timezone()
+    start = datetime.datetime.combine(start_date, datetime.time.min, tzinfo=tz)
+    return start, start + datetime.timedelta(days=days)
+
+
+def build_schedule_base(studio, start_date, days):
+    """Sessions of the range grouped by local day, with live occupancy (one query)."""
+    range_start, range_end = _range_bounds(start_date, days)
+    sessions = (
+        Session.objects.filter(studio=studio, starts_at__gte=range_start, starts_at__lt=range_end)
+        .select_related('class_type', 'instructor', 'location')
+        .annotate(
+            booked=Count('bookings', filter=Q(bookings__status=Booking.BookingStatus.BOOKED)),
+            waitlisted=Count('bookings', filter=Q(bookings__status=Booking.BookingStatus.WAITLIST)),
+        )
+        .order_by('starts_at')
+    )
+    days_out = [
+        {'date': (start_date + datetime.timedelta(days=offset)).isoformat(), 'sessions': []}
+        for offset in range(days)
+    ]
+    for session in sessions:
+        offset = (timezone.localtime(session.starts_at).date() - start_date).days
+        days_out[offset]['sessions'].append({
+            'id': str(session.id),
+            'starts_at': session.starts_at.isoformat(),
+            'duration_minutes': session.class_type.duration_minutes,
+            'class_type': str(session.class_type_id),
+            'class_name': session.class_type.name,
+            'instructor': session.instructor.full_name if session.instructor else None,
+            'location': session.location.name if session.location else None,
+            'status': session.status,
+            'capacity': session.capacity,
+            'spots_left': max(session.capacity - session.booked, 0),
+            'waitlist': session.waitlisted,
+        })
+    return days_out
+
+
+def get_schedule_base(studio, start_date, days):
+    key = versioned_key(CACHE_NAMESPACE, studio.id, start_date.isoformat(), days)
+    base = cache.get(key)
+    if base is None:
+        base = build_schedule_base(studio, start_date, days)
+        cache.set(key, base, CACHE_SECONDS)
+    return base
+
+
+def overlay_user_state(base, studio, user, start_date, days):
+    """Merge the caller's booking status and waitlist position into the base layer (two queries)."""
+    range_start, range_end = _range_bounds(start_date, days)
+    in_range = dict(session__studio=studio, session__starts_at__gte=range_start, session__starts_at__lt=range_end, user=user)
+    bookings = {
+        str(session_id): (str(booking_id), status)
+        for booking_id, session_id, status in Booking.objects.filter(**in_range)
+        .exclude(status=Booking.BookingStatus.CANCELLED)
+        .values_list('id', 'session_id', 'status')
+    }
+    positions = {
+        str(session_id): position
+        for session_id, position in WaitlistEntry.objects.filter(**in_range).values_list('session_id', 'position')
+    }
+
+    merged = []
+    for day in base:
+        day_sessions = []
+        for item in day['sessions']:
+            booking = bookings.get(item['id'])
+            day_sessions.append({
+                **item,
+                'my_booking': booking[0] if booking else None,
+                'my_status': booking[1] if booking else None,
+                'waitlist_position': positions.get(item['id']),
+            })
+        merged.append({'date': day['date'], 'sessions': day_sessions})
+    return merged
@@ -1,5 +1,13 @@
 from rest_framework import serializers
-from .models import Session, Booking, WaitlistEntry, Checkin
+from .models import Session, Booking, WaitlistEntry, Checkin, SpotLayout, BookingPolicy
+from .spots import capacity_error, layout_for, oversized_sessions
+
+
+def _studio_id(serializer):
+    if serializer.instance is not None:
+        return serializer.instance.studio_id
+    return getattr(getattr(serializer.context.get('request'), 'studio', None), 'id', None)
+
 
 class SessionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -7,6 +15,20 @@ class SessionSerializer(serializers.ModelSerializer):
         fields = ['id', 'studio', 'location', 'class_type', 'instructor', 'starts_at', 'capacity', 'status', 'notes', 'created_at']
         read_only_fields = ['id', 'studio', 'status', 'created_at']
 
+    def validate(self, attrs):
+        # Con layout de lugares, cada reserva necesita un lugar: la capacidad no puede excederlo
+        session = Session(
+            id=getattr(self.instance, 'id', None),
+            studio_id=_studio_id(self),
+            location=attrs.get('location', getattr(self.instance, 'location', None)),
+            class_type=attrs.get('class_type', getattr(self.instance, 'class_type', None)),
+        )
+        capacity = attrs.get('capacity', getattr(self.instance, 'capacity', 0))
+        error = capacity_error(layout_for(session), capacity) if session.studio_id else None
+        if error:
+            raise serializers.ValidationError({'capacity': error})
+        return attrs
+
 class BookingSerializer(serializers.ModelSerializer):
     session_starts_at = serializers.DateTimeField(source='session.starts_at', read_only=True)
     session_class_name = serializers.CharField(source='session.class_type.name', read_only=True)
@@ -18,10 +40,10 @@ class BookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = [
-            'id', 'studio', 'session', 'user', 'status', 'booked_at', 'cancelled_at', 'source', 'credit', 'membership', 'created_at',
+            'id', 'studio', 'session', 'user', 'status', 'booked_at', 'cancelled_at', 'source', 'credit', 'membership', 'spot', 'created_at',
             'session_starts_at', 'session_class_name', 'user_email', 'user_name', 'has_checkin', 'checkin_id'
         ]
-        read_only_fields = ['id', 'studio', 'status', 'booked_at', 'cancelled_at', 'credit', 'membership', 'created_at', 'session_starts_at', 'session_class_name', 'user_email', 'user_name', 'has_checkin', 'checkin_id']
+        read_only_fields = ['id', 'studio', 'status', 'booked_at', 'cancelled_at', 'credit', 'membership', 'spot', 'created_at', 'session_starts_at', 'session_class_name', 'user_email', 'user_name', 'has_checkin', 'checkin_id']
 
     def get_has_checkin(self, obj):
         return hasattr(obj, 'checkin') and obj.checkin is not None
@@ -42,3 +64,64 @@ class CheckinSerializer(serializers.ModelSerializer):
         model = Checkin
         fields = ['id', 'studio', 'booking', 'checked_in_at', 'method', 'created_at']
         read_only_fields = ['id', 'studio', 'checked_in_at', 'created_at']
+
+class SpotLayoutSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SpotLayout
+        fields = ['id', 'studio', 'location', 'class_type', 'name', 'spots', 'labels', 'preferred_order', 'is_active', 'created_at']
+        read_only_fields = ['id', 'studio', 'created_at']
+
+    def validate(self, attrs):
+        spots = attrs.get('spots', getattr(self.instance, 'spots', 0))
+        labels = attrs.get('labels') or []
+        order = attrs.get('preferred_order') or []
+        if labels and len(labels) != spots:
+            raise serializers.ValidationError({'labels': 'Debe haber una etiqueta por lugar'})
+        if any(not isinstance(i, int) or not 0 <= i < spots for i in order) or len(set(order)) != len(order):
+            raise serializers.ValidationError({'preferred_order': 'Índices de lugar inválidos'})
+        layout = SpotLayout(
+            id=getattr(self.instance, 'id', None),
+            studio_id=_studio_id(self),
+            spots=spots,
+            is_active=attrs.get('is_active', getattr(self.instance, 'is_active', True)),
+            location=attrs.get('location', getattr(self.instance, 'location', None)),
+            class_type=attrs.get('class_type', getattr(self.instance, 'class_type', None)),
+        )
+        oversized = oversized_sessions(layout) if layout.studio_id else []
+        if oversized:
+            raise serializers.ValidationError(
+                {'spots': f'{len(oversized)} sesiones próximas tienen más capacidad que {spots} lugares'}
+            )
+        return attrs
+
+class BookingPolicySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BookingPolicy
+        fields = ['id', 'studio', 'product', 'kind', 'value', 'is_active', 'created_at']
+        read_only_fields = ['id', 'studio', 'created_at']
+
+    def validate_product(self, product):
+        request = self.context.get('request')
+        if product and request and product.studio_id != getattr(request.studio, 'id', None):
+            raise serializers.ValidationError('Producto no encontrado')
+        return product
+
+class SessionBulkChangeSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    starts_at = serializers.DateTimeField(required=False)
+    instructor = serializers.UUIDField(required=False, allow_null=True)
+    location = serializers.UUIDField(required=False, allow_null=True)
+    capacity = serializers.IntegerField(required=False, min_value=1)
+    status = serializers.ChoiceField(choices=Session.SessionStatus.choices, required=False)
+
+class SessionBulkUpdateSerializer(serializers.Serializer):
+    changes = SessionBulkChangeSerializer(many=True, allow_empty=False, max_length=500)
+    notify = serializers.BooleanField(default=True)
+
+class OfflineCheckinSerializer(serializers.Serializer):
+    booking = serializers.UUIDField()
+    checked_in_at = serializers.DateTimeField(required=False)
+    method = serializers.CharField(max_length=20, required=False, default='kiosk')
+
+class OfflineCheckinBatchSerializer(serializers.Serializer):
+    checkins = OfflineCheckinSerializer(many=True, allow_empty=False, max_length=500)
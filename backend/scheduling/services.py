@@ -2,61 +2,125 @@ from django.db import models, transaction
 from django.db.models import F, Q
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
-from .models import Session, Booking, WaitlistEntry
-from commerce.models import UserCredit, UserMembership
+from .models import Session, Booking, WaitlistEntry, SyncChange, SessionSpotMap, SpotLayout
+from .spots import capacity_error, claim_spot, pick_layout, release_spot
+from .policies import check_booking_window, check_usage_limits, record_usage, move_usage, entitlement_scope
+from .schedule import invalidate_schedule
+from .realtime import publish_availability
+from .occupancy import track_occupancy
+from .sync import record_changes
+from users.dashboard import invalidate_member
+from commerce.models import CreditMovement, UserCredit, UserMembership
+from commerce.entitlements import get_summary, next_credit_id, rebuild_summary, take_credit
+from commerce.ledger import record_movement
+from core.concurrency import ConcurrencyConflict, DEFAULT_RETRIES, transition
 from core.utils import log_action
 
 
-def _claim_entitlement(*, studio, user, consume_credit=True):
-    now = timezone.now()
-    membership = UserMembership.objects.select_for_update().filter(
-        studio=studio,
-        user=user,
-        status='active',
-    ).filter(Q(ends_at__isnull=True) | Q(ends_at__gte=now)).order_by('ends_at').first()
-    if membership:
-        return None, membership
-
-    credit = (
-        UserCredit.objects.select_for_update()
-        .filter(studio=studio, user=user)
-        .filter(Q(expires_at__isnull=True) | Q(expires_at__gte=now))
-        .filter(credits_used__lt=F('credits_total'))
-        .order_by('expires_at', 'created_at')
-        .first()
+def _lock_session(session):
+    # Un solo candado por sesión serializa cupo, lista de espera y mapa de lugares
+    Session.objects.select_for_update().filter(pk=session.pk).values_list('pk', flat=True).first()
+
+
+def _after_booking_change(session, *user_ids):
+    # Ocupación y estado del usuario cambiaron: se invalidan las vistas cacheadas al confirmar
+    invalidate_schedule(session.studio_id)
+    invalidate_member(*user_ids)
+    publish_availability(session)
+    track_occupancy(session.pk)
+
+
+def _transition_booking(booking, to_status, expected=None, **changes):
+    try:
+        previous = transition(booking, to_status, allowed=Booking.TRANSITIONS, expected=expected, **changes)
+    except ValueError:
+        raise ValidationError(
+            f'La reserva está {booking.get_status_display().lower()} y no puede pasar a {Booking.BookingStatus(to_status).label.lower()}.'
+        )
+    if previous is not None:
+        # El CAS es un UPDATE directo: no dispara post_save
+        record_changes(booking.studio_id, SyncChange.Entity.BOOKING, [booking.pk])
+        track_occupancy(booking.session_id)
+    return previous
+
+
+def _refund_credit(booking):
+    refunded = UserCredit.objects.filter(id=booking.credit_id, credits_used__gt=0).update(
+        credits_used=F('credits_used') - 1,
+        version=F('version') + 1,
     )
-    if not credit:
-        raise ValidationError('No tienes clases disponibles. Compra una clase suelta, paquete o membresía.')
+    if refunded:
+        record_movement(booking.credit, -1, CreditMovement.Kind.REFUND, booking)
+    rebuild_summary(booking.studio_id, booking.user_id)
+
+
+def _claim_entitlement(*, studio, user, consume_credit=True):
+    # El resumen bloqueado serializa las reservas del mismo miembro y dice qué crédito usar sin recorrerlos
+    summary = get_summary(studio.id, user.id, for_update=True)
+    if summary.membership_id:
+        return None, UserMembership.objects.get(pk=summary.membership_id)
+
+    for _ in range(DEFAULT_RETRIES):
+        credit_id = next_credit_id(summary)
+        if not credit_id:
+            raise ValidationError('No tienes clases disponibles. Compra una clase suelta, paquete o membresía.')
+        if not consume_credit:
+            return UserCredit.objects.select_related('source_order_item').get(pk=credit_id), None
+        consumed = UserCredit.objects.filter(id=credit_id, credits_used__lt=F('credits_total')).update(
+            credits_used=F('credits_used') + 1,
+            version=F('version') + 1,
+        )
+        if consumed:
+            take_credit(summary, credit_id)
+            return UserCredit.objects.select_related('source_order_item').get(pk=credit_id), None
+        # El crédito cambió por fuera del resumen: se reconstruye desde las filas fuente
+        summary = rebuild_summary(studio.id, user.id)
+    raise ConcurrencyConflict()
+
 
-    if consume_credit:
-        UserCredit.objects.filter(id=credit.id).update(credits_used=F('credits_used') + 1)
-        credit.refresh_from_db()
-    return credit, None
+def _record_consumption(booking, credit):
+    # Mismo movimiento que el UPDATE de _claim_entitlement, ya con la reserva que lo usa
+    if credit is not None:
+        record_movement(credit, 1, CreditMovement.Kind.CONSUME, booking)
 
 @transaction.atomic
-def book_session(*, studio, session: Session, user, source='web') -> Booking:
+def book_session(*, studio, session: Session, user, source='web', spot=None) -> Booking:
     if session.status != Session.SessionStatus.SCHEDULED:
         raise ValidationError('La sesión no está disponible.')
     if session.starts_at <= timezone.now():
         raise ValidationError('La sesión ya inició o terminó.')
-    active_count = Booking.objects.select_for_update().filter(session=session, status=Booking.BookingStatus.BOOKED).count()
+    check_booking_window(studio=studio, session=session)
+    _lock_session(session)
+    active_count = Booking.objects.filter(session=session, status=Booking.BookingStatus.BOOKED).count()
     existing = Booking.objects.filter(session=session, user=user).first()
 
     if existing:
         if existing.status == Booking.BookingStatus.CANCELLED and active_count < session.capacity:
             credit, membership = _claim_entitlement(studio=studio, user=user, consume_credit=True)
-            existing.status = Booking.BookingStatus.BOOKED
-            existing.booked_at = timezone.now()
-            existing.cancelled_at = None
-            existing.credit = credit
-            existing.membership = membership
-            existing.save(update_fields=['status', 'booked_at', 'cancelled_at', 'credit', 'membership'])
+            scope = entitlement_scope(credit, membership)
+            record_usage(studio=studio, user=user, session=session, scope=scope, enforce=True)
+            claim_spot(session, existing, spot)
+            _transition_booking(
+                existing,
+                Booking.BookingStatus.BOOKED,
+                booked_at=timezone.now(),
+                cancelled_at=None,
+                credit=credit,
+                membership=membership,
+                spot=existing.spot,
+            )
+            _record_consumption(existing, credit)
             log_action(studio, user, 'booking_reactivated', 'session', session.id)
+            _after_booking_change(session, user.id)
         return existing
 
     if active_count >= session.capacity:
+        if spot is not None:
+            # La lista de espera no guarda lugares: al promoverla se asigna el mejor disponible
+            raise ValidationError('La clase está llena; únete a la lista de espera sin elegir lugar.')
         # Aseguramos que el usuario tenga derecho aunque quede en espera
-        _claim_entitlement(studio=studio, user=user, consume_credit=False)
+        credit, membership = _claim_entitlement(studio=studio, user=user, consume_credit=False)
+        check_usage_limits(studio=studio, user=user, session=session, scope=entitlement_scope(credit, membership))
         booking = Booking.objects.create(
             studio=studio,
             session=session,
@@ -67,11 +131,14 @@ def book_session(*, studio, session: Session, user, source='web') -> Booking:
         position = WaitlistEntry.objects.select_for_update().filter(session=session).count() + 1
         WaitlistEntry.objects.create(studio=studio, session=session, user=user, position=position)
         log_action(studio, user, 'waitlist_joined', 'session', session.id, {'position': position})
+        _after_booking_change(session, user.id)
         return booking
 
     credit, membership = _claim_entitlement(studio=studio, user=user, consume_credit=True)
+    scope = entitlement_scope(credit, membership)
+    record_usage(studio=studio, user=user, session=session, scope=scope, enforce=True)
 
-    booking = Booking.objects.create(
+    booking = Booking(
         studio=studio,
         session=session,
         user=user,
@@ -80,7 +147,11 @@ def book_session(*, studio, session: Session, user, source='web') -> Booking:
         membership=membership,
         source=source,
     )
+    claim_spot(session, booking, spot)
+    booking.save()
+    _record_consumption(booking, credit)
     log_action(studio, user, 'booking_created', 'session', session.id, {'source': source})
+    _after_booking_change(session, user.id)
     
     # Send confirmation email async
     from notifications.tasks import send_booking_confirmation
@@ -92,16 +163,31 @@ def book_session(*, studio, session: Session, user, source='web') -> Booking:
 def cancel_booking(*, booking: Booking, actor=None):
     if booking.status == Booking.BookingStatus.CANCELLED:
         return booking
-    booking.status = Booking.BookingStatus.CANCELLED
-    booking.cancelled_at = timezone.now()
-    booking.save(update_fields=['status', 'cancelled_at'])
+    _lock_session(booking.session)
+    # El lugar solo cambia bajo el candado de la sesión; el estado puede cambiarlo staff sin él
+    booking.refresh_from_db(fields=['status', 'spot', 'version', 'credit', 'membership'])
+    spot = booking.spot
+    previous = _transition_booking(booking, Booking.BookingStatus.CANCELLED, cancelled_at=timezone.now(), spot=None)
+    if previous is None:
+        # Otra petición ya la canceló: no se reembolsa dos veces
+        return booking
+    release_spot(booking.session, spot)
+    if previous == Booking.BookingStatus.WAITLIST:
+        # Sin su entrada, la promoción no puede reservarle después de cancelar
+        WaitlistEntry.objects.filter(session=booking.session, user=booking.user).delete()
     if booking.credit_id:
-        UserCredit.objects.filter(id=booking.credit_id).update(credits_used=models.Case(
-            models.When(credits_used__gt=0, then=F('credits_used') - 1),
-            default=0,
-        ))
+        _refund_credit(booking)
+    if previous == Booking.BookingStatus.BOOKED:
+        record_usage(
+            studio=booking.studio,
+            user=booking.user,
+            session=booking.session,
+            scope=entitlement_scope(booking.credit, booking.membership),
+            delta=-1,
+        )
     promote_waitlist(booking.session)
     log_action(booking.studio, actor or booking.user, 'booking_cancelled', 'booking', booking.id)
+    _after_booking_change(booking.session, booking.user_id)
     
     # Send cancellation email async
     from notifications.tasks import send_cancellation_email
@@ -119,27 +205,281 @@ def cancel_booking(*, booking: Booking, actor=None):
 
 @transaction.atomic
 def promote_waitlist(session: Session):
-    active_count = Booking.objects.select_for_update().filter(session=session, status=Booking.BookingStatus.BOOKED).count()
+    _lock_session(session)
+    active_count = Booking.objects.filter(session=session, status=Booking.BookingStatus.BOOKED).count()
     if active_count >= session.capacity:
         return None
-    entry = WaitlistEntry.objects.select_for_update().filter(session=session).order_by('position', 'created_at').first()
-    if not entry:
+    entries = WaitlistEntry.objects.select_for_update().filter(session=session).order_by('position', 'created_at')
+    for entry in entries:
+        booking = Booking.objects.filter(session=session, user=entry.user, status=Booking.BookingStatus.WAITLIST).first()
+        if booking:
+            break
+        # La reserva ya no está en espera (cancelada o reservada por otra vía): la entrada sobra
+        entry.delete()
+    else:
+        return None
+    try:
+        credit, membership = _claim_entitlement(studio=session.studio, user=entry.user, consume_credit=True)
+    except ValidationError:
         return None
-    booking = Booking.objects.filter(session=session, user=entry.user).first()
-    if booking:
-        try:
-            credit, membership = _claim_entitlement(studio=session.studio, user=entry.user, consume_credit=True)
-        except ValidationError:
-            return None
-        booking.status = Booking.BookingStatus.BOOKED
-        booking.credit = credit
-        booking.membership = membership
-        booking.save(update_fields=['status', 'credit', 'membership'])
-        
-        # Send confirmation for promoted booking
-        from notifications.tasks import send_booking_confirmation
-        send_booking_confirmation.delay(str(booking.id))
-        
+    record_usage(studio=session.studio, user=entry.user, session=session, scope=entitlement_scope(credit, membership))
+    try:
+        claim_spot(session, booking)
+    except ValidationError:
+        booking.spot = None
+    _transition_booking(booking, Booking.BookingStatus.BOOKED, expected={Booking.BookingStatus.WAITLIST},
+                        credit=credit, membership=membership, spot=booking.spot)
+    _record_consumption(booking, credit)
+    
+    # Send confirmation for promoted booking
+    from notifications.tasks import send_booking_confirmation
+    send_booking_confirmation.delay(str(booking.id))
+    
     entry.delete()
     log_action(session.studio, entry.user, 'waitlist_promoted', 'session', session.id)
+    _after_booking_change(session, entry.user_id)
+    return booking
+
+
+def mark_booking_no_show(*, booking: Booking, actor=None):
+    previous = _transition_booking(booking, Booking.BookingStatus.NO_SHOW)
+    if previous is not None:
+        log_action(booking.studio, actor, 'booking_no_show', 'booking', booking.id)
+        invalidate_member(booking.user_id)
+    return booking
+
+
+def check_in_booking(*, booking: Booking, actor=None):
+    previous = _transition_booking(booking, Booking.BookingStatus.ATTENDED)
+    if previous is not None:
+        log_action(booking.studio, actor, 'booking_checked_in', 'booking', booking.id)
+        invalidate_member(booking.user_id)
     return booking
+
+
+def undo_check_in(*, booking: Booking, actor=None):
+    previous = _transition_booking(booking, Booking.BookingStatus.BOOKED)
+    if previous is not None:
+        log_action(booking.studio, actor, 'booking_checkin_reverted', 'booking', booking.id)
+        invalidate_member(booking.user_id)
+    return booking
+
+
+BULK_SESSION_FIELDS = ('starts_at', 'instructor', 'capacity', 'location', 'status')
+
+
+def _session_window(session, starts_at):
+    return starts_at, starts_at + timezone.timedelta(minutes=session.class_type.duration_minutes)
+
+
+def _overlaps(start_a, end_a, start_b, end_b):
+    return start_a < end_b and start_b < end_a
+
+
+@transaction.atomic
+def bulk_update_sessions(*, studio, changes, actor=None, notify=True):
+    """Apply many session edits with batched validation and set-based writes.
+
+    Returns ``(updated_ids, errors)``; ``errors`` lists ``{'index', 'id', 'errors'}``
+    for rejected items. Valid items are applied even when others fail.
+    """
+    from catalog.models import Instructor
+    from studios.models import Location
+
+    sessions = (
+        Session.objects.select_for_update()
+        .select_related('class_type')
+        .filter(studio=studio)
+        .in_bulk({item['id'] for item in changes})
+    )
+    valid_instructors = set(Instructor.objects.filter(
+        studio=studio, id__in={item['instructor'] for item in changes if item.get('instructor')},
+    ).values_list('id', flat=True))
+    valid_locations = set(Location.objects.filter(
+        studio=studio, id__in={item['location'] for item in changes if item.get('location')},
+    ).values_list('id', flat=True))
+    booked_counts = dict(
+        Booking.objects.filter(session_id__in=sessions.keys(), status=Booking.BookingStatus.BOOKED)
+        .values('session_id')
+        .annotate(total=models.Count('id'))
+        .values_list('session_id', 'total')
+    )
+    layouts, mapped = [], {}
+    if any('capacity' in item or 'location' in item for item in changes):
+        layouts = list(SpotLayout.objects.filter(studio=studio, is_active=True))
+        mapped = {
+            spot_map.session_id: spot_map.layout
+            for spot_map in SessionSpotMap.objects.filter(session_id__in=sessions.keys()).select_related('layout')
+        }
+
+    errors = {}
+    candidates = {}
+    seen = set()
+    for index, item in enumerate(changes):
+        session = sessions.get(item['id'])
+        if session is None:
+            errors[index] = {'id': 'Sesión no encontrada'}
+            continue
+        if session.id in seen:
+            errors[index] = {'id': 'Sesión repetida en el lote'}
+            continue
+        seen.add(session.id)
+        item_errors = {}
+        if item.get('instructor') and item['instructor'] not in valid_instructors:
+            item_errors['instructor'] = 'Instructor no encontrado'
+        if item.get('location') and item['location'] not in valid_locations:
+            item_errors['location'] = 'Ubicación no encontrada'
+        if 'capacity' in item and item['capacity'] < booked_counts.get(session.id, 0):
+            item_errors['capacity'] = 'La capacidad no puede ser menor a las reservas activas'
+        elif 'capacity' in item or 'location' in item:
+            layout = mapped.get(session.id) or pick_layout(layouts, item.get('location', session.location_id), session.class_type_id)
+            error = capacity_error(layout, item.get('capacity', session.capacity))
+            if error:
+                item_errors['capacity'] = error
+        if item_errors:
+            errors[index] = item_errors
+            continue
+        starts_at, ends_at = _session_window(session, item.get('starts_at', session.starts_at))
+        candidates[index] = {
+            'session': session,
+            'starts_at': starts_at,
+            'ends_at': ends_at,
+            'instructor_id': item['instructor'] if 'instructor' in item else session.instructor_id,
+            'location_id': item['location'] if 'location' in item else session.location_id,
+            'status': item.get('status', session.status),
+        }
+
+    # Unicidad y traslapes se validan contra el estado final del lote en dos consultas
+    batch_ids = [c['session'].id for c in candidates.values()]
+    taken_slots = set()
+    neighbours = []
+    if candidates:
+        taken_slots = set(
+            Session.objects.filter(
+                studio=studio,
+                class_type_id__in={c['session'].class_type_id for c in candidates.values()},
+                starts_at__in={c['starts_at'] for c in candidates.values()},
+            ).exclude(id__in=batch_ids).values_list('class_type_id', 'starts_at')
+        )
+        live = [c for c in candidates.values() if c['status'] == Session.SessionStatus.SCHEDULED]
+        instructors = {c['instructor_id'] for c in live if c['instructor_id']}
+        locations = {c['location_id'] for c in live if c['location_id']}
+        if instructors or locations:
+            neighbours = [
+                {
+                    'starts_at': other.starts_at,
+                    'ends_at': _session_window(other, other.starts_at)[1],
+                    'instructor_id': other.instructor_id,
+                    'location_id': other.location_id,
+                }
+                for other in Session.objects.filter(
+                    studio=studio,
+                    status=Session.SessionStatus.SCHEDULED,
+                    starts_at__gte=min(c['starts_at'] for c in live) - timezone.timedelta(days=1),
+                    starts_at__lt=max(c['ends_at'] for c in live),
+                )
+                .filter(Q(instructor_id__in=instructors) | Q(location_id__in=locations))
+                .exclude(id__in=batch_ids)
+                .select_related('class_type')
+            ]
+
+    # Las sesiones del lote que no se mueven conservan su horario y ubicación
+    relocating = ('starts_at', 'instructor', 'location', 'status')
+    taken_slots.update(
+        (c['session'].class_type_id, c['starts_at']) for index, c in candidates.items() if 'starts_at' not in changes[index]
+    )
+    neighbours.extend(
+        c for index, c in candidates.items()
+        if c['status'] == Session.SessionStatus.SCHEDULED and not any(name in changes[index] for name in relocating)
+    )
+    # Un rechazo libera el horario nuevo pero la sesión se queda en el original: se marca
+    # ocupado y se vuelve a validar el lote hasta que no haya rechazos nuevos
+    while True:
+        accepted = []
+        rejected = {}
+        slots = set(taken_slots)
+        for index, candidate in candidates.items():
+            if index in errors:
+                continue
+            session = candidate['session']
+            item = changes[index]
+            slot = (session.class_type_id, candidate['starts_at'])
+            if 'starts_at' in item and slot in slots:
+                rejected[index] = {'starts_at': 'Ya existe una sesión de esta clase en ese horario'}
+                continue
+            relocated = any(name in item for name in relocating)
+            if relocated and candidate['status'] == Session.SessionStatus.SCHEDULED:
+                clash = None
+                for other in neighbours + [a for a in accepted if a['status'] == Session.SessionStatus.SCHEDULED]:
+                    if other is candidate:
+                        continue
+                    if not _overlaps(candidate['starts_at'], candidate['ends_at'], other['starts_at'], other['ends_at']):
+                        continue
+                    if candidate['instructor_id'] and other['instructor_id'] == candidate['instructor_id']:
+                        clash = {'instructor': 'El instructor tiene otra sesión en ese horario'}
+                        break
+                    if candidate['location_id'] and other['location_id'] == candidate['location_id']:
+                        clash = {'location': 'La ubicación está ocupada en ese horario'}
+                        break
+                if clash:
+                    rejected[index] = clash
+                    continue
+            slots.add(slot)
+            accepted.append(candidate)
+        if not rejected:
+            break
+        for index, clash in rejected.items():
+            errors[index] = clash
+            session = candidates[index]['session']
+            taken_slots.add((session.class_type_id, session.starts_at))
+            if session.status == Session.SessionStatus.SCHEDULED:
+                neighbours.append({
+                    'starts_at': session.starts_at,
+                    'ends_at': _session_window(session, session.starts_at)[1],
+                    'instructor_id': session.instructor_id,
+                    'location_id': session.location_id,
+                })
+
+    # Escritura en bloque: un UPDATE por combinación de campos modificados
+    by_fields = {}
+    changed = {}
+    moved = []
+    for index, candidate in candidates.items():
+        if index in errors:
+            continue
+        item = changes[index]
+        session = candidate['session']
+        fields = tuple(name for name in BULK_SESSION_FIELDS if name in item)
+        if not fields:
+            continue
+        if 'starts_at' in fields:
+            moved.append((session, session.starts_at))
+        for name in fields:
+            setattr(session, f'{name}_id' if name in ('instructor', 'location') else name, item[name])
+        by_fields.setdefault(fields, []).append(session)
+        changed[session.id] = 'cancelled' if item.get('status') == Session.SessionStatus.CANCELLED else 'update'
+    for fields, objs in by_fields.items():
+        Session.objects.bulk_update(objs, fields)
+    for session, previous_starts_at in moved:
+        move_usage(session, previous_starts_at)
+
+    if changed:
+        record_changes(studio.id, SyncChange.Entity.SESSION, changed.keys())
+        track_occupancy(*changed)
+        log_action(studio, actor, 'sessions_bulk_updated', 'session', None, {'count': len(changed)})
+        invalidate_schedule(studio.id, timetable=True)
+        # Sus próximas clases (panel, calendario) muestran el horario nuevo
+        invalidate_member(*set(
+            Booking.objects.filter(session_id__in=changed.keys()).exclude(status=Booking.BookingStatus.CANCELLED)
+            .values_list('user_id', flat=True)
+        ))
+        if notify:
+            from notifications.tasks import send_sessions_digest_notification
+            payload = {str(session_id): change for session_id, change in changed.items()}
+            transaction.on_commit(lambda: send_sessions_digest_notification.delay(payload))
+
+    error_list = [
+        {'index': index, 'id': str(changes[index]['id']), 'errors': item_errors}
+        for index, item_errors in sorted(errors.items())
+    ]
+    return [str(session_id) for session_id in changed], error_list
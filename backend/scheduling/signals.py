@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import BookingPolicy, Session, Booking, WaitlistEntry, Checkin, SyncChange, SessionOccupancy
+from .occupancy import track_occupancy, remove_occupancy
+from .policies import invalidate_policies
+from .schedule import invalidate_schedule
+from .sync import record_changes
+
+SYNC_ENTITIES = {
+    Session: SyncChange.Entity.SESSION,
+    Booking: SyncChange.Entity.BOOKING,
+    WaitlistEntry: SyncChange.Entity.WAITLIST,
+    Checkin: SyncChange.Entity.CHECKIN,
+}
+
+
+@receiver([post_save, post_delete], sender=BookingPolicy)
+def booking_policy_changed(sender, instance, **kwargs):
+    studio_id = instance.studio_id
+    transaction.on_commit(lambda: invalidate_policies(studio_id))
+
+
+@receiver([post_save, post_delete], sender=Session)
+def session_changed(sender, instance, **kwargs):
+    invalidate_schedule(instance.studio_id, timetable=True)
+
+
+@receiver(post_save, sender=Session)
+def session_saved(sender, instance, **kwargs):
+    track_occupancy(instance.pk)
+
+
+@receiver(post_delete, sender=SessionOccupancy)
+def session_occupancy_deleted(sender, instance, **kwargs):
+    remove_occupancy(instance)
+
+
+def sync_row_saved(sender, instance, **kwargs):
+    record_changes(instance.studio_id, SYNC_ENTITIES[sender], [instance.pk])
+
+
+def sync_row_deleted(sender, instance, **kwargs):
+    record_changes(instance.studio_id, SYNC_ENTITIES[sender], [instance.pk], op=SyncChange.Op.DELETE,
+                   owner_id=getattr(instance, 'user_id', None))
+
+
+for _model in SYNC_ENTITIES:
+    post_save.connect(sync_row_saved, sender=_model, dispatch_uid=f'sync-save-{_model.__name__}')
+    post_delete.connect(sync_row_deleted, sender=_model, dispatch_uid=f'sync-delete-{_model.__name__}')
@@ -0,0 +1,158 @@
+"""Per-session spot allocation (trampolines, bikes...) stored as a bitmap.
+
+All mutations run inside the booking transaction, after ``book_session`` /
+``cancel_booking`` have locked the session row, so the map needs no lock of
+its own.
+"""
+import base64
+
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Session, SessionSpotMap, SpotLayout
+
+
+def _is_taken(bitmap, spot):
+    byte = spot // 8
+    return byte < len(bitmap) and bool(bitmap[byte] & (1 << (spot % 8)))
+
+
+def _set(bitmap, spot, taken):
+    data = bytearray(bitmap)
+    byte = spot // 8
+    if byte >= len(data):
+        data.extend(b'\x00' * (byte + 1 - len(data)))
+    if taken:
+        data[byte] |= 1 << (spot % 8)
+    else:
+        data[byte] &= ~(1 << (spot % 8)) & 0xFF
+    return bytes(data)
+
+
+def pick_layout(layouts, location_id, class_type_id):
+    """Most specific of ``layouts`` for a session (location+class > class > location)."""
+    best = None
+    for layout in layouts:
+        if not (
+            (layout.location_id == location_id and layout.class_type_id == class_type_id)
+            or (layout.location_id is None and layout.class_type_id == class_type_id)
+            or (layout.location_id == location_id and layout.class_type_id is None)
+        ):
+            continue
+        score = (layout.class_type_id is not None, layout.location_id is not None)
+        if best is None or score > best[0]:
+            best = (score, layout)
+    return best[1] if best else None
+
+
+def resolve_layout(session):
+    """Most specific active layout for the session."""
+    candidates = SpotLayout.objects.filter(studio_id=session.studio_id, is_active=True).filter(
+        Q(location_id=session.location_id, class_type_id=session.class_type_id)
+        | Q(location__isnull=True, class_type_id=session.class_type_id)
+        | Q(location_id=session.location_id, class_type__isnull=True)
+    )
+    return pick_layout(candidates, session.location_id, session.class_type_id)
+
+
+def layout_for(session):
+    """Layout the session's spots follow: the one its map was created with, else the one it resolves to."""
+    spot_map = SessionSpotMap.objects.filter(session_id=session.pk).select_related('layout').first()
+    return spot_map.layout if spot_map else resolve_layout(session)
+
+
+def capacity_error(layout, capacity):
+    """Message when ``capacity`` exceeds the spots of ``layout``: every booked place needs a spot."""
+    if layout is not None and capacity > layout.spots:
+        return f'La capacidad ({capacity}) excede los {layout.spots} lugares de {layout.name}'
+    return None
+
+
+def oversized_sessions(layout):
+    """Ids of upcoming sessions that would use ``layout`` (saved or not) with more capacity than spots."""
+    if not layout.is_active:
+        return []
+    layouts = [other for other in SpotLayout.objects.filter(studio_id=layout.studio_id, is_active=True) if other.pk != layout.pk]
+    layouts.append(layout)
+    rows = Session.objects.filter(
+        studio_id=layout.studio_id, status=Session.SessionStatus.SCHEDULED, starts_at__gt=timezone.now(), capacity__gt=layout.spots,
+    )
+    if layout.class_type_id:
+        rows = rows.filter(class_type_id=layout.class_type_id)
+    if layout.location_id:
+        rows = rows.filter(location_id=layout.location_id)
+    return [
+        session_id
+        for session_id, location_id, class_type_id, mapped in rows.values_list('id', 'location_id', 'class_type_id', 'spot_map__layout_id')
+        # Una sesión con mapa conserva el layout con el que se creó
+        if (mapped == layout.pk if mapped else pick_layout(layouts, location_id, class_type_id) is layout)
+    ]
+
+
+def get_spot_map(session, create=False):
+    spot_map = SessionSpotMap.objects.filter(session=session).select_related('layout').first()
+    if spot_map or not create:
+        return spot_map
+    layout = resolve_layout(session)
+    if not layout:
+        return None
+    return SessionSpotMap.objects.create(session=session, layout=layout, bitmap=b'')
+
+
+def best_available(layout, bitmap):
+    order = layout.preferred_order or range(layout.spots)
+    for spot in order:
+        if 0 <= spot < layout.spots and not _is_taken(bitmap, spot):
+            return spot
+    return None
+
+
+def claim_spot(session, booking, spot=None):
+    """Assign ``spot`` (or the best available one) to ``booking``.
+
+    Returns the claimed index, or ``None`` when the session has no layout.
+    """
+    spot_map = get_spot_map(session, create=True)
+    if not spot_map:
+        if spot is not None:
+            raise ValidationError('Esta clase no tiene lugares asignables.')
+        return None
+    bitmap = bytes(spot_map.bitmap)
+    if spot is None:
+        spot = best_available(spot_map.layout, bitmap)
+        if spot is None:
+            raise ValidationError('No hay lugares disponibles.')
+    elif not 0 <= spot < spot_map.layout.spots:
+        raise ValidationError('Lugar inválido.')
+    elif _is_taken(bitmap, spot):
+        raise ValidationError('Ese lugar ya está ocupado.')
+
+    spot_map.bitmap = _set(bitmap, spot, True)
+    spot_map.save(update_fields=['bitmap', 'updated_at'])
+    booking.spot = spot
+    return spot
+
+
+def release_spot(session, spot):
+    if spot is None:
+        return
+    spot_map = get_spot_map(session)
+    if spot_map:
+        spot_map.bitmap = _set(bytes(spot_map.bitmap), spot, False)
+        spot_map.save(update_fields=['bitmap', 'updated_at'])
+
+
+def serialize_spot_map(session):
+    """Compact occupancy payload: spot count, labels and a base64 bitmap."""
+    spot_map = get_spot_map(session)
+    layout = spot_map.layout if spot_map else resolve_layout(session)
+    if not layout:
+        return None
+    bitmap = bytes(spot_map.bitmap) if spot_map else b''
+    return {
+        'spots': layout.spots,
+        'labels': layout.labels,
+        'taken': base64.b64encode(bitmap).decode('ascii'),
+        'available': sum(1 for i in range(layout.spots) if not _is_taken(bitmap, i)),
+    }
@@ -0,0 +1,228 @@
+"""Delta sync for kiosk and mobile clients.
+
+Every create/update/delete of sessions, bookings, waitlist entries and
+check-ins appends a ``SyncChange`` row. Clients download a day's roster once
+(snapshot) and then ask for the changes after their cursor.
+
+``seq`` is assigned at insert, not at commit, so a transaction that commits
+late can land below seqs already served. The returned cursor therefore never
+moves past rows younger than ``SAFETY_LAG``: those are delivered again on the
+next poll (upserts are idempotent), and a late commit inside the lag is still
+picked up. Rows older than ``RETENTION`` are pruned nightly; a cursor whose
+row is gone must start over from a snapshot.
+"""
+import base64
+import datetime
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from core.concurrency import bulk_transition
+from users.dashboard import invalidate_member
+from .models import Session, Booking, WaitlistEntry, Checkin, SyncChange
+from .occupancy import track_occupancy
+from .schedule import invalidate_schedule
+
+Entity = SyncChange.Entity
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+# Más que la transacción más larga que escribe cambios
+SAFETY_LAG = datetime.timedelta(seconds=30)
+RETENTION = datetime.timedelta(days=14)
+PRUNE_CHUNK = 5000
+
+
+def record_changes(studio_id, entity, ids, op=SyncChange.Op.UPSERT, owner_id=None):
+    SyncChange.objects.bulk_create([
+        SyncChange(studio_id=studio_id, entity=entity, entity_id=entity_id, op=op, owner_id=owner_id) for entity_id in ids
+    ])
+
+
+def encode_cursor(seq):
+    return base64.urlsafe_b64encode(f'v1:{seq}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        version, seq = raw.split(':', 1)
+        if version != 'v1':
+            raise ValueError(version)
+        return int(seq)
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationError({'cursor': 'Cursor inválido'})
+
+
+def _day_bounds(day):
+    start = datetime.datetime.combine(day, datetime.time.min, tzinfo=timezone.get_current_timezone())
+    return start, start + datetime.timedelta(days=1)
+
+
+def _serialize_session(session):
+    return {
+        'id': str(session.id),
+        'starts_at': session.starts_at.isoformat(),
+        'class_type': str(session.class_type_id),
+        'class_name': session.class_type.name,
+        'instructor': str(session.instructor_id) if session.instructor_id else None,
+        'location': str(session.location_id) if session.location_id else None,
+        'capacity': session.capacity,
+        'status': session.status,
+    }
+
+
+def _serialize_booking(booking):
+    return {
+        'id': str(booking.id),
+        'session': str(booking.session_id),
+        'user': str(booking.user_id),
+        'user_name': booking.user.full_name or booking.user.email,
+        'status': booking.status,
+        'spot': booking.spot,
+        'version': booking.version,
+    }
+
+
+def _serialize_waitlist(entry):
+    return {'id': str(entry.id), 'session': str(entry.session_id), 'user': str(entry.user_id), 'position': entry.position}
+
+
+def _serialize_checkin(checkin):
+    return {
+        'id': str(checkin.id),
+        'booking': str(checkin.booking_id),
+        'checked_in_at': checkin.checked_in_at.isoformat(),
+        'method': checkin.method,
+    }
+
+
+def _querysets(studio, user=None):
+    """Per-entity querysets and serializers; members only see their own bookings."""
+    bookings = Booking.objects.filter(studio=studio).select_related('user')
+    waitlist = WaitlistEntry.objects.filter(studio=studio)
+    checkins = Checkin.objects.filter(studio=studio)
+    if user is not None:
+        bookings = bookings.filter(user=user)
+        waitlist = waitlist.filter(user=user)
+        checkins = checkins.none()
+    return {
+        Entity.SESSION: (Session.objects.filter(studio=studio).select_related('class_type'), _serialize_session, 'starts_at'),
+        Entity.BOOKING: (bookings, _serialize_booking, 'session__starts_at'),
+        Entity.WAITLIST: (waitlist, _serialize_waitlist, 'session__starts_at'),
+        Entity.CHECKIN: (checkins, _serialize_checkin, 'booking__session__starts_at'),
+    }
+
+
+def snapshot(studio, day, user=None):
+    """Full roster of one day plus the cursor to continue from."""
+    # El cursor se toma antes de leer para no perder cambios concurrentes (a lo sumo se repiten)
+    seq = SyncChange.objects.filter(studio=studio).aggregate(last=Max('seq'))['last'] or 0
+    start, end = _day_bounds(day)
+    data = {}
+    for entity, (qs, serialize, date_field) in _querysets(studio, user).items():
+        qs = qs.filter(**{f'{date_field}__gte': start, f'{date_field}__lt': end})
+        if entity == Entity.BOOKING:
+            qs = qs.exclude(status=Booking.BookingStatus.CANCELLED)
+        data[entity] = [serialize(obj) for obj in qs]
+    return {'cursor': encode_cursor(seq), 'has_more': False, 'upserts': data, 'deletes': {}}
+
+
+def changes_since(studio, cursor, *, limit=DEFAULT_LIMIT, day=None, user=None):
+    """Rows changed after ``cursor``; the latest operation per row wins."""
+    after = decode_cursor(cursor)
+    if after and not SyncChange.objects.filter(studio=studio, seq=after).exists():
+        raise ValidationError({'cursor': 'Cursor expirado; descarga el día de nuevo'})
+    limit = max(1, min(limit, MAX_LIMIT))
+    events = list(
+        SyncChange.objects.filter(studio=studio, seq__gt=after)
+        .order_by('seq')
+        .values_list('seq', 'entity', 'entity_id', 'op', 'owner_id', 'created_at')[:limit + 1]
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    latest = {}
+    for seq, entity, entity_id, op, owner_id, _ in events:
+        latest[(entity, entity_id)] = op
+        # Las bajas de reservas y lista de espera de otros miembros no se revelan
+        if op == SyncChange.Op.DELETE and user is not None and entity != Entity.SESSION and owner_id != user.id:
+            del latest[(entity, entity_id)]
+
+    upserts, deletes = {}, {}
+    for entity, (qs, serialize, date_field) in _querysets(studio, user).items():
+        ids = [entity_id for (kind, entity_id), op in latest.items() if kind == entity and op == SyncChange.Op.UPSERT]
+        removed = [str(entity_id) for (kind, entity_id), op in latest.items() if kind == entity and op == SyncChange.Op.DELETE]
+        if ids:
+            qs = qs.filter(id__in=ids)
+            if day:
+                start, end = _day_bounds(day)
+                qs = qs.filter(**{f'{date_field}__gte': start, f'{date_field}__lt': end})
+            upserts[entity] = [serialize(obj) for obj in qs]
+        if removed:
+            deletes[entity] = removed
+
+    horizon = timezone.now() - SAFETY_LAG
+    next_seq = max((seq for seq, *_, created_at in events if created_at <= horizon), default=after)
+    if has_more and next_seq == after:
+        # Página llena de cambios recientes: se avanza igual para no repetirla sin fin
+        next_seq = events[-1][0]
+    return {'cursor': encode_cursor(next_seq), 'has_more': has_more, 'upserts': upserts, 'deletes': deletes}
+
+
+def prune_changes(*, now=None, chunk_size=PRUNE_CHUNK):
+    """Delete feed rows older than ``RETENTION`` in pk order, one short DELETE per chunk; returns how many."""
+    cutoff = (now or timezone.now()) - RETENTION
+    total = 0
+    while True:
+        # seq crece con created_at: recorrer la pk se detiene en la primera fila vigente
+        seqs = list(SyncChange.objects.filter(created_at__lt=cutoff).order_by('seq').values_list('seq', flat=True)[:chunk_size])
+        if not seqs:
+            return total
+        total += SyncChange.objects.filter(seq__in=seqs).delete()[0]
+
+
+@transaction.atomic
+def apply_offline_checkins(studio, items, actor=None):
+    """Apply check-ins queued offline by a kiosk in one batch.
+
+    Idempotent: bookings that already have a check-in are reported as
+    ``duplicate``. Returns one result per item, in order.
+    """
+    from core.utils import log_action
+
+    booking_ids = [item['booking'] for item in items]
+    # Las reservas se bloquean antes de leer su estado: una cancelación concurrente espera
+    # y su CAS pierde por versión, en vez de que el check-in la pise con un estado viejo
+    bookings = Booking.objects.select_for_update(of=('self',)).filter(studio=studio).in_bulk(booking_ids)
+    already = set(Checkin.objects.filter(booking_id__in=booking_ids).values_list('booking_id', flat=True))
+
+    results, to_create = [], {}
+    for item in items:
+        booking = bookings.get(item['booking'])
+        if booking is None:
+            results.append({'booking': str(item['booking']), 'result': 'error', 'detail': 'Reserva no encontrada'})
+        elif booking.id in already or booking.id in to_create:
+            results.append({'booking': str(booking.id), 'result': 'duplicate'})
+        elif booking.status not in (Booking.BookingStatus.BOOKED, Booking.BookingStatus.NO_SHOW):
+            results.append({'booking': str(booking.id), 'result': 'error', 'detail': f'Reserva en estado {booking.status}'})
+        else:
+            to_create[booking.id] = Checkin(
+                studio=studio,
+                booking=booking,
+                checked_in_at=item.get('checked_in_at') or timezone.now(),
+                method=item.get('method') or 'kiosk',
+            )
+            results.append({'booking': str(booking.id), 'result': 'created'})
+
+    if to_create:
+        created = Checkin.objects.bulk_create(to_create.values())
+        bulk_transition(Booking.objects.filter(id__in=to_create.keys()), Booking.BookingStatus.ATTENDED, allowed=Booking.TRANSITIONS)
+        record_changes(studio.id, Entity.CHECKIN, [checkin.id for checkin in created])
+        record_changes(studio.id, Entity.BOOKING, to_create.keys())
+        track_occupancy(*(checkin.booking.session_id for checkin in created))
+        invalidate_schedule(studio.id)
+        invalidate_member(*{checkin.booking.user_id for checkin in created})
+        log_action(studio, actor, 'offline_checkins_applied', 'checkin', None, {'count': len(created)})
+    return results
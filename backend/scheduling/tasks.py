@@ -0,0 +1,29 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def reconcile_occupancy_rollups(past_days=7, future_days=30):
+    """Nightly rebuild of occupancy rollups around today; logs what drifted"""
+    import datetime
+    from django.utils import timezone
+    from scheduling.occupancy import reconcile_occupancy
+
+    today = timezone.localdate()
+    stats = reconcile_occupancy(
+        start=today - datetime.timedelta(days=past_days),
+        end=today + datetime.timedelta(days=future_days),
+    )
+    if stats['sessions_fixed'] or stats['buckets_fixed']:
+        logger.warning('Occupancy rollups drifted', extra=stats)
+    return stats
+
+
+@shared_task
+def prune_sync_changes():
+    """Nightly trim of the kiosk/mobile change feed"""
+    from scheduling.sync import prune_changes
+
+    return {'deleted': prune_changes()}
@@ -1,10 +1,19 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import SessionViewSet, BookingViewSet, WaitlistEntryViewSet, CheckinViewSet
+from .views import SessionViewSet, BookingViewSet, WaitlistEntryViewSet, CheckinViewSet, SpotLayoutViewSet, BookingPolicyViewSet, SyncViewSet, OccupancyAnalyticsViewSet, member_calendar_feed, studio_calendar_feed, availability_stream
 
 router = DefaultRouter()
 router.register('sessions', SessionViewSet, basename='session')
 router.register('bookings', BookingViewSet, basename='booking')
 router.register('waitlist', WaitlistEntryViewSet, basename='waitlist')
 router.register('checkins', CheckinViewSet, basename='checkin')
+router.register('spot-layouts', SpotLayoutViewSet, basename='spot-layout')
+router.register('policies', BookingPolicyViewSet, basename='booking-policy')
+router.register('sync', SyncViewSet, basename='sync')
+router.register('analytics/occupancy', OccupancyAnalyticsViewSet, basename='occupancy-analytics')
 
-urlpatterns = router.urls
+urlpatterns = [
+    path('stream/<uuid:studio_id>/', availability_stream, name='availability-stream'),
+    path('calendar/studio/<uuid:studio_id>.ics', studio_calendar_feed, name='studio-calendar-feed'),
+    path('calendar/<str:token>.ics', member_calendar_feed, name='member-calendar-feed'),
+] + router.urls
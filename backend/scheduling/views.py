@@ -1,13 +1,26 @@
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from datetime import date, timedelta
 from django.utils import timezone
 from django.db import transaction
-from .models import Session, Booking, WaitlistEntry, Checkin
-from .serializers import SessionSerializer, BookingSerializer, WaitlistEntrySerializer, CheckinSerializer
-from .services import book_session, cancel_booking
+from .models import Session, Booking, WaitlistEntry, Checkin, SpotLayout, BookingPolicy
+from .serializers import SessionSerializer, BookingSerializer, WaitlistEntrySerializer, CheckinSerializer, SessionBulkUpdateSerializer, SpotLayoutSerializer, BookingPolicySerializer, OfflineCheckinBatchSerializer
+from .services import book_session, cancel_booking, bulk_update_sessions, mark_booking_no_show, check_in_booking, undo_check_in
+from .spots import serialize_spot_map
+from .policies import move_usage
+from .schedule import get_schedule_base, overlay_user_state
+from .ical import make_feed_token, read_feed_token, get_member_feed, get_studio_feed
+from .realtime import acquire_stream, availability_events, make_stream_token, read_stream_token
+from .occupancy import occupancy_report, GROUPINGS
+from .sync import snapshot, changes_since, apply_offline_checkins, DEFAULT_LIMIT
 from users.permissions import IsAdmin, IsStaff
 from rest_framework.exceptions import PermissionDenied
+from django.http import HttpResponse, Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from studios.models import Studio
 
 class SessionViewSet(viewsets.ModelViewSet):
     serializer_class = SessionSerializer
@@ -41,6 +54,13 @@ class SessionViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(studio=self.request.studio)
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        previous_starts_at = serializer.instance.starts_at
+        session = serializer.save()
+        if session.starts_at != previous_starts_at:
+            move_usage(session, previous_starts_at)
+
     @action(detail=True, methods=['get'], permission_classes=[IsStaff | IsAdmin])
     def bookings(self, request, pk=None):
         """Get all bookings for a specific session (for attendance list)"""
@@ -53,6 +73,54 @@ class SessionViewSet(viewsets.ModelViewSet):
         serializer = BookingSerializer(bookings, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def week(self, request):
+        """Sessions of a date range grouped by day, with the caller's booking state"""
+        studio = request.studio
+        if not studio:
+            return Response({'detail': 'Studio requerido'}, status=400)
+        try:
+            start = date.fromisoformat(request.query_params['start']) if request.query_params.get('start') else timezone.localdate()
+            days = int(request.query_params.get('days', 7))
+        except ValueError:
+            return Response({'detail': 'start (YYYY-MM-DD) o days inválidos'}, status=400)
+        if not 1 <= days <= 31:
+            return Response({'detail': 'days debe estar entre 1 y 31'}, status=400)
+        base = get_schedule_base(studio, start, days)
+        return Response({'start': start.isoformat(), 'days': overlay_user_state(base, studio, request.user, start, days)})
+
+    @action(detail=False, methods=['get'])
+    def stream(self, request):
+        """Signed URL of the studio's live availability stream (EventSource cannot send the auth header)"""
+        if not request.studio:
+            return Response({'detail': 'Studio requerido'}, status=400)
+        token = make_stream_token(request.studio.id, request.user.id)
+        url = request.build_absolute_uri(reverse('availability-stream', args=[request.studio.id]))
+        return Response({'url': f'{url}?token={token}'})
+
+    @action(detail=True, methods=['get'])
+    def spots(self, request, pk=None):
+        """Compact occupancy map for sessions with assignable spots"""
+        data = serialize_spot_map(self.get_object())
+        if data is None:
+            return Response({'detail': 'Esta clase no tiene lugares asignables'}, status=404)
+        return Response(data)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsStaff | IsAdmin])
+    def bulk_update(self, request):
+        """Apply a list of session changes (admin calendar) in one transaction"""
+        if not request.studio:
+            return Response({'detail': 'Studio requerido'}, status=400)
+        serializer = SessionBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated, errors = bulk_update_sessions(
+            studio=request.studio,
+            changes=serializer.validated_data['changes'],
+            actor=request.user,
+            notify=serializer.validated_data['notify'],
+        )
+        return Response({'updated': updated, 'errors': errors})
+
 class BookingViewSet(viewsets.ModelViewSet):
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -66,6 +134,14 @@ class BookingViewSet(viewsets.ModelViewSet):
             return Booking.objects.filter(studio=studio).select_related('user', 'session__class_type').prefetch_related('checkin')
         return Booking.objects.filter(studio=studio, user=self.request.user).select_related('user', 'session__class_type').prefetch_related('checkin')
 
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        """Subscription URL of the caller's .ics feed"""
+        if not request.studio:
+            return Response({'detail': 'Studio requerido'}, status=400)
+        token = make_feed_token(request.studio.id, request.user.id)
+        return Response({'url': request.build_absolute_uri(reverse('member-calendar-feed', args=[token]))})
+
     def create(self, request, *args, **kwargs):
         # Admin/staff users should not create client bookings
         if request.user.is_staff or request.user.has_role('admin') or request.user.has_role('staff'):
@@ -78,7 +154,15 @@ class BookingViewSet(viewsets.ModelViewSet):
             session = Session.objects.get(id=session_id, studio=request.studio)
         except Session.DoesNotExist:
             return Response({'detail': 'Sesión no encontrada'}, status=404)
-        booking = book_session(studio=request.studio, session=session, user=request.user, source=request.data.get('source', 'web'))
+        spot = request.data.get('spot')
+        if spot not in (None, ''):
+            try:
+                spot = int(spot)
+            except (TypeError, ValueError):
+                return Response({'detail': 'spot inválido'}, status=400)
+        else:
+            spot = None
+        booking = book_session(studio=request.studio, session=session, user=request.user, source=request.data.get('source', 'web'), spot=spot)
         serializer = self.get_serializer(booking)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -96,8 +180,7 @@ class BookingViewSet(viewsets.ModelViewSet):
         booking = Booking.objects.filter(pk=pk, studio=request.studio).first()
         if not booking:
             return Response({'detail': 'Reserva no encontrada'}, status=404)
-        booking.status = Booking.BookingStatus.NO_SHOW
-        booking.save(update_fields=['status'])
+        mark_booking_no_show(booking=booking, actor=request.user)
         return Response({'detail': 'Marcado como no-show'})
 
 class WaitlistEntryViewSet(viewsets.ReadOnlyModelViewSet):
@@ -124,13 +207,142 @@ class CheckinViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         checkin = serializer.save(studio=self.request.studio, checked_in_at=timezone.now())
         # Also mark the booking as attended
-        booking = checkin.booking
-        booking.status = Booking.BookingStatus.ATTENDED
-        booking.save(update_fields=['status'])
+        check_in_booking(booking=checkin.booking, actor=self.request.user)
 
+    @transaction.atomic
     def perform_destroy(self, instance):
         # Revert booking status when check-in is deleted
-        booking = instance.booking
-        booking.status = Booking.BookingStatus.BOOKED
-        booking.save(update_fields=['status'])
+        undo_check_in(booking=instance.booking, actor=self.request.user)
         instance.delete()
+
+class SpotLayoutViewSet(viewsets.ModelViewSet):
+    serializer_class = SpotLayoutSerializer
+
+    def get_permissions(self):
+        if self.action in ['list', 'retrieve']:
+            return [permissions.IsAuthenticated()]
+        return [(IsStaff | IsAdmin)()]
+
+    def get_queryset(self):
+        studio = self.request.studio
+        if not studio:
+            return SpotLayout.objects.none()
+        return SpotLayout.objects.filter(studio=studio)
+
+    def perform_create(self, serializer):
+        serializer.save(studio=self.request.studio)
+
+class BookingPolicyViewSet(viewsets.ModelViewSet):
+    serializer_class = BookingPolicySerializer
+    permission_classes = [IsStaff | IsAdmin]
+
+    def get_queryset(self):
+        studio = self.request.studio
+        if not studio:
+            return BookingPolicy.objects.none()
+        return BookingPolicy.objects.filter(studio=studio)
+
+    def perform_create(self, serializer):
+        serializer.save(studio=self.request.studio)
+
+
+class SyncViewSet(viewsets.ViewSet):
+    """Delta sync for kiosk/mobile clients: a day snapshot, then changes after a cursor"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def _is_staff(self, request):
+        return request.user.is_staff or request.user.has_role('admin') or request.user.has_role('staff')
+
+    def list(self, request):
+        studio = request.studio
+        if not studio:
+            return Response({'detail': 'Studio requerido'}, status=400)
+        params = request.query_params
+        try:
+            day = date.fromisoformat(params['date']) if params.get('date') else None
+            limit = int(params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'detail': 'date (YYYY-MM-DD) o limit inválidos'}, status=400)
+        user = None if self._is_staff(request) else request.user
+        if params.get('cursor'):
+            return Response(changes_since(studio, params['cursor'], limit=limit, day=day, user=user))
+        return Response(snapshot(studio, day or timezone.localdate(), user=user))
+
+    @action(detail=False, methods=['post'], permission_classes=[IsStaff | IsAdmin])
+    def checkins(self, request):
+        """Upload check-ins queued while the kiosk was offline"""
+        if not request.studio:
+            return Response({'detail': 'Studio requerido'}, status=400)
+        serializer = OfflineCheckinBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = apply_offline_checkins(request.studio, serializer.validated_data['checkins'], actor=request.user)
+        return Response({'results': results})
+
+
+class OccupancyAnalyticsViewSet(viewsets.ViewSet):
+    """Occupancy by class type, instructor, weekday, hour or day, read from the rollups"""
+    permission_classes = [IsStaff | IsAdmin]
+
+    def list(self, request):
+        studio = request.studio
+        if not studio:
+            return Response({'detail': 'Studio requerido'}, status=400)
+        params = request.query_params
+        today = timezone.localdate()
+        try:
+            end = date.fromisoformat(params['to']) if params.get('to') else today + timedelta(days=1)
+            start = date.fromisoformat(params['from']) if params.get('from') else end - timedelta(days=30)
+        except ValueError:
+            return Response({'detail': 'from/to deben tener formato YYYY-MM-DD'}, status=400)
+        group_by = params.get('group_by', 'class_type')
+        if group_by not in GROUPINGS:
+            return Response({'detail': f'group_by debe ser uno de: {", ".join(GROUPINGS)}'}, status=400)
+        if start >= end or (end - start).days > 400:
+            return Response({'detail': 'Rango inválido (máximo 400 días)'}, status=400)
+        return Response({
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'group_by': group_by,
+            'results': occupancy_report(studio, start, end, group_by),
+        })
+
+
+def _ical_response(request, feed, cache_control):
+    if feed is None:
+        raise Http404
+    response = get_conditional_response(request, etag=feed['etag'], last_modified=feed['last_modified'])
+    if response is None:
+        response = HttpResponse(feed['body'], content_type='text/calendar; charset=utf-8')
+    response['ETag'] = feed['etag']
+    response['Last-Modified'] = http_date(feed['last_modified'])
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def member_calendar_feed(request, token):
+    """Tokenized per-member .ics feed; served from cache without touching the database"""
+    ids = read_feed_token(token)
+    if ids is None:
+        raise Http404
+    return _ical_response(request, get_member_feed(*ids), 'private, max-age=300')
+
+
+def studio_calendar_feed(request, studio_id):
+    """Public studio timetable as .ics"""
+    return _ical_response(request, get_studio_feed(studio_id), 'public, max-age=300')
+
+
+async def availability_stream(request, studio_id):
+    """Server-Sent Events with occupancy deltas of a studio's sessions (needs the ASGI server)"""
+    ids = read_stream_token(request.GET.get('token', ''))
+    if ids is None or ids[0] != str(studio_id):
+        return HttpResponse('Token inválido o expirado', status=403, content_type='text/plain; charset=utf-8')
+    if not await Studio.objects.filter(pk=studio_id).aexists():
+        raise Http404
+    client_id = ids[1]
+    if not await acquire_stream(client_id):
+        return HttpResponse('Demasiadas conexiones abiertas', status=429, content_type='text/plain; charset=utf-8')
+    response = StreamingHttpResponse(availability_events(studio_id, client_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import timedelta
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from catalog.models import ClassType
+from commerce.models import UserCredit
+from core.pubsub import InMemoryBroker
+from scheduling.models import Session
+from scheduling.services import book_session, cancel_booking
+from scheduling.realtime import acquire_stream, make_stream_token
+from scheduling.views import availability_stream
+from studios.models import Studio
+from users.models import User
+
+
+@patch('notifications.tasks.send_cancellation_email.delay')
+@patch('notifications.tasks.send_booking_confirmation.delay')
+class AvailabilityStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.studio = Studio.objects.create(name='Live Studio', brand_json={})
+        class_type = ClassType.objects.create(studio=self.studio, name='RUSH', duration_minutes=50)
+        self.session = Session.objects.create(studio=self.studio, class_type=class_type, starts_at=timezone.now() + timedelta(days=1), capacity=2)
+        self.user = User.objects.create_user(email='live@example.com', password='pass')
+        UserCredit.objects.create(studio=self.studio, user=self.user, credits_total=3)
+        self.broker = InMemoryBroker()
+        patcher = patch('scheduling.realtime.get_broker', return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def _request(self, studio_id=None, token=None):
+        studio_id = studio_id or self.studio.id
+        token = make_stream_token(studio_id, self.user.id) if token is None else token
+        request = RequestFactory().get(f'/api/scheduling/stream/{studio_id}/', {'token': token})
+        # async_to_sync ejecuta las consultas async en este hilo, dentro de la transacción del test
+        return async_to_sync(availability_stream)(request, studio_id)
+
+    def _open_stream(self):
+        response = self._request()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        first = self.loop.run_until_complete(anext(events))
+        self.assertIn(b'retry:', first)
+        return events
+
+    def _next(self, events):
+        return self.loop.run_until_complete(asyncio.wait_for(anext(events), 1)).decode()
+
+    def test_booking_and_cancellation_push_occupancy(self, *_):
+        events = self._open_stream()
+        self.assertEqual(self.broker.hub.subscriber_count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = book_session(studio=self.studio, session=self.session, user=self.user)
+        message = self._next(events)
+        self.assertTrue(message.startswith('event: availability\n'))
+        self.assertIn('"booked":1', message)
+        self.assertIn('"spots_left":1', message)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel_booking(booking=booking, actor=self.user)
+        self.assertIn('"spots_left":2', self._next(events))
+
+    def test_stream_ends_after_max_lifetime(self, *_):
+        with patch('scheduling.realtime.MAX_STREAM_SECONDS', 0.2):
+            events = self._open_stream()
+            self.assertEqual(self.broker.hub.subscriber_count(), 1)
+            with self.assertRaises(StopAsyncIteration):
+                while True:
+                    self._next(events)
+        self.assertEqual(self.broker.hub.subscriber_count(), 0)
+
+    def test_stream_requires_a_valid_token(self, *_):
+        self.assertEqual(self._request(token='').status_code, 403)
+        other = Studio.objects.create(name='Other', brand_json={})
+        self.assertEqual(self._request(token=make_stream_token(other.id, self.user.id)).status_code, 403)
+
+    def test_unknown_studio_is_not_found(self, *_):
+        from django.http import Http404
+        with self.assertRaises(Http404):
+            self._request(studio_id='00000000-0000-0000-0000-000000000001')
+
+    def test_concurrent_streams_per_client_are_capped(self, *_):
+        with patch('scheduling.realtime.MAX_STREAMS_PER_CLIENT', 1), patch('scheduling.realtime.MAX_STREAM_SECONDS', 0.2):
+            events = self._open_stream()
+            self.assertEqual(self._request().status_code, 429)
+            with self.assertRaises(StopAsyncIteration):
+                while True:
+                    self._next(events)
+            # Al terminar el stream se libera su lugar
+            self.assertEqual(self._request().status_code, 200)
+
+    def test_each_slot_refreshes_the_counter_ttl(self, *_):
+        with patch('scheduling.realtime.MAX_STREAM_SECONDS', 10), patch.object(cache, 'atouch', wraps=cache.atouch) as touch:
+            async_to_sync(acquire_stream)(self.user.id)
+            async_to_sync(acquire_stream)(self.user.id)
+        self.assertEqual(touch.call_count, 2)
+        self.assertEqual(touch.call_args.args[1], 70)
+
+    def test_slow_client_keeps_latest_messages(self, *_):
+        async def fill():
+            subscription = self.broker.subscribe('availability:x')
+            for index in range(150):
+                subscription.offer({'n': index})
+            return subscription
+
+        subscription = self.loop.run_until_complete(fill())
+        self.assertEqual(subscription.queue.qsize(), 100)
+        self.assertEqual(self.loop.run_until_complete(subscription.get())['n'], 50)
@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from catalog.models import Product
+from commerce.models import EntitlementSummary, UserCredit, UserMembership
+from studios.models import Studio
+from users.models import User
+
+
+class BalanceBatchTests(APITestCase):
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Batch Studio', brand_json={})
+        product = Product.objects.create(studio=self.studio, type=Product.ProductType.MEMBERSHIP, name='Mensual', price_cents=1000)
+        self.members = [User.objects.create_user(email=f'batch{i}@example.com', password='pass', studio=self.studio) for i in range(3)]
+        self.expires_at = timezone.now() + timedelta(days=10)
+        UserCredit.objects.create(studio=self.studio, user=self.members[0], credits_total=4, credits_used=1, expires_at=self.expires_at)
+        UserMembership.objects.create(studio=self.studio, user=self.members[1], product=product)
+        staff = User.objects.create_user(email='batch-staff@example.com', password='pass', studio=self.studio)
+        staff.add_role('staff')
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_STUDIO_ID=str(self.studio.id))
+        self.client.force_authenticate(user=staff)
+
+    def test_post_returns_balance_per_member(self):
+        resp = self.client.post('/api/commerce/credits/balances/', {'users': [str(m.id) for m in self.members]}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        results = {row['user']: row for row in resp.data['results']}
+        self.assertEqual(results[str(self.members[0].id)]['credits_available'], 3)
+        self.assertEqual(results[str(self.members[0].id)]['next_credit_expiration'], self.expires_at)
+        self.assertTrue(results[str(self.members[1].id)]['has_active_membership'])
+        self.assertEqual(results[str(self.members[2].id)]['credits_available'], 0)
+
+    def test_post_ignores_ids_outside_the_studio(self):
+        other = User.objects.create_user(email='other@example.com', password='pass',
+                                         studio=Studio.objects.create(name='Other', brand_json={}))
+        missing = '00000000-0000-0000-0000-000000000001'
+        resp = self.client.post('/api/commerce/credits/balances/', {'users': [str(self.members[0].id), str(other.id), missing]}, format='json')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([row['user'] for row in resp.data['results']], [str(self.members[0].id)])
+        self.assertEqual(resp.data['unknown'], sorted([str(other.id), missing]))
+        self.assertFalse(EntitlementSummary.objects.filter(user=other).exists())
+
+    def test_query_count_does_not_grow_with_members(self):
+        self.client.get('/api/commerce/credits/balances/')
+        more = [User(email=f'batch-more{i}@example.com', studio=self.studio) for i in range(20)]
+        User.objects.bulk_create(more)
+        # studio + rol + directorio + resúmenes + créditos + membresías + alta de resúmenes (con su savepoint)
+        with self.assertNumQueries(9):
+            resp = self.client.get('/api/commerce/credits/balances/', {'is_active': 'true'})
+        self.assertEqual(len(resp.data['results']), 24)
+        with self.assertNumQueries(4):
+            self.client.get('/api/commerce/credits/balances/', {'is_active': 'true'})
+
+    def test_members_cannot_use_batch_endpoint(self):
+        client = APIClient()
+        client.credentials(HTTP_X_STUDIO_ID=str(self.studio.id))
+        client.force_authenticate(user=self.members[0])
+        self.assertEqual(client.get('/api/commerce/credits/balances/').status_code, 403)
@@ -0,0 +1,165 @@
+import threading
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from catalog.models import ClassType
+from commerce.models import CreditMovement, UserCredit
+from core.concurrency import compare_and_swap
+from scheduling.models import Session, Booking, WaitlistEntry
+from scheduling.services import book_session, cancel_booking, mark_booking_no_show, check_in_booking
+from studios.models import Studio
+from users.models import User
+
+
+@patch('notifications.tasks.send_cancellation_email.delay')
+@patch('notifications.tasks.send_booking_confirmation.delay')
+class BookingConcurrencyTests(TestCase):
+    """Stale copies stand in for concurrent requests that read the row before the other one wrote it."""
+
+    def setUp(self):
+        self.studio = Studio.objects.create(name='CAS Studio', brand_json={})
+        class_type = ClassType.objects.create(studio=self.studio, name='BURN', duration_minutes=50)
+        self.sessions = [
+            Session.objects.create(studio=self.studio, class_type=class_type, starts_at=timezone.now() + timedelta(days=1, hours=i), capacity=5)
+            for i in range(2)
+        ]
+        self.user = User.objects.create_user(email='cas@example.com', password='pass')
+        self.credit = UserCredit.objects.create(studio=self.studio, user=self.user, credits_total=5)
+
+    def test_concurrent_cancellations_refund_once(self, *_):
+        booking = book_session(studio=self.studio, session=self.sessions[0], user=self.user)
+        book_session(studio=self.studio, session=self.sessions[1], user=self.user)
+        member_copy = Booking.objects.get(pk=booking.pk)
+        staff_copy = Booking.objects.get(pk=booking.pk)
+
+        cancel_booking(booking=member_copy)
+        cancel_booking(booking=staff_copy)
+
+        self.credit.refresh_from_db()
+        self.assertEqual(self.credit.credits_used, 1)
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, Booking.BookingStatus.CANCELLED)
+
+    def test_stale_no_show_does_not_overwrite_cancellation(self, *_):
+        booking = book_session(studio=self.studio, session=self.sessions[0], user=self.user)
+        staff_copy = Booking.objects.get(pk=booking.pk)
+        cancel_booking(booking=booking)
+
+        with self.assertRaises(ValidationError):
+            mark_booking_no_show(booking=staff_copy)
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, Booking.BookingStatus.CANCELLED)
+
+    def test_compare_and_swap_rejects_stale_version(self, *_):
+        booking = book_session(studio=self.studio, session=self.sessions[0], user=self.user)
+        stale = Booking.objects.get(pk=booking.pk)
+        check_in_booking(booking=booking)
+
+        self.assertFalse(compare_and_swap(stale, status=Booking.BookingStatus.NO_SHOW))
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, Booking.BookingStatus.ATTENDED)
+        self.assertEqual(booking.version, 1)
+
+    def test_cancelled_waitlist_booking_is_not_promoted(self, *_):
+        session = self.sessions[0]
+        Session.objects.filter(pk=session.pk).update(capacity=1)
+        session.refresh_from_db()
+        holder = User.objects.create_user(email='holder@example.com', password='pass')
+        UserCredit.objects.create(studio=self.studio, user=holder, credits_total=5)
+        booked = book_session(studio=self.studio, session=session, user=holder)
+        waiting = book_session(studio=self.studio, session=session, user=self.user)
+
+        cancel_booking(booking=waiting)
+        self.assertFalse(WaitlistEntry.objects.filter(session=session).exists())
+        cancel_booking(booking=booked)
+
+        self.assertEqual(Booking.objects.get(pk=waiting.pk).status, Booking.BookingStatus.CANCELLED)
+        self.credit.refresh_from_db()
+        self.assertEqual(self.credit.credits_used, 0)
+
+    def test_promotion_skips_stale_waitlist_entries(self, *_):
+        session = self.sessions[0]
+        Session.objects.filter(pk=session.pk).update(capacity=1)
+        session.refresh_from_db()
+        holder = User.objects.create_user(email='holder@example.com', password='pass')
+        UserCredit.objects.create(studio=self.studio, user=holder, credits_total=5)
+        booked = book_session(studio=self.studio, session=session, user=holder)
+        stale = book_session(studio=self.studio, session=session, user=self.user)
+        # Entrada que quedó de antes del arreglo: la reserva ya está cancelada
+        Booking.objects.filter(pk=stale.pk).update(status=Booking.BookingStatus.CANCELLED)
+        later = User.objects.create_user(email='later@example.com', password='pass')
+        UserCredit.objects.create(studio=self.studio, user=later, credits_total=5)
+        waiting = book_session(studio=self.studio, session=session, user=later)
+
+        cancel_booking(booking=booked)
+
+        self.assertEqual(Booking.objects.get(pk=stale.pk).status, Booking.BookingStatus.CANCELLED)
+        self.assertEqual(Booking.objects.get(pk=waiting.pk).status, Booking.BookingStatus.BOOKED)
+        self.assertFalse(WaitlistEntry.objects.filter(session=session).exists())
+
+
+@skipUnlessDBFeature('has_select_for_update')
+@patch('notifications.tasks.send_cancellation_email.delay')
+@patch('notifications.tasks.send_booking_confirmation.delay')
+class ParallelBookingTests(TransactionTestCase):
+    """Real concurrent transactions; needs a database with row locking (Postgres)."""
+
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Race Studio', brand_json={})
+        class_type = ClassType.objects.create(studio=self.studio, name='BURN', duration_minutes=50)
+        self.session = Session.objects.create(studio=self.studio, class_type=class_type,
+                                              starts_at=timezone.now() + timedelta(days=1), capacity=1)
+
+    def _race(self, target, args):
+        barrier = threading.Barrier(len(args))
+        errors = []
+
+        def run(arg):
+            try:
+                barrier.wait()
+                target(arg)
+            except Exception as exc:  # pragma: no cover - reported below
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(arg,)) for arg in args]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_parallel_bookings_fill_the_last_spot_once(self, *_):
+        users = []
+        for i in range(6):
+            user = User.objects.create_user(email=f'race{i}@example.com', password='pass')
+            UserCredit.objects.create(studio=self.studio, user=user, credits_total=1)
+            users.append(user)
+
+        errors = self._race(lambda user: book_session(studio=self.studio, session=self.session, user=user), users)
+
+        self.assertEqual(errors, [])
+        statuses = list(Booking.objects.filter(session=self.session).values_list('status', flat=True))
+        self.assertEqual(statuses.count(Booking.BookingStatus.BOOKED), 1)
+        self.assertEqual(statuses.count(Booking.BookingStatus.WAITLIST), 5)
+
+    def test_parallel_cancellations_refund_once(self, *_):
+        user = User.objects.create_user(email='race-cancel@example.com', password='pass')
+        credit = UserCredit.objects.create(studio=self.studio, user=user, credits_total=5)
+        other = Session.objects.create(studio=self.studio, class_type=self.session.class_type,
+                                       starts_at=self.session.starts_at + timedelta(hours=2), capacity=1)
+        booking = book_session(studio=self.studio, session=self.session, user=user)
+        # Un segundo crédito usado: un reembolso doble no queda oculto por el tope en cero
+        book_session(studio=self.studio, session=other, user=user)
+
+        errors = self._race(lambda _: cancel_booking(booking=Booking.objects.get(pk=booking.pk)), range(4))
+
+        self.assertEqual(errors, [])
+        credit.refresh_from_db()
+        self.assertEqual(credit.credits_used, 1)
+        self.assertEqual(CreditMovement.objects.filter(credit=credit, kind=CreditMovement.Kind.REFUND).count(), 1)
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, Booking.BookingStatus.CANCELLED)
@@ -0,0 +1,87 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from catalog.models import ClassType
+from commerce.models import UserCredit
+from scheduling.models import Session, BookingPolicy, BookingUsageCounter
+from scheduling.policies import invalidate_policies, record_usage
+from scheduling.services import book_session, bulk_update_sessions, cancel_booking
+from studios.models import Studio
+from users.models import User
+
+
+@patch('notifications.tasks.send_cancellation_email.delay')
+@patch('notifications.tasks.send_booking_confirmation.delay')
+class BookingPolicyTests(TestCase):
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Policy Studio', brand_json={})
+        self.class_type = ClassType.objects.create(studio=self.studio, name='FIT TRAINING', duration_minutes=50)
+        self.user = User.objects.create_user(email='policy@example.com', password='pass')
+        UserCredit.objects.create(studio=self.studio, user=self.user, credits_total=10)
+        self.day = (timezone.now() + timedelta(days=2)).replace(hour=15, minute=0, second=0, microsecond=0)
+
+    def _session(self, **kwargs):
+        return Session.objects.create(
+            studio=self.studio,
+            class_type=self.class_type,
+            starts_at=kwargs.pop('starts_at', self.day),
+            capacity=10,
+            **kwargs,
+        )
+
+    def _policy(self, kind, value):
+        BookingPolicy.objects.create(studio=self.studio, kind=kind, value=value)
+        invalidate_policies(self.studio.id)
+
+    def test_daily_cap_uses_counters_and_cancellation_frees_slot(self, *_):
+        self._policy(BookingPolicy.PolicyKind.MAX_PER_DAY, 1)
+        first = book_session(studio=self.studio, session=self._session(), user=self.user)
+        second_session = self._session(starts_at=self.day + timedelta(hours=2))
+
+        with self.assertRaises(ValidationError):
+            book_session(studio=self.studio, session=second_session, user=self.user)
+
+        cancel_booking(booking=first)
+        counter = BookingUsageCounter.objects.get(user=self.user, period='day', scope='')
+        self.assertEqual(counter.count, 0)
+        book_session(studio=self.studio, session=second_session, user=self.user)
+
+    def test_cap_is_enforced_by_the_increment(self, *_):
+        self._policy(BookingPolicy.PolicyKind.MAX_PER_DAY, 1)
+        session = self._session()
+        book_session(studio=self.studio, session=session, user=self.user)
+
+        # Una reserva concurrente que leyó el contador antes de este incremento
+        with self.assertRaises(ValidationError):
+            record_usage(studio=self.studio, user=self.user, session=session, enforce=True)
+        self.assertEqual(BookingUsageCounter.objects.get(user=self.user, period='day', scope='').count, 1)
+
+    def test_moving_a_session_moves_its_counters(self, *_):
+        self._policy(BookingPolicy.PolicyKind.MAX_PER_DAY, 1)
+        session = self._session()
+        booking = book_session(studio=self.studio, session=session, user=self.user)
+        next_week = self.day + timedelta(days=7)
+
+        bulk_update_sessions(studio=self.studio, changes=[{'id': session.id, 'starts_at': next_week}], notify=False)
+
+        counts = dict(BookingUsageCounter.objects.filter(user=self.user, period='day', scope='').values_list('period_start', 'count'))
+        self.assertEqual(counts, {self.day.date(): 0, next_week.date(): 1})
+        book_session(studio=self.studio, session=self._session(starts_at=self.day + timedelta(hours=2)), user=self.user)
+        booking.refresh_from_db()
+        cancel_booking(booking=booking)
+        self.assertEqual(BookingUsageCounter.objects.get(user=self.user, period='day', period_start=next_week.date(), scope='').count, 0)
+
+    def test_booking_window_rules(self, *_):
+        self._policy(BookingPolicy.PolicyKind.OPENS_BEFORE, 24 * 60)
+        with self.assertRaises(ValidationError):
+            book_session(studio=self.studio, session=self._session(), user=self.user)
+
+        soon = self._session(starts_at=timezone.now() + timedelta(minutes=20))
+        self._policy(BookingPolicy.PolicyKind.CLOSES_BEFORE, 30)
+        with self.assertRaises(ValidationError):
+            book_session(studio=self.studio, session=soon, user=self.user)
+        self.assertEqual(UserCredit.objects.get(user=self.user).credits_used, 0)
@@ -0,0 +1,91 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db.models import F, Sum
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from catalog.models import ClassType
+from commerce.ledger import check_credit_ledger
+from commerce.models import CreditMovement, UserCredit
+from commerce.tasks import check_credit_ledger_nightly
+from commerce.services import get_user_balance
+from scheduling.models import Session
+from scheduling.services import book_session, cancel_booking
+from studios.models import Studio
+from users.models import User
+
+
+@patch('notifications.tasks.send_cancellation_email.delay')
+@patch('notifications.tasks.send_booking_confirmation.delay')
+class CreditLedgerTests(APITestCase):
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Ledger Studio', brand_json={})
+        class_type = ClassType.objects.create(studio=self.studio, name='RUSH', duration_minutes=50)
+        starts = timezone.now() + timedelta(days=1)
+        self.sessions = [
+            Session.objects.create(studio=self.studio, class_type=class_type, starts_at=starts + timedelta(hours=i), capacity=5)
+            for i in range(3)
+        ]
+        self.user = User.objects.create_user(email='ledger@example.com', password='pass')
+        self.credit = UserCredit.objects.create(studio=self.studio, user=self.user, credits_total=5)
+
+    def _ledger(self):
+        return CreditMovement.objects.filter(credit=self.credit).aggregate(total=Sum('delta'))['total'] or 0
+
+    def test_bookings_and_cancellations_append_movements(self, *_):
+        first = book_session(studio=self.studio, session=self.sessions[0], user=self.user)
+        book_session(studio=self.studio, session=self.sessions[1], user=self.user)
+        cancel_booking(booking=first, actor=self.user)
+        book_session(studio=self.studio, session=self.sessions[0], user=self.user)
+
+        kinds = list(CreditMovement.objects.filter(credit=self.credit).order_by('id').values_list('kind', 'delta'))
+        self.assertEqual(kinds, [('consume', 1), ('consume', 1), ('refund', -1), ('consume', 1)])
+        self.credit.refresh_from_db()
+        self.assertEqual((self.credit.credits_used, self._ledger()), (2, 2))
+        self.assertEqual(check_credit_ledger(studio_id=self.studio.id)['booking_drift'], 0)
+
+    def test_checker_reports_and_repairs_drift(self, *_):
+        book_session(studio=self.studio, session=self.sessions[0], user=self.user)
+        # Un incremento perdido fuera del libro, como el de una carrera
+        UserCredit.objects.filter(pk=self.credit.pk).update(credits_used=F('credits_used') + 2)
+
+        report = check_credit_ledger()
+        self.assertEqual({k: report[k] for k in ('credits', 'ledger_drift', 'booking_drift', 'repaired')},
+                         {'credits': 1, 'ledger_drift': 1, 'booking_drift': 1, 'repaired': 0})
+        self.assertEqual(report['samples'], [{
+            'credit': str(self.credit.id), 'user': str(self.user.id), 'credits_used': 3, 'ledger': 1, 'bookings': 1,
+        }])
+
+        self.assertEqual(check_credit_ledger(repair=True, batch_size=1)['repaired'], 1)
+        self.credit.refresh_from_db()
+        self.assertEqual((self.credit.credits_used, self._ledger()), (1, 1))
+        self.assertEqual(get_user_balance(studio=self.studio, user=self.user)['credits_available'], 4)
+        clean = check_credit_ledger()
+        self.assertEqual((clean['ledger_drift'], clean['booking_drift']), (0, 0))
+
+    def test_missing_movement_is_repaired_in_the_ledger_only(self, *_):
+        book_session(studio=self.studio, session=self.sessions[0], user=self.user)
+        CreditMovement.objects.filter(credit=self.credit).delete()
+
+        stats = check_credit_ledger(repair=True)
+
+        self.assertEqual((stats['ledger_drift'], stats['booking_drift']), (1, 0))
+        self.assertEqual(list(CreditMovement.objects.values_list('kind', 'delta')), [('repair', 1)])
+        self.credit.refresh_from_db()
+        self.assertEqual(self.credit.credits_used, 1)
+
+    def test_nightly_check_only_reports_unless_repair_enabled(self, *_):
+        book_session(studio=self.studio, session=self.sessions[0], user=self.user)
+        UserCredit.objects.filter(pk=self.credit.pk).update(credits_used=F('credits_used') + 2)
+
+        with self.assertLogs('commerce.tasks', 'WARNING'):
+            self.assertEqual(check_credit_ledger_nightly()['repaired'], 0)
+        self.credit.refresh_from_db()
+        self.assertEqual(self.credit.credits_used, 3)
+
+        with override_settings(CREDIT_LEDGER_AUTO_REPAIR=True):
+            self.assertEqual(check_credit_ledger_nightly()['repaired'], 1)
+        self.credit.refresh_from_db()
+        self.assertEqual(self.credit.credits_used, 1)
@@ -0,0 +1,66 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from catalog.models import ClassType, Product
+from commerce.entitlements import check_entitlements
+from commerce.models import EntitlementSummary, UserCredit, UserMembership
+from commerce.services import get_user_balance
+from scheduling.models import Session
+from scheduling.services import book_session, cancel_booking
+from studios.models import Studio
+from users.models import User
+
+
+@patch('notifications.tasks.send_cancellation_email.delay')
+@patch('notifications.tasks.send_booking_confirmation.delay')
+class EntitlementSummaryTests(APITestCase):
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Wallet Studio', brand_json={})
+        class_type = ClassType.objects.create(studio=self.studio, name='RUSH', duration_minutes=50)
+        self.session = Session.objects.create(studio=self.studio, class_type=class_type, starts_at=timezone.now() + timedelta(days=1), capacity=5)
+        self.user = User.objects.create_user(email='wallet@example.com', password='pass')
+        now = timezone.now()
+        self.later = UserCredit.objects.create(studio=self.studio, user=self.user, credits_total=5, expires_at=now + timedelta(days=30))
+        self.sooner = UserCredit.objects.create(studio=self.studio, user=self.user, credits_total=1, expires_at=now + timedelta(days=3))
+
+    def test_balance_is_a_single_lookup(self, *_):
+        with self.assertNumQueries(1):
+            balance = get_user_balance(studio=self.studio, user=self.user)
+        self.assertEqual(balance['credits_available'], 6)
+        self.assertEqual(balance['next_credit_expiration'], self.sooner.expires_at)
+        self.assertEqual([bucket['remaining'] for bucket in balance['credit_buckets']], [1, 5])
+
+    def test_booking_consumes_soonest_credit_and_cancel_refunds(self, *_):
+        booking = book_session(studio=self.studio, session=self.session, user=self.user)
+        self.assertEqual(booking.credit_id, self.sooner.id)
+        summary = EntitlementSummary.objects.get(studio=self.studio, user=self.user)
+        self.assertEqual(summary.credits_available, 5)
+        self.assertEqual(summary.credit_buckets[0]['credit'], str(self.later.id))
+
+        cancel_booking(booking=booking, actor=self.user)
+        self.assertEqual(get_user_balance(studio=self.studio, user=self.user)['credits_available'], 6)
+
+    def test_expired_credit_drops_out_on_read(self, *_):
+        get_user_balance(studio=self.studio, user=self.user)
+        UserCredit.objects.filter(pk=self.sooner.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        EntitlementSummary.objects.filter(user=self.user).update(valid_until=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(get_user_balance(studio=self.studio, user=self.user)['credits_available'], 5)
+
+    def test_membership_wins_and_checker_repairs_drift(self, *_):
+        product = Product.objects.create(studio=self.studio, type=Product.ProductType.MEMBERSHIP, name='Mensual', price_cents=1000)
+        membership = UserMembership.objects.create(studio=self.studio, user=self.user, product=product, ends_at=timezone.now() + timedelta(days=30))
+        booking = book_session(studio=self.studio, session=self.session, user=self.user)
+        self.assertEqual((booking.membership_id, booking.credit_id), (membership.id, None))
+
+        # Cambios directos que se saltan las señales
+        UserMembership.objects.filter(pk=membership.pk).update(status='paused')
+        UserCredit.objects.filter(pk=self.later.pk).update(credits_used=2)
+        self.assertEqual(check_entitlements(), {'checked': 1, 'missing': 0, 'mismatched': 1, 'repaired': 0})
+        check_entitlements(repair=True)
+        balance = get_user_balance(studio=self.studio, user=self.user)
+        self.assertFalse(balance['has_active_membership'])
+        self.assertEqual(balance['credits_available'], 4)
+        self.assertEqual(check_entitlements()['mismatched'], 0)
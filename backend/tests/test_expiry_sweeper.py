@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from catalog.models import Product
+from commerce.expiry import expire_entitlements
+from commerce.models import UserCredit, UserMembership
+from commerce.services import get_user_balance
+from core.models import AuditLog
+from studios.models import Studio
+from users.models import User
+
+
+class ExpirySweeperTests(TestCase):
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Studio', brand_json={})
+        self.user = User.objects.create_user(email='sweep@example.com', password='pass', studio=self.studio)
+        self.plan = Product.objects.create(studio=self.studio, type=Product.ProductType.MEMBERSHIP, name='Mensual', price_cents=1000)
+        now = timezone.now()
+        self.expired_credits = [
+            UserCredit.objects.create(studio=self.studio, user=self.user, credits_total=5, credits_used=i, expires_at=now - timedelta(days=i + 1))
+            for i in range(3)
+        ]
+        self.live_credit = UserCredit.objects.create(studio=self.studio, user=self.user, credits_total=4, expires_at=now + timedelta(days=3))
+        self.open_credit = UserCredit.objects.create(studio=self.studio, user=self.user, credits_total=2, expires_at=None)
+        self.lapsed = UserMembership.objects.create(studio=self.studio, user=self.user, product=self.plan, ends_at=now - timedelta(days=1))
+        self.paused = UserMembership.objects.create(studio=self.studio, user=self.user, product=self.plan, status='paused', ends_at=now - timedelta(hours=1))
+        self.cancelled = UserMembership.objects.create(studio=self.studio, user=self.user, product=self.plan, status='cancelled', ends_at=now - timedelta(days=1))
+        self.current = UserMembership.objects.create(studio=self.studio, user=self.user, product=self.plan, ends_at=now + timedelta(days=10))
+
+    def test_expires_lapsed_rows_in_chunks_and_records_them(self):
+        balance_before = get_user_balance(studio=self.studio, user=self.user)
+
+        self.assertEqual(expire_entitlements(chunk_size=2), {'credits': 3, 'memberships': 2})
+
+        statuses = dict(UserCredit.objects.values_list('pk', 'status'))
+        self.assertEqual({statuses[c.pk] for c in self.expired_credits}, {UserCredit.Status.EXPIRED})
+        self.assertEqual(statuses[self.live_credit.pk], UserCredit.Status.ACTIVE)
+        self.assertEqual(statuses[self.open_credit.pk], UserCredit.Status.ACTIVE)
+        memberships = dict(UserMembership.objects.values_list('pk', 'status'))
+        self.assertEqual(memberships[self.lapsed.pk], 'expired')
+        self.assertEqual(memberships[self.paused.pk], 'expired')
+        self.assertEqual(memberships[self.cancelled.pk], 'cancelled')
+        self.assertEqual(memberships[self.current.pk], 'active')
+        self.assertEqual(UserCredit.objects.get(pk=self.expired_credits[0].pk).version, 1)
+
+        logged = AuditLog.objects.filter(action='credit_expired')
+        self.assertEqual(set(logged.values_list('entity_id', flat=True)), {c.pk for c in self.expired_credits})
+        self.assertEqual(AuditLog.objects.filter(action='membership_expired', entity_id=self.paused.pk).get().meta['status'], 'paused')
+
+        self.assertEqual(get_user_balance(studio=self.studio, user=self.user), balance_before)
+        self.assertEqual(expire_entitlements(), {'credits': 0, 'memberships': 0})
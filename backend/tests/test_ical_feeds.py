@@ -0,0 +1,90 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from catalog.models import ClassType
+from commerce.models import UserCredit
+from scheduling.models import Session
+from scheduling.services import book_session
+from studios.models import Studio
+from users.models import User
+
+
+class ICalFeedTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.studio = Studio.objects.create(name='Feed Studio', brand_json={})
+        class_type = ClassType.objects.create(studio=self.studio, name='FIT TRAINING', duration_minutes=50)
+        self.session = Session.objects.create(studio=self.studio, class_type=class_type, starts_at=timezone.now() + timedelta(days=1), capacity=5)
+        self.user = User.objects.create_user(email='feed@example.com', password='pass', studio=self.studio)
+        UserCredit.objects.create(studio=self.studio, user=self.user, credits_total=3)
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_STUDIO_ID=str(self.studio.id))
+        self.client.force_authenticate(user=self.user)
+
+    def _feed_url(self):
+        url = self.client.get('/api/scheduling/bookings/calendar/').data['url']
+        return url.replace('http://testserver', '')
+
+    @patch('notifications.tasks.send_booking_confirmation.delay')
+    def test_member_feed_is_cached_and_refreshed_on_booking(self, _):
+        url = self._feed_url()
+        feed = APIClient()
+        resp = feed.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertNotIn(b'BEGIN:VEVENT', resp.content)
+
+        with self.assertNumQueries(0):
+            cached = feed.get(url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_session(studio=self.studio, session=self.session, user=self.user)
+
+        resp = feed.get(url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(f'UID:{self.session.bookings.get().id}@33fitstudio'.encode(), resp.content)
+        self.assertIn(b'SUMMARY:FIT TRAINING', resp.content)
+
+    @patch('notifications.tasks.send_booking_confirmation.delay')
+    def test_member_feed_survives_other_members_bookings(self, _):
+        with self.captureOnCommitCallbacks(execute=True):
+            book_session(studio=self.studio, session=self.session, user=self.user)
+        url = self._feed_url()
+        feed = APIClient()
+        etag = feed.get(url)['ETag']
+        other = User.objects.create_user(email='other-feed@example.com', password='pass', studio=self.studio)
+        UserCredit.objects.create(studio=self.studio, user=other, credits_total=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_session(studio=self.studio, session=self.session, user=other)
+        with self.assertNumQueries(0):
+            self.assertEqual(feed.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Mover la sesión sí cambia el calendario de quien la tiene
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session.starts_at += timedelta(hours=1)
+            self.session.save()
+        self.assertEqual(feed.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_tampered_token_is_rejected(self):
+        url = self._feed_url()
+        self.assertEqual(APIClient().get(url.replace('.ics', 'x.ics')).status_code, 404)
+
+    def test_studio_feed_follows_schedule_changes(self):
+        url = f'/api/scheduling/calendar/studio/{self.studio.id}.ics'
+        resp = APIClient().get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'STATUS:CONFIRMED', resp.content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session.status = Session.SessionStatus.CANCELLED
+            self.session.save()
+
+        resp = APIClient().get(url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'STATUS:CANCELLED', resp.content)
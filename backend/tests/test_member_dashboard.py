@@ -0,0 +1,58 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from catalog.models import ClassType
+from commerce.models import UserCredit
+from scheduling.models import Session
+from scheduling.services import book_session, bulk_update_sessions, check_in_booking
+from studios.models import Studio
+from users.models import User
+
+
+class MemberDashboardTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.studio = Studio.objects.create(name='Dash Studio', brand_json={})
+        class_type = ClassType.objects.create(studio=self.studio, name='FIT TRAINING', duration_minutes=50)
+        self.session = Session.objects.create(studio=self.studio, class_type=class_type, starts_at=timezone.now() + timedelta(days=1), capacity=5)
+        self.user = User.objects.create_user(email='dash@example.com', password='pass', studio=self.studio)
+        UserCredit.objects.create(studio=self.studio, user=self.user, credits_total=3)
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_STUDIO_ID=str(self.studio.id))
+        self.client.force_authenticate(user=self.user)
+
+    @patch('notifications.tasks.send_booking_confirmation.delay')
+    def test_dashboard_is_cached_and_invalidated_by_booking(self, _):
+        resp = self.client.get('/api/auth/me/dashboard/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['balance']['credits_available'], 3)
+        self.assertEqual(resp.data['upcoming_bookings'], [])
+
+        with self.assertNumQueries(1):  # solo el studio middleware
+            self.client.get('/api/auth/me/dashboard/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_session(studio=self.studio, session=self.session, user=self.user)
+
+        resp = self.client.get('/api/auth/me/dashboard/')
+        self.assertEqual(resp.data['balance']['credits_available'], 2)
+        self.assertEqual(resp.data['upcoming_bookings'][0]['session'], str(self.session.id))
+
+    @patch('notifications.tasks.send_booking_confirmation.delay')
+    def test_dashboard_follows_check_in_and_session_moves(self, _):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = book_session(studio=self.studio, session=self.session, user=self.user)
+        self.client.get('/api/auth/me/dashboard/')
+
+        later = self.session.starts_at + timedelta(hours=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_sessions(studio=self.studio, changes=[{'id': self.session.id, 'starts_at': later}], notify=False)
+        self.assertEqual(self.client.get('/api/auth/me/dashboard/').data['upcoming_bookings'][0]['starts_at'], later)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            check_in_booking(booking=booking)
+        self.assertEqual(self.client.get('/api/auth/me/dashboard/').data['upcoming_bookings'], [])
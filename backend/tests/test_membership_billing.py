@@ -0,0 +1,190 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from catalog.models import Product
+from commerce import billing, reconciliation
+from commerce.expiry import expire_entitlements
+from commerce.services import mark_order_paid
+from commerce.models import MembershipRenewal, Order, RevenueDaily, UserMembership
+from commerce.stubs import PaymentsApiStub
+from studios.models import Studio
+from users.models import User
+
+
+class MembershipBillingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = PaymentsApiStub().start()
+        cls.settings_override = override_settings(MP_API_URL=cls.stub.url, MP_ACCESS_TOKEN='test-token')
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.stub.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.stub.payments.clear()
+        self.stub.charges.clear()
+        self.stub.declined.clear()
+        self.stub.pending.clear()
+        studio = Studio.objects.create(name='Studio', brand_json={})
+        self.product = Product.objects.create(studio=studio, type=Product.ProductType.MEMBERSHIP, name='Mensual',
+                                              price_cents=80000, meta={'duration_days': 30})
+        self.now = timezone.now()
+        self.due_at = self.now - timedelta(hours=1)
+        self.memberships = [
+            UserMembership.objects.create(
+                studio=studio,
+                user=User.objects.create_user(email=f'm{i}@example.com', password='pass', studio=studio),
+                product=self.product,
+                starts_at=self.due_at - timedelta(days=30),
+                ends_at=self.due_at,
+                next_billing_at=self.due_at,
+                provider='mercadopago',
+                provider_ref=f'cust-{i}',
+            )
+            for i in range(3)
+        ]
+
+    def _run(self, now=None, **kwargs):
+        return billing.run_billing(now=now or self.now, max_workers=2, **kwargs)
+
+    def test_charges_due_memberships_and_advances_periods(self):
+        stats = self._run(batch_size=2)
+
+        self.assertEqual((stats['due'], stats['charged']), (3, 3))
+        renewed = self.due_at + timedelta(days=30)
+        for membership in UserMembership.objects.filter(pk__in=[m.pk for m in self.memberships]):
+            self.assertEqual((membership.ends_at, membership.next_billing_at), (renewed, renewed))
+        orders = Order.objects.filter(renewal__membership__in=self.memberships)
+        self.assertEqual(sorted(orders.values_list('status', flat=True)), [Order.OrderStatus.PAID] * 3)
+        self.assertTrue(all(order.provider_ref for order in orders))
+        self.assertEqual(RevenueDaily.objects.get().gross_cents, 3 * 80000)
+        # Cobrar la membresía renovada no crea otra
+        self.assertEqual(UserMembership.objects.count(), 3)
+
+        self.assertEqual(self._run()['due'], 0)
+        self.assertEqual(len(self.stub.charges), 3)
+
+    def test_declined_card_is_retried_then_abandoned(self):
+        self.stub.declined.add('cust-0')
+        declined = self.memberships[0]
+
+        self.assertEqual(self._run()['declined'], 1)
+        renewal = MembershipRenewal.objects.get(membership=declined)
+        self.assertEqual((renewal.status, renewal.attempts), (MembershipRenewal.Status.FAILED, 1))
+        self.assertEqual(self._run(self.now + timedelta(hours=2))['due'], 0)
+
+        self._run(self.now + timedelta(days=2))
+        stats = self._run(self.now + timedelta(days=6))
+
+        self.assertEqual(stats['abandoned'], 1)
+        renewal.refresh_from_db()
+        declined.refresh_from_db()
+        self.assertEqual((renewal.status, renewal.attempts), (MembershipRenewal.Status.ABANDONED, 3))
+        self.assertEqual(renewal.order.status, Order.OrderStatus.FAILED)
+        self.assertEqual((declined.ends_at, declined.next_billing_at), (self.due_at, None))
+        self.assertEqual(len(self.stub.charges), 5)
+
+    def test_expiry_sweeper_waits_for_billing_retries(self):
+        self.stub.declined.add('cust-0')
+        declined = self.memberships[0]
+        self._run()
+        expire_entitlements(now=self.now + timedelta(minutes=10))
+        declined.refresh_from_db()
+        self.assertEqual(declined.status, 'active')
+
+        # La tarjeta se actualiza antes del reintento del día siguiente
+        self.stub.declined.clear()
+        expire_entitlements(now=self.now + timedelta(days=1))
+        self.assertEqual(self._run(self.now + timedelta(days=1, hours=1))['charged'], 1)
+        declined.refresh_from_db()
+        self.assertEqual((declined.status, declined.ends_at), ('active', self.due_at + timedelta(days=30)))
+
+    def test_expiry_sweeper_expires_abandoned_memberships(self):
+        self.stub.declined.add('cust-0')
+        for days in (0, 2, 6):
+            self._run(self.now + timedelta(days=days))
+            expire_entitlements(now=self.now + timedelta(days=days, minutes=10))
+        self.assertEqual(UserMembership.objects.get(pk=self.memberships[0].pk).status, 'expired')
+        # Las que se cobraron siguen activas
+        self.assertEqual(UserMembership.objects.filter(status='active').count(), 2)
+
+    def _pending_renewal(self):
+        self.stub.pending.add('cust-0')
+        stats = self._run()
+        self.assertEqual((stats['charged'], stats['in_process']), (2, 1))
+        renewal = MembershipRenewal.objects.get(membership=self.memberships[0])
+        self.assertEqual((renewal.status, renewal.order.status), (MembershipRenewal.Status.PENDING, Order.OrderStatus.PENDING))
+        self.assertTrue(renewal.payment_ref)
+        return renewal
+
+    def test_in_process_payment_is_looked_up_not_charged_again(self):
+        renewal = self._pending_renewal()
+        self.assertEqual(self._run()['in_process'], 1)
+
+        self.stub.payments[renewal.payment_ref]['status'] = 'approved'
+        self.assertEqual(self._run()['charged'], 1)
+
+        self.assertEqual(len(self.stub.charges), 3)
+        membership = UserMembership.objects.get(pk=self.memberships[0].pk)
+        self.assertEqual(membership.ends_at, self.due_at + timedelta(days=30))
+
+    def test_renewal_settled_by_webhook_advances_membership(self):
+        renewal = self._pending_renewal()
+
+        mark_order_paid(renewal.order, provider='mercadopago', provider_ref=renewal.payment_ref)
+
+        renewal.refresh_from_db()
+        membership = UserMembership.objects.get(pk=self.memberships[0].pk)
+        self.assertEqual(renewal.status, MembershipRenewal.Status.CHARGED)
+        self.assertEqual((membership.ends_at, membership.next_billing_at), (self.due_at + timedelta(days=30),) * 2)
+        self.assertEqual(self._run()['due'], 0)
+        self.assertEqual(RevenueDaily.objects.get().gross_cents, 3 * 80000)
+
+    def test_renewal_settled_by_reconciliation_advances_membership(self):
+        renewal = self._pending_renewal()
+        Order.objects.filter(pk=renewal.order_id).update(provider_ref='pref-renewal')
+        self.stub.payments[renewal.payment_ref]['status'] = 'approved'
+
+        reconciliation.reconcile_pending_orders(now=self.now + timedelta(hours=1), max_workers=1)
+
+        renewal.refresh_from_db()
+        self.assertEqual((renewal.status, renewal.order.status), (MembershipRenewal.Status.CHARGED, Order.OrderStatus.PAID))
+        membership = UserMembership.objects.get(pk=self.memberships[0].pk)
+        self.assertEqual(membership.ends_at, self.due_at + timedelta(days=30))
+
+    def test_rerun_after_crash_reuses_orders_and_charges(self):
+        with patch.object(billing, '_apply', side_effect=RuntimeError('worker lost')):
+            with self.assertRaises(RuntimeError):
+                self._run()
+        self.assertEqual(len(self.stub.charges), 3)
+
+        stats = self._run()
+
+        self.assertEqual(stats['charged'], 3)
+        self.assertEqual(len(self.stub.charges), 3)
+        self.assertEqual(len(self.stub.payments), 3)
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(
+            set(UserMembership.objects.values_list('ends_at', flat=True)), {self.due_at + timedelta(days=30)}
+        )
+
+    def test_provider_outage_leaves_renewals_pending(self):
+        class Down:
+            provider = 'mercadopago'
+
+            def charge(self, **kwargs):
+                return billing.Charge('retry', error='timeout')
+
+        stats = self._run(adapter=Down())
+
+        self.assertEqual((stats['charged'], stats['errors']), (0, 3))
+        self.assertEqual(set(MembershipRenewal.objects.values_list('status', flat=True)), {MembershipRenewal.Status.PENDING})
+        self.assertEqual(self._run()['charged'], 3)
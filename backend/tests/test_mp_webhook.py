@@ -0,0 +1,136 @@
+import hashlib
+import hmac
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from catalog.models import Product
+from commerce.models import Order, PaymentNotification, UserCredit
+from commerce.payments import process_notification, requeue_stalled
+from commerce.services import PaymentProviderError, create_order
+from commerce.stubs import PaymentsApiStub
+from studios.models import Studio
+from users.models import User
+
+Status = PaymentNotification.Status
+
+
+@patch('commerce.tasks.process_payment_notification.delay')
+class MercadoPagoWebhookTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = PaymentsApiStub().start()
+        cls.settings_override = override_settings(MP_API_URL=cls.stub.url, MP_ACCESS_TOKEN='test-token', MP_WEBHOOK_SECRET=None)
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.stub.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.stub.payments.clear()
+        self.stub.requests.clear()
+        self.stub.fail_next = 0
+        self.client = APIClient()
+        studio = Studio.objects.create(name='Studio', brand_json={})
+        user = User.objects.create_user(email='mp@example.com', password='pass', studio=studio)
+        product = Product.objects.create(studio=studio, type=Product.ProductType.DROP_IN, name='Suelta', price_cents=1500)
+        self.order = create_order(studio=studio, user=user, items_payload=[{'product': str(product.id), 'quantity': 2}])
+
+    def _notify(self, payment_id, **headers):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/api/commerce/mp/webhook/?type=payment&data.id={payment_id}', {}, format='json', **headers)
+
+    def test_webhook_acknowledges_without_calling_provider(self, delay):
+        first = self._notify('1001')
+        second = self._notify('1001')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(self.stub.requests, [])
+        self.assertEqual(PaymentNotification.objects.filter(payment_id='1001').count(), 1)
+        self.assertEqual(delay.call_count, 1)
+
+    def test_worker_fetches_payment_and_fulfills_once(self, delay):
+        self.stub.add_payment('1002', 'approved', str(self.order.id))
+        self._notify('1002')
+        notification = PaymentNotification.objects.get(payment_id='1002')
+
+        self.assertEqual(process_notification(notification.pk), 'approved')
+        self.assertIsNone(process_notification(notification.pk))
+        # Una notificación repetida de un pago ya aprobado no vuelve a la cola
+        self._notify('1002')
+
+        self.order.refresh_from_db()
+        notification.refresh_from_db()
+        self.assertEqual(self.order.status, Order.OrderStatus.PAID)
+        self.assertEqual(self.order.provider_ref, '1002')
+        self.assertEqual(notification.status, Status.PROCESSED)
+        self.assertEqual(notification.order, self.order)
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(delay.call_count, 1)
+        self.assertEqual(UserCredit.objects.filter(user=self.order.user).count(), 1)
+
+    def test_provider_failure_is_recorded_and_retried(self, delay):
+        self.stub.add_payment('1003', 'approved', str(self.order.id))
+        # Más fallas que reintentos del cliente HTTP
+        self.stub.fail_next = 3
+        self._notify('1003')
+        notification = PaymentNotification.objects.get(payment_id='1003')
+
+        with self.assertRaises(PaymentProviderError):
+            process_notification(notification.pk)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Status.FAILED)
+        self.assertIn('500', notification.last_error)
+        self.assertIsNotNone(notification.claimed_at)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(requeue_stalled(), 1)
+        self.assertEqual(process_notification(notification.pk), 'approved')
+        notification.refresh_from_db()
+        self.assertEqual(notification.attempts, 2)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.OrderStatus.PAID)
+
+    def test_stalled_is_measured_from_claim_not_arrival(self, delay):
+        self._notify('1005')
+        notification = PaymentNotification.objects.get(payment_id='1005')
+        # Esperó en la cola de Celery más que el umbral y un worker acaba de tomarla
+        arrived = timezone.now() - timedelta(minutes=30)
+        PaymentNotification.objects.filter(pk=notification.pk).update(
+            status=Status.PROCESSING, received_at=arrived, claimed_at=timezone.now()
+        )
+        self.assertEqual(requeue_stalled(), 0)
+        self.assertEqual(PaymentNotification.objects.get(pk=notification.pk).status, Status.PROCESSING)
+
+        # El worker se perdió: pasado el umbral desde que la tomó sí se reencola
+        self.assertEqual(requeue_stalled(now=timezone.now() + timedelta(minutes=6)), 1)
+        self.assertEqual(PaymentNotification.objects.get(pk=notification.pk).status, Status.FAILED)
+
+    def test_pending_payment_is_processed_again_on_update(self, delay):
+        self.stub.add_payment('1004', 'in_process', str(self.order.id))
+        self._notify('1004')
+        notification = PaymentNotification.objects.get(payment_id='1004')
+        self.assertEqual(process_notification(notification.pk), 'in_process')
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.OrderStatus.PENDING)
+
+        self.stub.add_payment('1004', 'approved', str(self.order.id))
+        self._notify('1004')
+        self.assertEqual(delay.call_count, 2)
+        self.assertEqual(process_notification(notification.pk), 'approved')
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.OrderStatus.PAID)
+
+    def test_signature_checked_when_secret_configured(self, delay):
+        with override_settings(MP_WEBHOOK_SECRET='s3cret'):
+            bad = self._notify('1005', HTTP_X_SIGNATURE='ts=1,v1=deadbeef', HTTP_X_REQUEST_ID='req-1')
+            digest = hmac.new(b's3cret', b'id:1005;request-id:req-1;ts:1;', hashlib.sha256).hexdigest()
+            good = self._notify('1005', HTTP_X_SIGNATURE=f'ts=1,v1={digest}', HTTP_X_REQUEST_ID='req-1')
+        self.assertEqual(bad.status_code, 401)
+        self.assertEqual(good.status_code, 200)
+        self.assertEqual(PaymentNotification.objects.filter(payment_id='1005').count(), 1)
@@ -0,0 +1,53 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from catalog.models import ClassType
+from notifications import mailer
+from notifications.stubs import SmtpSink
+from notifications.tasks import send_session_update_notification, send_sessions_digest_notification
+from scheduling.models import Booking, Session
+from studios.models import Studio
+from users.models import User
+
+
+class NotificationBatchingTests(TestCase):
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Batch Studio', brand_json={})
+        class_type = ClassType.objects.create(studio=self.studio, name='HIIT', duration_minutes=45)
+        self.session = Session.objects.create(studio=self.studio, class_type=class_type,
+                                              starts_at=timezone.now() + timedelta(days=1), capacity=10)
+        self.users = [
+            User.objects.create_user(email=f'batch{i}@example.com', password='pass', full_name=f'Miembro {i}')
+            for i in range(3)
+        ]
+        Booking.objects.bulk_create([Booking(studio=self.studio, session=self.session, user=user) for user in self.users])
+
+    def test_update_is_personalized_per_member(self):
+        self.assertEqual(send_session_update_notification(str(self.session.id), 'cancelled'), 'notified: 3 users')
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [user.email for user in self.users])
+        bodies = {message.to[0]: message.body for message in mail.outbox}
+        self.assertTrue(bodies['batch1@example.com'].startswith('Hola Miembro 1,\n\n'))
+        shared = {body.split('\n\n', 1)[1] for body in bodies.values()}
+        self.assertEqual(len(shared), 1)
+
+    def test_large_fan_out_is_split_into_chunk_tasks(self):
+        with patch.object(mailer, 'CHUNK_SIZE', 2), patch.object(send_session_update_notification, 'delay') as delay:
+            result = send_session_update_notification(str(self.session.id))
+            self.assertEqual(result, 'queued: 3 users in 2 chunks')
+            self.assertEqual([len(call.args[2]) for call in delay.call_args_list], [2, 1])
+
+            for call in delay.call_args_list:
+                send_session_update_notification(*call.args)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_batch_uses_one_smtp_connection(self):
+        with SmtpSink() as sink, override_settings(**sink.settings()):
+            result = send_sessions_digest_notification({str(self.session.id): 'update'})
+
+        self.assertEqual(result, 'notified: 3 users')
+        self.assertEqual((sink.connections, len(sink.messages)), (1, 3))
@@ -1,11 +1,14 @@
 from datetime import timedelta
 from unittest.mock import patch
 
+from django.core import mail
 from django.test import TestCase
 from django.utils import timezone
 
 from catalog.models import ClassType
-from notifications.tasks import schedule_reminders, send_booking_reminder
+from notifications.models import ReminderDispatch
+from notifications.reminders import queue_due_reminders
+from notifications.tasks import schedule_reminders, send_reminder_batch
 from scheduling.models import Session, Booking
 from studios.models import Studio
 from users.models import User
@@ -15,47 +18,96 @@ class NotificationTasksTests(TestCase):
     def setUp(self):
         self.studio = Studio.objects.create(name='Reminders Studio', brand_json={})
         self.class_type = ClassType.objects.create(studio=self.studio, name='HIIT', duration_minutes=45)
-        self.user = User.objects.create_user(email='notify@example.com', password='pass')
+        self.user = User.objects.create_user(email='notify@example.com', password='pass', full_name='Ana')
+
+    def _booking(self, starts_in, user=None, status=Booking.BookingStatus.BOOKED, booked_ago=timedelta(days=2)):
+        session = Session.objects.create(studio=self.studio, class_type=self.class_type,
+                                         starts_at=timezone.now() + starts_in, capacity=10)
+        return Booking.objects.create(studio=self.studio, session=session, user=user or self.user, status=status,
+                                      booked_at=timezone.now() - booked_ago)
 
     def test_schedule_reminders_counts_future_bookings(self):
-        future_session = Session.objects.create(
-            studio=self.studio,
-            class_type=self.class_type,
-            starts_at=timezone.now() + timedelta(hours=6),
-            capacity=10,
-        )
-        past_session = Session.objects.create(
-            studio=self.studio,
-            class_type=self.class_type,
-            starts_at=timezone.now() - timedelta(hours=2),
-            capacity=10,
+        day = self._booking(timedelta(hours=6))
+        soon = self._booking(timedelta(hours=1), user=User.objects.create_user(email='soon@example.com', password='pass'))
+        self._booking(timedelta(hours=-2), user=User.objects.create_user(email='past@example.com', password='pass'))
+        self._booking(timedelta(hours=30), user=User.objects.create_user(email='later@example.com', password='pass'))
+        self._booking(timedelta(hours=6), user=User.objects.create_user(email='cancel@example.com', password='pass'),
+                      status=Booking.BookingStatus.CANCELLED)
+
+        with patch.object(send_reminder_batch, 'delay') as delay:
+            self.assertEqual(schedule_reminders(), 'queued: 2 reminders (2 new) in 1 chunks')
+        self.assertEqual(len(delay.call_args.args[0]), 2)
+        self.assertEqual(
+            set(ReminderDispatch.objects.values_list('booking_id', 'kind')),
+            {(day.id, ReminderDispatch.Kind.DAY_BEFORE), (soon.id, ReminderDispatch.Kind.TWO_HOURS)},
         )
 
-        Booking.objects.create(
-            studio=self.studio,
-            session=future_session,
-            user=self.user,
-            status=Booking.BookingStatus.BOOKED,
+    def test_repeated_runs_send_each_reminder_once(self):
+        booking = self._booking(timedelta(hours=6))
+        with patch.object(send_reminder_batch, 'delay', side_effect=send_reminder_batch):
+            schedule_reminders()
+            self.assertEqual(schedule_reminders(), 'queued: 0 reminders (0 new) in 0 chunks')
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertTrue(mail.outbox[0].body.startswith('Hola Ana,\n\n'))
+        self.assertTrue(mail.outbox[0].subject.endswith('en 6h'))
+        dispatch = ReminderDispatch.objects.get(booking=booking)
+        self.assertEqual(dispatch.status, ReminderDispatch.Status.SENT)
+        self.assertIsNotNone(dispatch.sent_at)
+
+        # La misma reserva recibe además el de 2h cuando entra en esa ventana
+        later = timezone.now() + timedelta(hours=4, minutes=30)
+        with patch('django.utils.timezone.now', return_value=later):
+            _, ids = queue_due_reminders()
+            self.assertEqual(send_reminder_batch([str(pk) for pk in ids]), 'sent: 1, failed: 0, skipped: 0')
+        self.assertTrue(mail.outbox[1].subject.endswith('en 1h 30 min'))
+
+    def test_bookings_made_inside_the_lead_time_skip_that_reminder(self):
+        late = self._booking(timedelta(hours=6), booked_ago=timedelta(minutes=5))
+        last_minute = self._booking(timedelta(minutes=90), booked_ago=timedelta(minutes=5),
+                                    user=User.objects.create_user(email='last@example.com', password='pass'))
+
+        self.assertEqual(queue_due_reminders()[0], 0)
+        self.assertFalse(ReminderDispatch.objects.filter(booking=last_minute).exists())
+
+        # El de 2h sí le llega a quien reservó antes de esa ventana
+        queue_due_reminders(timezone.now() + timedelta(hours=4, minutes=30))
+        self.assertEqual(
+            list(ReminderDispatch.objects.values_list('booking_id', 'kind')), [(late.id, ReminderDispatch.Kind.TWO_HOURS)]
         )
-        Booking.objects.create(
-            studio=self.studio,
-            session=past_session,
-            user=self.user,
-            status=Booking.BookingStatus.BOOKED,
+
+    def test_failures_map_to_their_own_dispatch_and_stale_claims_requeue(self):
+        first = self._booking(timedelta(hours=6))
+        second = self._booking(timedelta(hours=7))
+        _, ids = queue_due_reminders()
+
+        def send_batch(messages):
+            # Las filas ya están tomadas antes de hablar con SMTP
+            self.assertEqual(set(ReminderDispatch.objects.values_list('status', flat=True)), {ReminderDispatch.Status.SENDING})
+            failed = [m for m in messages if m.subject.endswith('en 6h')]
+            return len(messages) - len(failed), failed
+
+        with patch('notifications.mailer.send_batch', side_effect=send_batch):
+            self.assertEqual(send_reminder_batch([str(pk) for pk in ids]), 'sent: 1, failed: 1, skipped: 0')
+        # Mismo miembro en ambas: solo la que falló queda fallida
+        self.assertEqual(
+            dict(ReminderDispatch.objects.values_list('booking_id', 'status')),
+            {first.id: ReminderDispatch.Status.FAILED, second.id: ReminderDispatch.Status.SENT},
         )
-        Booking.objects.create(
-            studio=self.studio,
-            session=future_session,
-            user=User.objects.create_user(email='cancel@example.com', password='pass'),
-            status=Booking.BookingStatus.CANCELLED,
+
+        # Una tarea que murió con filas tomadas: pasado STALE_AFTER vuelven a la cola
+        ReminderDispatch.objects.filter(booking=second).update(
+            status=ReminderDispatch.Status.SENDING, claimed_at=timezone.now() - timedelta(minutes=20),
+            created_at=timezone.now() - timedelta(minutes=20),
         )
+        _, ids = queue_due_reminders()
+        self.assertEqual(ids, [ReminderDispatch.objects.get(booking=second).pk])
 
-        count = schedule_reminders()
-        self.assertEqual(count, 1)
+    def test_batch_skips_bookings_cancelled_after_queueing(self):
+        booking = self._booking(timedelta(hours=6))
+        _, ids = queue_due_reminders()
+        Booking.objects.filter(pk=booking.pk).update(status=Booking.BookingStatus.CANCELLED)
 
-    @patch('notifications.tasks.Booking')
-    def test_send_booking_reminder_targets_booking(self, booking_model):
-        result = send_booking_reminder('booking-id')
-        booking_model.objects.filter.assert_called_once_with(id='booking-id')
-        booking_model.objects.filter.return_value.update.assert_called_once_with()
-        self.assertEqual(result, 'queued')
+        self.assertEqual(send_reminder_batch([str(pk) for pk in ids]), 'sent: 0, failed: 0, skipped: 1')
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(ReminderDispatch.objects.get().status, ReminderDispatch.Status.SKIPPED)
@@ -0,0 +1,93 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from catalog.models import ClassType
+from commerce.models import UserCredit
+from scheduling.models import Session, Booking, SessionOccupancy, OccupancyBucket
+from scheduling.occupancy import reconcile_occupancy
+from scheduling.services import book_session, cancel_booking, check_in_booking
+from studios.models import Studio
+from users.models import User
+
+
+@patch('notifications.tasks.send_cancellation_email.delay')
+@patch('notifications.tasks.send_booking_confirmation.delay')
+class OccupancyRollupTests(APITestCase):
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Rollup Studio', brand_json={})
+        self.rush = ClassType.objects.create(studio=self.studio, name='RUSH', duration_minutes=50)
+        self.burn = ClassType.objects.create(studio=self.studio, name='BURN', duration_minutes=50)
+        self.starts_at = timezone.localtime().replace(hour=18, minute=0, second=0, microsecond=0) + timedelta(days=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session = Session.objects.create(studio=self.studio, class_type=self.rush, starts_at=self.starts_at, capacity=4)
+            Session.objects.create(studio=self.studio, class_type=self.burn, starts_at=self.starts_at + timedelta(minutes=30), capacity=6)
+        self.users = [User.objects.create_user(email=f'roll{i}@example.com', password='pass') for i in range(2)]
+        for user in self.users:
+            UserCredit.objects.create(studio=self.studio, user=user, credits_total=2)
+        self.staff = User.objects.create_user(email='roll-staff@example.com', password='pass')
+        self.staff.add_role('staff')
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_STUDIO_ID=str(self.studio.id))
+        self.client.force_authenticate(user=self.staff)
+
+    def _bucket(self):
+        return OccupancyBucket.objects.get(studio=self.studio, day=self.starts_at.date(), hour=18)
+
+    def test_booking_changes_update_rollups_incrementally(self, *_):
+        self.assertEqual((self._bucket().sessions, self._bucket().capacity), (2, 10))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = book_session(studio=self.studio, session=self.session, user=self.users[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            second = book_session(studio=self.studio, session=self.session, user=self.users[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel_booking(booking=second, actor=self.users[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            check_in_booking(booking=first)
+
+        row = SessionOccupancy.objects.get(session=self.session)
+        self.assertEqual((row.booked, row.attended), (0, 1))
+        self.assertEqual((self._bucket().booked, self._bucket().attended), (0, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session.status = Session.SessionStatus.CANCELLED
+            self.session.save()
+        self.assertEqual((self._bucket().sessions, self._bucket().capacity, self._bucket().attended), (1, 6, 0))
+
+    def test_failed_refresh_does_not_fail_the_booking(self, *_):
+        with patch('scheduling.occupancy.refresh_occupancy', side_effect=RuntimeError('lock timeout')), \
+                self.assertLogs('django', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            booking = book_session(studio=self.studio, session=self.session, user=self.users[0])
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, Booking.BookingStatus.BOOKED)
+
+    def test_reconcile_repairs_drift(self, *_):
+        # Escritura que se salta los servicios: el rollup queda desfasado hasta la conciliación
+        Booking.objects.bulk_create([Booking(studio=self.studio, session=self.session, user=user) for user in self.users])
+        day = self.starts_at.date()
+        stats = reconcile_occupancy(start=day, end=day + timedelta(days=1))
+        self.assertEqual(stats, {'sessions_checked': 2, 'sessions_fixed': 1, 'buckets_fixed': 1})
+        self.assertEqual(self._bucket().booked, 2)
+        self.assertEqual(reconcile_occupancy(start=day, end=day + timedelta(days=1))['buckets_fixed'], 0)
+
+    def test_analytics_endpoint_reads_rollups(self, *_):
+        with self.captureOnCommitCallbacks(execute=True):
+            book_session(studio=self.studio, session=self.session, user=self.users[0])
+        params = {'from': self.starts_at.date().isoformat(), 'to': (self.starts_at.date() + timedelta(days=1)).isoformat()}
+
+        with self.assertNumQueries(3):  # studio + rol del usuario + consulta al rollup
+            resp = self.client.get('/api/scheduling/analytics/occupancy/', {**params, 'group_by': 'class_type'})
+        by_class = {row['label']: row for row in resp.data['results']}
+        self.assertEqual(by_class['RUSH']['occupancy'], 0.25)
+        self.assertEqual(by_class['BURN']['booked'], 0)
+
+        resp = self.client.get('/api/scheduling/analytics/occupancy/', {**params, 'group_by': 'weekday'})
+        self.assertEqual(resp.data['results'], [{
+            'key': str(self.starts_at.weekday()), 'label': self.starts_at.weekday(), 'sessions': 2, 'capacity': 10,
+            'booked': 1, 'attended': 0, 'no_show': 0, 'waitlisted': 0, 'occupancy': 0.1, 'attendance_rate': None,
+        }])
+
+        resp = self.client.get('/api/scheduling/analytics/occupancy/', {**params, 'group_by': 'nope'})
+        self.assertEqual(resp.status_code, 400)
@@ -0,0 +1,61 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.exceptions import ValidationError
+
+from catalog.models import Product
+from commerce.models import Order, OrderItem
+from commerce.services import create_order
+from studios.models import Studio
+from users.models import User
+
+
+class BulkOrderCreationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.studio = Studio.objects.create(name='Studio', brand_json={})
+        self.user = User.objects.create_user(email='buyer@example.com', password='pass', studio=self.studio)
+        self.products = [
+            Product.objects.create(studio=self.studio, type=Product.ProductType.DROP_IN, name=f'Clase {i}', price_cents=100 * (i + 1))
+            for i in range(10)
+        ]
+
+    def _payload(self, products, quantity=2):
+        return [{'product': str(product.id), 'quantity': quantity} for product in products]
+
+    def test_order_written_once_with_bulk_items(self):
+        create_order(studio=self.studio, user=self.user, items_payload=self._payload(self.products[:1]))
+        # Con el catálogo en caché: savepoint, INSERT de la orden, INSERT masivo de líneas, bitácora y release
+        with self.assertNumQueries(5):
+            order = create_order(studio=self.studio, user=self.user, items_payload=self._payload(self.products))
+        self.assertEqual(order.total_cents, sum(p.price_cents * 2 for p in self.products))
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 10)
+        self.assertEqual(Order.objects.get(pk=order.pk).total_cents, order.total_cents)
+
+    def test_all_invalid_lines_reported_together(self):
+        inactive = self.products[1]
+        inactive.is_active = False
+        inactive.save()
+        other_studio = Studio.objects.create(name='Otro', brand_json={})
+        foreign = Product.objects.create(studio=other_studio, type=Product.ProductType.DROP_IN, name='Ajena', price_cents=100)
+        payload = [
+            {'product': str(self.products[0].id), 'quantity': 1},
+            {'product': str(inactive.id), 'quantity': 1},
+            {'product': str(foreign.id), 'quantity': 1},
+            {'product': str(self.products[2].id), 'quantity': 0},
+            {'product': str(self.products[3].id), 'quantity': 'x'},
+        ]
+        with self.assertRaises(ValidationError) as ctx:
+            create_order(studio=self.studio, user=self.user, items_payload=payload)
+        errors = ctx.exception.detail['items']
+        self.assertEqual([int(error['index']) for error in errors], [1, 2, 3, 4])
+        self.assertFalse(Order.objects.exists())
+
+    def test_price_change_invalidates_price_book(self):
+        product = self.products[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            create_order(studio=self.studio, user=self.user, items_payload=self._payload([product], 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price_cents = 999
+            product.save()
+        order = create_order(studio=self.studio, user=self.user, items_payload=self._payload([product], 1))
+        self.assertEqual(order.total_cents, 999)
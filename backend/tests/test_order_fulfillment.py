@@ -0,0 +1,84 @@
+import threading
+
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+
+from catalog.models import Product
+from commerce.models import Order, UserCredit, UserMembership
+from commerce.services import create_order, fulfill_order, mark_order_paid, get_user_balance
+from studios.models import Studio
+from users.models import User
+
+
+def _order(studio, user):
+    package = Product.objects.create(studio=studio, type=Product.ProductType.PACKAGE, name='Paquete 10', price_cents=9000,
+                                     meta={'credits': 10, 'expiry_days': 30})
+    plan = Product.objects.create(studio=studio, type=Product.ProductType.MEMBERSHIP, name='Mensual', price_cents=12000,
+                                  meta={'duration_days': 30})
+    drop_in = Product.objects.create(studio=studio, type=Product.ProductType.DROP_IN, name='Suelta', price_cents=1500)
+    return create_order(studio=studio, user=user, items_payload=[
+        {'product': str(package.id), 'quantity': 1},
+        {'product': str(plan.id), 'quantity': 1},
+        {'product': str(drop_in.id), 'quantity': 3},
+    ])
+
+
+class OrderFulfillmentTests(TestCase):
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Studio', brand_json={})
+        self.user = User.objects.create_user(email='pay@example.com', password='pass', studio=self.studio)
+        self.order = _order(self.studio, self.user)
+
+    def test_stale_copy_does_not_fulfill_twice(self):
+        webhook_copy = Order.objects.get(pk=self.order.pk)
+        staff_copy = Order.objects.get(pk=self.order.pk)
+
+        mark_order_paid(webhook_copy, provider='mercadopago', provider_ref='123')
+        mark_order_paid(staff_copy, provider='manual')
+
+        self.assertEqual(UserCredit.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(UserMembership.objects.filter(user=self.user).count(), 1)
+        # La copia perdedora refleja lo que escribió la ganadora
+        self.assertEqual(staff_copy.status, Order.OrderStatus.PAID)
+        self.assertEqual(staff_copy.provider, 'mercadopago')
+        balance = get_user_balance(studio=self.studio, user=self.user)
+        self.assertEqual(balance['credits_available'], 13)
+
+    def test_fulfill_rerun_is_a_noop(self):
+        mark_order_paid(self.order)
+        fulfill_order(self.order)
+        self.assertEqual(UserCredit.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(UserMembership.objects.filter(user=self.user).count(), 1)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ParallelFulfillmentTests(TransactionTestCase):
+    """Real concurrent transactions; needs a database with row locking (Postgres)."""
+
+    def test_parallel_mark_paid_fulfills_once(self):
+        studio = Studio.objects.create(name='Studio', brand_json={})
+        user = User.objects.create_user(email='race@example.com', password='pass', studio=studio)
+        order = _order(studio, user)
+        barrier = threading.Barrier(6)
+        errors = []
+
+        def pay(provider):
+            try:
+                copy = Order.objects.get(pk=order.pk)
+                barrier.wait()
+                mark_order_paid(copy, provider=provider)
+            except Exception as exc:  # pragma: no cover - reported below
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=pay, args=(f'caller-{i}',)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(UserCredit.objects.filter(user=user).count(), 2)
+        self.assertEqual(UserMembership.objects.filter(user=user).count(), 1)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.OrderStatus.PAID)
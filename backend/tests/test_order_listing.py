@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from catalog.models import Product
+from commerce.models import Order, OrderItem
+from studios.models import Studio
+from users.models import User
+
+
+class OrderListingTests(TestCase):
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Studio', brand_json={})
+        self.member = User.objects.create_user(email='member@example.com', password='pass', studio=self.studio)
+        self.staff = User.objects.create_user(email='staff@example.com', password='pass', studio=self.studio)
+        self.staff.add_role('staff')
+        product = Product.objects.create(studio=self.studio, type=Product.ProductType.DROP_IN, name='Suelta', price_cents=1500)
+        now = timezone.now()
+        self.orders = []
+        for i in range(12):
+            paid = i % 3 != 0
+            order = Order.objects.create(
+                studio=self.studio, user=self.member if i < 4 else self.staff, total_cents=3000,
+                status=Order.OrderStatus.PAID if paid else Order.OrderStatus.PENDING,
+                paid_at=now - timedelta(days=i) if paid else None,
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, unit_price_cents=1500, line_total_cents=1500) for _ in range(2)
+            ])
+            self.orders.append(order)
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_STUDIO_ID=str(self.studio.id))
+        self.client.force_authenticate(user=self.staff)
+
+    def test_list_prefetches_items(self):
+        # Studio, roles, conteo, página y un solo query para todas las líneas
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/commerce/orders/', {'page_size': 100})
+        self.assertEqual(response.data['count'], 12)
+        self.assertTrue(all(len(row['items']) == 2 for row in response.data['results']))
+
+    def test_filters_by_status_and_paid_range(self):
+        today = timezone.localdate()
+        response = self.client.get('/api/commerce/orders/', {
+            'status': 'paid',
+            'paid_from': (today - timedelta(days=5)).isoformat(),
+            'paid_to': today.isoformat(),
+            'ordering': '-paid_at',
+        })
+        expected = [o for i, o in enumerate(self.orders) if i % 3 != 0 and i <= 5]
+        self.assertEqual([row['id'] for row in response.data['results']], [str(o.id) for o in expected])
+        self.assertEqual(self.client.get('/api/commerce/orders/', {'status': 'lost'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/commerce/orders/', {'paid_from': 'ayer'}).status_code, 400)
+
+    def test_summary_mode_omits_items(self):
+        response = self.client.get('/api/commerce/orders/', {'view': 'summary', 'status': 'pending'})
+        self.assertEqual(response.data['count'], 4)
+        row = response.data['results'][0]
+        self.assertNotIn('items', row)
+        self.assertEqual(row['item_count'], 2)
+
+    def test_members_only_see_their_orders(self):
+        self.client.force_authenticate(user=self.member)
+        response = self.client.get('/api/commerce/orders/')
+        self.assertEqual({row['id'] for row in response.data['results']}, {str(o.id) for o in self.orders[:4]})
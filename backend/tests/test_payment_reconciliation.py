@@ -0,0 +1,90 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from catalog.models import Product
+from commerce import reconciliation
+from commerce.models import Order, ReconciliationRun, UserCredit
+from commerce.services import create_order
+from commerce.stubs import PaymentsApiStub
+from studios.models import Studio
+from users.models import User
+
+
+class PaymentReconciliationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = PaymentsApiStub().start()
+        cls.settings_override = override_settings(MP_API_URL=cls.stub.url, MP_ACCESS_TOKEN='test-token')
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.stub.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.stub.payments.clear()
+        self.stub.requests.clear()
+        studio = Studio.objects.create(name='Studio', brand_json={})
+        self.user = User.objects.create_user(email='rec@example.com', password='pass', studio=studio)
+        product = Product.objects.create(studio=studio, type=Product.ProductType.DROP_IN, name='Suelta', price_cents=1500)
+        orders = [
+            create_order(studio=studio, user=self.user, items_payload=[{'product': str(product.id)}],
+                         provider='mercadopago', provider_ref=f'pref-{i}')
+            for i in range(5)
+        ]
+        self.orders = sorted(orders, key=lambda order: order.pk)
+        self.later = timezone.now() + timedelta(hours=1)
+
+    def _run(self, **kwargs):
+        return reconciliation.reconcile_pending_orders(now=self.later, max_workers=4, **kwargs)
+
+    def test_applies_outcomes_and_reports_discrepancies(self):
+        paid, failed, retried, mismatched, silent = self.orders
+        self.stub.add_payment('1', 'approved', str(paid.id), amount=15)
+        self.stub.add_payment('2', 'rejected', str(failed.id))
+        self.stub.add_payment('3', 'rejected', str(retried.id))
+        self.stub.add_payment('4', 'in_process', str(retried.id))
+        self.stub.add_payment('5', 'approved', str(mismatched.id), amount=1)
+        manual = create_order(studio=paid.studio, user=self.user, items_payload=[{'product': str(paid.items.get().product_id)}])
+
+        run = self._run()
+
+        statuses = dict(Order.objects.filter(pk__in=[o.pk for o in self.orders]).values_list('pk', 'status'))
+        self.assertEqual(statuses[paid.pk], Order.OrderStatus.PAID)
+        self.assertEqual(statuses[failed.pk], Order.OrderStatus.FAILED)
+        self.assertEqual([statuses[o.pk] for o in (retried, mismatched, silent)], [Order.OrderStatus.PENDING] * 3)
+        self.assertEqual(Order.objects.get(pk=paid.pk).provider_ref, '1')
+        self.assertEqual(Order.objects.get(pk=manual.pk).status, Order.OrderStatus.PENDING)
+        self.assertEqual(UserCredit.objects.filter(source_order_item__order=paid).count(), 1)
+        self.assertEqual(reconciliation.report(run), {
+            'run': str(run.id), 'status': 'completed', 'checked': 5, 'paid': 1, 'failed': 1,
+            'unchanged': 3, 'errors': 0, 'discrepancies': 2,
+        })
+        kinds = {item['order']: item['kind'] for item in run.discrepancies}
+        self.assertEqual(kinds, {str(paid.id): 'paid_without_notification', str(mismatched.id): 'amount_mismatch'})
+
+    def test_recent_orders_wait_for_the_webhook(self):
+        run = reconciliation.reconcile_pending_orders()
+        self.assertEqual(run.checked, 0)
+        self.assertEqual(self.stub.requests, [])
+
+    def test_interrupted_run_resumes_from_cursor(self):
+        self.stub.add_payment('1', 'approved', str(self.orders[0].id), amount=15)
+        self.stub.add_payment('2', 'rejected', str(self.orders[2].id))
+
+        with patch.object(reconciliation, '_apply_failed', side_effect=RuntimeError('worker lost')):
+            with self.assertRaises(RuntimeError):
+                self._run(batch_size=2)
+        run = ReconciliationRun.objects.get()
+        self.assertEqual((run.status, run.checked, run.cursor), (ReconciliationRun.Status.RUNNING, 2, self.orders[1].pk))
+
+        resumed = self._run(batch_size=2)
+        self.assertEqual(resumed.pk, run.pk)
+        self.assertEqual((resumed.status, resumed.checked, resumed.paid, resumed.failed), ('completed', 5, 1, 1))
+        self.assertEqual(Order.objects.get(pk=self.orders[2].pk).status, Order.OrderStatus.FAILED)
@@ -0,0 +1,81 @@
+import time
+
+from django.test import SimpleTestCase
+
+from commerce.stubs import PaymentsApiStub
+from core.provider_client import CircuitOpen, ProviderClient, ProviderError
+
+
+class ProviderClientTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = PaymentsApiStub().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.stub.delay = 0
+        self.stub.fail_next = 0
+        self.stub.requests.clear()
+        self.stub.peers.clear()
+        self.stub.add_payment('1', 'approved')
+
+    def _client(self, **kwargs):
+        options = {'retries': 2, 'backoff': 0, 'failure_threshold': 3, 'reset_after': 60}
+        options.update(kwargs)
+        return ProviderClient('stub', **options)
+
+    def test_reuses_connections(self):
+        client = self._client()
+        for _ in range(10):
+            self.assertEqual(client.get(f'{self.stub.url}/v1/payments/1').status_code, 200)
+        self.assertEqual(len(self.stub.peers), 1)
+
+    def test_retries_idempotent_calls_on_server_errors(self):
+        client = self._client()
+        self.stub.fail_next = 2
+        response = client.get(f'{self.stub.url}/v1/payments/1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.stub.requests), 3)
+        stats = client.stats()
+        self.assertEqual((stats['requests'], stats['attempts'], stats['retries'], stats['errors']), (1, 3, 2, 2))
+        self.assertIn('p95_ms', stats)
+
+    def test_post_is_retried_only_with_idempotency_key(self):
+        client = self._client()
+        self.stub.fail_next = 1
+        self.assertEqual(client.post(f'{self.stub.url}/checkout/preferences', json={}).status_code, 500)
+        self.stub.fail_next = 1
+        self.assertEqual(client.post(f'{self.stub.url}/checkout/preferences', json={}, idempotency_key='k1').status_code, 201)
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        client = self._client()
+        self.assertEqual(client.get(f'{self.stub.url}/v1/payments/missing').status_code, 404)
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(client.stats()['circuit'], 'closed')
+
+    def test_slow_provider_times_out(self):
+        client = self._client(retries=1, timeout=0.05)
+        self.stub.delay = 0.2
+        with self.assertRaises(ProviderError):
+            client.get(f'{self.stub.url}/v1/payments/1')
+        self.assertEqual(client.stats()['attempts'], 2)
+
+    def test_circuit_opens_and_recovers(self):
+        client = self._client(retries=0, reset_after=0.1)
+        self.stub.fail_next = 3
+        for _ in range(3):
+            self.assertEqual(client.get(f'{self.stub.url}/v1/payments/1').status_code, 500)
+        with self.assertRaises(CircuitOpen):
+            client.get(f'{self.stub.url}/v1/payments/1')
+        self.assertEqual(len(self.stub.requests), 3)
+        self.assertEqual(client.stats()['short_circuits'], 1)
+
+        time.sleep(0.15)
+        self.assertEqual(client.get(f'{self.stub.url}/v1/payments/1').status_code, 200)
+        self.assertEqual(client.stats()['circuit'], 'closed')
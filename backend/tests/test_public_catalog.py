@@ -0,0 +1,57 @@
+import uuid
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import ClassType, Product
+from studios.models import Studio
+
+
+class PublicCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.studio = Studio.objects.create(name='Studio', brand_json={})
+        self.product = Product.objects.create(studio=self.studio, type=Product.ProductType.PACKAGE, name='10 clases',
+                                              price_cents=120000, meta={'credits': 10, 'expiry_days': 60, 'internal': 'x'})
+        Product.objects.create(studio=self.studio, type=Product.ProductType.DROP_IN, name='Retirado', price_cents=100, is_active=False)
+        ClassType.objects.create(studio=self.studio, name='Reformer', duration_minutes=50)
+        other = Studio.objects.create(name='Otro', brand_json={})
+        Product.objects.create(studio=other, type=Product.ProductType.DROP_IN, name='Ajeno', price_cents=100)
+        self.url = reverse('public-catalog', args=[self.studio.id])
+
+    def test_anonymous_catalog_is_cached_with_etag(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([p['name'] for p in data['products']], ['10 clases'])
+        self.assertEqual(data['products'][0]['credits'], 10)
+        self.assertNotIn('internal', data['products'][0])
+        self.assertEqual([c['name'] for c in data['class_types']], ['Reformer'])
+        self.assertIn('s-maxage', response['Cache-Control'])
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+            revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_product_and_class_type_changes_invalidate(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price_cents = 99000
+            self.product.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['products'][0]['price_cents'], 99000)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ClassType.objects.create(studio=self.studio, name='Barre', duration_minutes=45)
+        self.assertEqual(len(self.client.get(self.url).json()['class_types']), 2)
+
+    def test_unknown_studio_is_404(self):
+        self.assertEqual(self.client.get(reverse('public-catalog', args=[uuid.uuid4()])).status_code, 404)
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from catalog.models import Product
+from commerce.models import Order, RevenueDaily, UserCredit
+from commerce.revenue import reconcile_revenue
+from commerce.services import create_order, get_user_balance, mark_order_paid
+from studios.models import Studio
+from users.models import User
+
+
+class RevenueRollupTests(TestCase):
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Studio', brand_json={})
+        self.member = User.objects.create_user(email='buyer@example.com', password='pass', studio=self.studio)
+        self.staff = User.objects.create_user(email='staff@example.com', password='pass', studio=self.studio)
+        self.staff.add_role('staff')
+        self.package = Product.objects.create(studio=self.studio, type=Product.ProductType.PACKAGE, name='Paquete 10',
+                                              price_cents=10000, meta={'credits': 10})
+        self.plan = Product.objects.create(studio=self.studio, type=Product.ProductType.MEMBERSHIP, name='Mensual',
+                                           price_cents=60000, meta={'duration_days': 60})
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_STUDIO_ID=str(self.studio.id))
+        self.client.force_authenticate(user=self.staff)
+
+    def _paid(self, product, quantity=1):
+        order = create_order(studio=self.studio, user=self.member, items_payload=[{'product': str(product.id), 'quantity': quantity}])
+        return mark_order_paid(order, provider='manual')
+
+    def test_paid_and_refunded_orders_feed_the_rollups(self):
+        package_order = self._paid(self.package, 2)
+        self._paid(self.plan)
+        response = self.client.post(f'/api/commerce/orders/{package_order.id}/refund/', {'reason': 'duplicado'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], Order.OrderStatus.REFUNDED)
+        self.assertFalse(UserCredit.objects.filter(user=self.member, status=UserCredit.Status.ACTIVE).exists())
+        self.assertEqual(get_user_balance(studio=self.studio, user=self.member)['credits_available'], 0)
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/commerce/analytics/revenue/', {'group_by': 'type'})
+        self.assertEqual(response.status_code, 200)
+        by_type = {row['key']: row for row in response.data['results']}
+        self.assertEqual(by_type['package']['gross_cents'], 20000)
+        self.assertEqual(by_type['package']['refunded_cents'], 20000)
+        self.assertEqual(by_type['package']['net_cents'], 0)
+        self.assertEqual(by_type['membership']['units'], 1)
+        self.assertEqual(response.data['totals']['net_cents'], 60000)
+
+        # Un reembolso no se aplica dos veces
+        self.assertEqual(self.client.post(f'/api/commerce/orders/{package_order.id}/refund/').status_code, 400)
+
+        today = timezone.localdate()
+        self.assertEqual(reconcile_revenue(start=today, end=today + timedelta(days=1)), {'rows_checked': 2, 'rows_fixed': 0})
+        RevenueDaily.objects.filter(product=self.plan).update(gross_cents=1)
+        self.assertEqual(reconcile_revenue(start=today, end=today + timedelta(days=1))['rows_fixed'], 1)
+        self.assertEqual(RevenueDaily.objects.get(product=self.plan).gross_cents, 60000)
+
+    def test_mrr_and_outstanding_credits(self):
+        self._paid(self.plan)
+        self._paid(self.package)
+        other = User.objects.create_user(email='other@example.com', password='pass', studio=self.studio)
+        UserCredit.objects.create(studio=self.studio, user=other, credits_total=3, credits_used=1)
+        UserCredit.objects.create(studio=self.studio, user=other, credits_total=3, expires_at=timezone.now() - timedelta(days=1))
+
+        mrr = self.client.get('/api/commerce/analytics/revenue/mrr/').data
+        self.assertEqual(mrr['mrr_cents'], 30000)
+        self.assertEqual(mrr['plans'][0]['members'], 1)
+
+        credits = self.client.get('/api/commerce/analytics/revenue/credits/').data
+        self.assertEqual(credits, {'credits': 12, 'members': 2, 'value_cents': 10000})
+
+    def test_members_cannot_read_revenue(self):
+        self.client.force_authenticate(user=self.member)
+        self.assertEqual(self.client.get('/api/commerce/analytics/revenue/').status_code, 403)
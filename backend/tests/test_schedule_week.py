@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from catalog.models import ClassType
+from scheduling.models import Session, Booking, WaitlistEntry
+from studios.models import Studio
+from users.models import User
+
+
+class ScheduleWeekTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.studio = Studio.objects.create(name='Week Studio', brand_json={})
+        class_type = ClassType.objects.create(studio=self.studio, name='RUSH', duration_minutes=50)
+        self.user = User.objects.create_user(email='week@example.com', password='pass')
+        self.start = timezone.localdate() + timedelta(days=1)
+        noon = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        self.sessions = [
+            Session.objects.create(studio=self.studio, class_type=class_type, starts_at=noon + timedelta(days=i), capacity=1)
+            for i in range(3)
+        ]
+        other = User.objects.create_user(email='other@example.com', password='pass')
+        Booking.objects.create(studio=self.studio, session=self.sessions[0], user=self.user, status=Booking.BookingStatus.BOOKED)
+        Booking.objects.create(studio=self.studio, session=self.sessions[1], user=other, status=Booking.BookingStatus.BOOKED)
+        Booking.objects.create(studio=self.studio, session=self.sessions[1], user=self.user, status=Booking.BookingStatus.WAITLIST)
+        WaitlistEntry.objects.create(studio=self.studio, session=self.sessions[1], user=self.user, position=1)
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_STUDIO_ID=str(self.studio.id))
+        self.client.force_authenticate(user=self.user)
+
+    def test_week_groups_by_day_with_caller_state(self):
+        resp = self.client.get('/api/scheduling/sessions/week/', {'start': self.start.isoformat(), 'days': 7})
+        self.assertEqual(resp.status_code, 200)
+        days = resp.data['days']
+        self.assertEqual(len(days), 7)
+        first, second, third = (day['sessions'][0] for day in days[:3])
+        self.assertEqual((first['my_status'], first['spots_left']), ('booked', 0))
+        self.assertEqual((second['my_status'], second['waitlist_position'], second['waitlist']), ('waitlist', 1, 1))
+        self.assertIsNone(third['my_status'])
+        self.assertEqual(third['spots_left'], 1)
+
+    def test_cached_base_layer_keeps_query_count_constant(self):
+        params = {'start': self.start.isoformat(), 'days': 7}
+        self.client.get('/api/scheduling/sessions/week/', params)
+        # studio middleware + reservas del usuario + lista de espera
+        with self.assertNumQueries(3):
+            self.client.get('/api/scheduling/sessions/week/', params)
@@ -0,0 +1,108 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from catalog.models import ClassType, Instructor
+from scheduling.models import Session, Booking
+from studios.models import Studio
+from users.models import User
+
+
+class SessionBulkUpdateTests(APITestCase):
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Bulk Studio', brand_json={})
+        self.class_type = ClassType.objects.create(studio=self.studio, name='BODY JUMP', duration_minutes=50)
+        self.coach = Instructor.objects.create(studio=self.studio, full_name='Coach A')
+        self.other_coach = Instructor.objects.create(studio=self.studio, full_name='Coach B')
+        self.staff = User.objects.create_user(email='staff@example.com', password='pass', studio=self.studio)
+        self.staff.add_role('staff')
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_STUDIO_ID=str(self.studio.id))
+        self.client.force_authenticate(user=self.staff)
+        self.base = timezone.now().replace(microsecond=0) + timedelta(days=2)
+
+    def _session(self, offset_hours, **kwargs):
+        return Session.objects.create(
+            studio=self.studio,
+            class_type=kwargs.pop('class_type', self.class_type),
+            starts_at=self.base + timedelta(hours=offset_hours),
+            capacity=kwargs.pop('capacity', 10),
+            **kwargs,
+        )
+
+    def test_bulk_update_applies_valid_items_and_reports_failures(self):
+        first = self._session(0)
+        second = self._session(3)
+        member = User.objects.create_user(email='member@example.com', password='pass')
+        Booking.objects.create(studio=self.studio, session=second, user=member, status=Booking.BookingStatus.BOOKED)
+
+        payload = {'changes': [
+            {'id': str(first.id), 'instructor': str(self.coach.id), 'starts_at': (self.base + timedelta(hours=1)).isoformat()},
+            {'id': str(second.id), 'capacity': 5},
+            {'id': str(second.id), 'capacity': 6},
+        ]}
+        with patch('notifications.tasks.send_sessions_digest_notification.delay') as digest:
+            with self.captureOnCommitCallbacks(execute=True):
+                resp = self.client.post('/api/scheduling/sessions/bulk_update/', payload, format='json')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(set(resp.data['updated']), {str(first.id), str(second.id)})
+        self.assertEqual([e['index'] for e in resp.data['errors']], [2])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.instructor_id, self.coach.id)
+        self.assertEqual(first.starts_at, self.base + timedelta(hours=1))
+        self.assertEqual(second.capacity, 5)
+        digest.assert_called_once()
+
+    def test_bulk_update_rejects_instructor_overlap_and_duplicate_slot(self):
+        busy = self._session(0, instructor=self.coach)
+        moving = self._session(5)
+        clashing = self._session(8)
+        other_class = ClassType.objects.create(studio=self.studio, name='BURN', duration_minutes=50)
+        twin = self._session(12, class_type=other_class)
+
+        payload = {'changes': [
+            {'id': str(moving.id), 'instructor': str(self.coach.id), 'starts_at': (self.base + timedelta(minutes=30)).isoformat()},
+            {'id': str(clashing.id), 'starts_at': busy.starts_at.isoformat()},
+            {'id': str(twin.id), 'instructor': str(self.other_coach.id)},
+        ]}
+        with patch('notifications.tasks.send_sessions_digest_notification.delay'):
+            resp = self.client.post('/api/scheduling/sessions/bulk_update/', payload, format='json')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['updated'], [str(twin.id)])
+        errors = {e['index']: e['errors'] for e in resp.data['errors']}
+        self.assertIn('instructor', errors[0])
+        self.assertIn('starts_at', errors[1])
+        moving.refresh_from_db()
+        self.assertIsNone(moving.instructor_id)
+
+    def test_rejected_move_keeps_its_original_slot(self):
+        self._session(0, instructor=self.coach)
+        stuck = self._session(5)
+        follower = self._session(9)
+
+        # stuck choca con el instructor y se queda a las 5h: follower no puede tomar ese horario
+        for changes in (
+            [{'id': str(stuck.id), 'instructor': str(self.coach.id), 'starts_at': (self.base + timedelta(minutes=30)).isoformat()},
+             {'id': str(follower.id), 'starts_at': stuck.starts_at.isoformat()}],
+            [{'id': str(follower.id), 'starts_at': stuck.starts_at.isoformat()},
+             {'id': str(stuck.id), 'instructor': str(self.coach.id), 'starts_at': (self.base + timedelta(minutes=30)).isoformat()}],
+        ):
+            with patch('notifications.tasks.send_sessions_digest_notification.delay'):
+                resp = self.client.post('/api/scheduling/sessions/bulk_update/', {'changes': changes}, format='json')
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.data['updated'], [])
+            self.assertEqual(sorted(next(iter(e['errors'])) for e in resp.data['errors']), ['instructor', 'starts_at'])
+        self.assertEqual(Session.objects.get(pk=follower.pk).starts_at, self.base + timedelta(hours=9))
+
+    def test_bulk_update_requires_staff(self):
+        member = User.objects.create_user(email='nostaff@example.com', password='pass')
+        self.client.force_authenticate(user=member)
+        session = self._session(0)
+        resp = self.client.post('/api/scheduling/sessions/bulk_update/', {'changes': [{'id': str(session.id), 'capacity': 3}]}, format='json')
+        self.assertEqual(resp.status_code, 403)
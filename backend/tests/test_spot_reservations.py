@@ -0,0 +1,102 @@
+import base64
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from catalog.models import ClassType
+from commerce.models import UserCredit
+from scheduling.models import Session, SpotLayout, Booking
+from scheduling.serializers import SessionSerializer, SpotLayoutSerializer
+from scheduling.services import book_session, bulk_update_sessions, cancel_booking
+from scheduling.spots import serialize_spot_map
+from studios.models import Location, Studio
+from users.models import User
+
+
+@patch('notifications.tasks.send_cancellation_email.delay')
+@patch('notifications.tasks.send_booking_confirmation.delay')
+class SpotReservationTests(TestCase):
+    def setUp(self):
+        self.studio = Studio.objects.create(name='Jump Studio', brand_json={})
+        self.class_type = ClassType.objects.create(studio=self.studio, name='BODY JUMP', duration_minutes=50)
+        self.layout = SpotLayout.objects.create(
+            studio=self.studio,
+            class_type=self.class_type,
+            name='Trampolines',
+            spots=10,
+            preferred_order=[4, 5, 3, 6],
+        )
+        self.session = Session.objects.create(
+            studio=self.studio,
+            class_type=self.class_type,
+            starts_at=timezone.now() + timedelta(days=1),
+            capacity=10,
+        )
+
+    def _member(self, email):
+        user = User.objects.create_user(email=email, password='pass')
+        UserCredit.objects.create(studio=self.studio, user=user, credits_total=5)
+        return user
+
+    def test_best_available_follows_preferred_order_and_release(self, *_):
+        first = book_session(studio=self.studio, session=self.session, user=self._member('a@example.com'))
+        second = book_session(studio=self.studio, session=self.session, user=self._member('b@example.com'))
+        self.assertEqual((first.spot, second.spot), (4, 5))
+
+        payload = serialize_spot_map(self.session)
+        self.assertEqual(payload['available'], 8)
+        self.assertEqual(base64.b64decode(payload['taken']), bytes([0b00110000]))
+
+        cancel_booking(booking=first)
+        first.refresh_from_db()
+        self.assertIsNone(first.spot)
+        third = book_session(studio=self.studio, session=self.session, user=self._member('c@example.com'))
+        self.assertEqual(third.spot, 4)
+
+    def test_explicit_spot_cannot_be_taken_twice(self, *_):
+        book_session(studio=self.studio, session=self.session, user=self._member('a@example.com'), spot=7)
+        intruder = self._member('b@example.com')
+        with self.assertRaises(ValidationError):
+            book_session(studio=self.studio, session=self.session, user=intruder, spot=7)
+        self.assertFalse(Booking.objects.filter(user=intruder).exists())
+        self.assertEqual(UserCredit.objects.get(user=intruder).credits_used, 0)
+
+    def test_capacity_cannot_exceed_layout_spots(self, *_):
+        context = {'request': SimpleNamespace(studio=self.studio)}
+        data = {'class_type': str(self.class_type.id), 'starts_at': (timezone.now() + timedelta(days=2)).isoformat(), 'capacity': 12}
+        serializer = SessionSerializer(data=data, context=context)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('capacity', serializer.errors)
+        self.assertFalse(SessionSerializer(self.session, data={'capacity': 11}, partial=True, context=context).is_valid())
+        _, errors = bulk_update_sessions(studio=self.studio, changes=[{'id': self.session.id, 'capacity': 11}])
+        self.assertIn('capacity', errors[0]['errors'])
+
+        # Achicar el layout por debajo de la capacidad de sus sesiones próximas también se rechaza
+        serializer = SpotLayoutSerializer(self.layout, data={'spots': 8}, partial=True, context=context)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('spots', serializer.errors)
+
+        # Salvo que un layout más específico atienda esas sesiones
+        location = Location.objects.create(studio=self.studio, name='Sala grande')
+        SpotLayout.objects.create(studio=self.studio, class_type=self.class_type, location=location, name='Sala grande', spots=20)
+        big = Session.objects.create(studio=self.studio, class_type=self.class_type, location=location,
+                                     starts_at=timezone.now() + timedelta(days=3), capacity=15)
+        self.assertTrue(SpotLayoutSerializer(self.layout, data={'spots': 10}, partial=True, context=context).is_valid())
+        self.assertTrue(SessionSerializer(big, data={'capacity': 18}, partial=True, context=context).is_valid())
+
+    def test_waitlist_booking_rejects_spot_preference(self, *_):
+        Session.objects.filter(pk=self.session.pk).update(capacity=1)
+        self.session.refresh_from_db()
+        book_session(studio=self.studio, session=self.session, user=self._member('a@example.com'))
+        late = self._member('b@example.com')
+
+        with self.assertRaises(ValidationError):
+            book_session(studio=self.studio, session=self.session, user=late, spot=3)
+        self.assertFalse(Booking.objects.filter(user=late).exists())
+
+        waiting = book_session(studio=self.studio, session=self.session, user=late)
+        self.assertEqual((waiting.status, waiting.spot), (Booking.BookingStatus.WAITLIST, None))
@@ -0,0 +1,136 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from catalog.models import ClassType
+from commerce.models import UserCredit
+from scheduling import sync
+from scheduling.models import Session, Booking, Checkin, SyncChange
+from scheduling.services import book_session, cancel_booking
+from studios.models import Studio
+from users.models import User
+
+
+class SyncFeedTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.studio = Studio.objects.create(name='Sync Studio', brand_json={})
+        class_type = ClassType.objects.create(studio=self.studio, name='RUSH', duration_minutes=50)
+        self.starts_at = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        self.session = Session.objects.create(studio=self.studio, class_type=class_type, starts_at=self.starts_at, capacity=5)
+        self.member = User.objects.create_user(email='member@example.com', password='pass', studio=self.studio)
+        UserCredit.objects.create(studio=self.studio, user=self.member, credits_total=3)
+        self.staff = User.objects.create_user(email='kiosk@example.com', password='pass', studio=self.studio)
+        self.staff.add_role('staff')
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_STUDIO_ID=str(self.studio.id))
+        self.client.force_authenticate(user=self.staff)
+
+    def _sync(self, **params):
+        resp = self.client.get('/api/scheduling/sync/', params)
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return resp.data
+
+    @patch('notifications.tasks.send_cancellation_email.delay')
+    @patch('notifications.tasks.send_booking_confirmation.delay')
+    @patch.object(sync, 'SAFETY_LAG', timedelta(0))
+    def test_snapshot_then_deltas(self, *_):
+        day = self.starts_at.date().isoformat()
+        first = self._sync(date=day)
+        self.assertEqual([s['id'] for s in first['upserts']['session']], [str(self.session.id)])
+        self.assertEqual(first['upserts']['booking'], [])
+
+        booking = book_session(studio=self.studio, session=self.session, user=self.member)
+        delta = self._sync(cursor=first['cursor'])
+        self.assertEqual([b['status'] for b in delta['upserts']['booking']], ['booked'])
+
+        cancel_booking(booking=booking, actor=self.member)
+        delta = self._sync(cursor=delta['cursor'])
+        # varias escrituras sobre la misma reserva se entregan una sola vez con su último estado
+        self.assertEqual([b['status'] for b in delta['upserts']['booking']], ['cancelled'])
+
+        self.assertEqual(self._sync(cursor=delta['cursor'])['upserts'], {})
+
+    def test_cursor_waits_for_late_commits(self):
+        booking = Booking.objects.create(studio=self.studio, session=self.session, user=self.member)
+        cursor = self._sync()['cursor']
+        early = SyncChange.objects.create(studio=self.studio, entity=SyncChange.Entity.BOOKING, entity_id=booking.id)
+        late = SyncChange.objects.create(studio=self.studio, entity=SyncChange.Entity.SESSION, entity_id=self.session.id)
+        # Una transacción que tomó el seq menor pero aún no confirma
+        seq = early.seq
+        early.delete()
+
+        delta = self._sync(cursor=cursor)
+        self.assertEqual((list(delta['upserts']), delta['cursor']), (['session'], cursor))
+
+        # Confirma después: como el cursor no pasó de los cambios recientes, se entrega
+        SyncChange.objects.create(seq=seq, studio=self.studio, entity=SyncChange.Entity.BOOKING, entity_id=booking.id)
+        delta = self._sync(cursor=delta['cursor'])
+        self.assertEqual(sorted(delta['upserts']), ['booking', 'session'])
+
+        SyncChange.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self._sync(cursor=delta['cursor'])['cursor'], sync.encode_cursor(late.seq))
+
+    def test_pruned_cursor_must_resnapshot(self):
+        SyncChange.objects.create(studio=self.studio, entity=SyncChange.Entity.SESSION, entity_id=self.session.id)
+        cursor = self._sync()['cursor']
+        stale = SyncChange.objects.update(created_at=timezone.now() - sync.RETENTION - timedelta(days=1))
+
+        self.assertEqual(sync.prune_changes(chunk_size=1), stale)
+        self.assertFalse(SyncChange.objects.exists())
+        resp = self.client.get('/api/scheduling/sync/', {'cursor': cursor})
+        self.assertEqual(resp.status_code, 400)
+
+    @patch.object(sync, 'SAFETY_LAG', timedelta(0))
+    def test_members_only_receive_their_own_deletes(self):
+        other = User.objects.create_user(email='other@example.com', password='pass', studio=self.studio)
+        mine = Booking.objects.create(studio=self.studio, session=self.session, user=self.member)
+        theirs = Booking.objects.create(studio=self.studio, session=self.session, user=other)
+        self.client.force_authenticate(user=self.member)
+        cursor = self._sync()['cursor']
+        ids = str(mine.id), str(theirs.id)
+
+        theirs.delete()
+        mine.delete()
+        delta = self._sync(cursor=cursor)
+        self.assertEqual(delta['deletes'], {'booking': [ids[0]]})
+
+        self.client.force_authenticate(user=self.staff)
+        self.assertEqual(sorted(self._sync(cursor=cursor)['deletes']['booking']), sorted(ids))
+
+    def test_invalid_cursor_is_rejected(self):
+        resp = self.client.get('/api/scheduling/sync/', {'cursor': 'nope'})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_offline_checkins_are_idempotent(self):
+        booking = Booking.objects.create(studio=self.studio, session=self.session, user=self.member)
+        payload = {'checkins': [{'booking': str(booking.id), 'checked_in_at': self.starts_at.isoformat()}]}
+        cursor = self._sync()['cursor']
+
+        with patch('scheduling.sync.invalidate_member') as invalidate:
+            resp = self.client.post('/api/scheduling/sync/checkins/', payload, format='json')
+        self.assertEqual(resp.data['results'][0]['result'], 'created')
+        invalidate.assert_called_once_with(self.member.id)
+        resp = self.client.post('/api/scheduling/sync/checkins/', payload, format='json')
+        self.assertEqual(resp.data['results'][0]['result'], 'duplicate')
+
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, Booking.BookingStatus.ATTENDED)
+        self.assertEqual(Checkin.objects.filter(booking=booking).count(), 1)
+        delta = self._sync(cursor=cursor)
+        self.assertEqual(len(delta['upserts']['checkin']), 1)
+        self.assertEqual(delta['upserts']['booking'][0]['status'], 'attended')
+
+    def test_offline_checkin_does_not_overwrite_cancellation(self):
+        booking = Booking.objects.create(studio=self.studio, session=self.session, user=self.member)
+        Booking.objects.filter(pk=booking.pk).update(status=Booking.BookingStatus.CANCELLED)
+
+        resp = self.client.post('/api/scheduling/sync/checkins/', {'checkins': [{'booking': str(booking.id)}]}, format='json')
+
+        self.assertEqual(resp.data['results'][0]['result'], 'error')
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, Booking.BookingStatus.CANCELLED)
+        self.assertFalse(Checkin.objects.filter(booking=booking).exists())
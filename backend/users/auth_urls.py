@@ -1,6 +1,6 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenVerifyView
-from .views import RegisterView, MeView, TokenView, TokenRefresh
+from .views import RegisterView, MeView, DashboardView, TokenView, TokenRefresh
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
@@ -8,4 +8,5 @@ urlpatterns = [
     path('token/refresh/', TokenRefresh.as_view(), name='token_refresh'),
     path('token/verify/', TokenVerifyView.as_view(), name='token_verify'),
     path('me/', MeView.as_view(), name='me'),
+    path('me/dashboard/', DashboardView.as_view(), name='me_dashboard'),
 ]
@@ -0,0 +1,72 @@
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from catalog.models import ClassType, Product
+from commerce.models import UserCredit, UserMembership
+from core.benchmarks import scenario
+from scheduling.models import Session, Booking, WaitlistEntry
+from studios.models import Studio
+from .models import User
+
+LEGACY_PORTAL_CALLS = [
+    '/api/auth/me/',
+    '/api/commerce/credits/balance/',
+    '/api/scheduling/bookings/',
+    '/api/scheduling/waitlist/',
+    '/api/commerce/memberships/',
+]
+
+
+def _timed_calls(client, paths):
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        for path in paths:
+            assert client.get(path).status_code == 200, path
+        elapsed = (time.perf_counter() - start) * 1000
+    return {'requests': len(paths), 'queries': len(queries), 'server_ms': round(elapsed, 2)}
+
+
+@scenario('portal_dashboard')
+def portal_dashboard(size=None):
+    """Typical portal load: separate endpoints vs. the dashboard aggregate."""
+    bookings = size or 20
+    studio = Studio.objects.create(name='Bench Portal', brand_json={})
+    class_type = ClassType.objects.create(studio=studio, name='BENCH', duration_minutes=50)
+    product = Product.objects.create(studio=studio, type=Product.ProductType.MEMBERSHIP, name='Bench', price_cents=1000)
+    user = User.objects.create_user(email='bench-portal@example.com', password='pass', studio=studio)
+    user.add_role('customer')
+    UserCredit.objects.create(studio=studio, user=user, credits_total=10, expires_at=timezone.now() + timedelta(days=30))
+    UserMembership.objects.create(studio=studio, user=user, product=product, ends_at=timezone.now() + timedelta(days=20))
+    sessions = Session.objects.bulk_create([
+        Session(studio=studio, class_type=class_type, starts_at=timezone.now() + timedelta(days=1, hours=i), capacity=10)
+        for i in range(bookings + 2)
+    ])
+    Booking.objects.bulk_create([
+        Booking(studio=studio, session=session, user=user, status=Booking.BookingStatus.BOOKED)
+        for session in sessions[:bookings]
+    ])
+    WaitlistEntry.objects.bulk_create([
+        WaitlistEntry(studio=studio, session=session, user=user, position=1) for session in sessions[bookings:]
+    ])
+
+    client = APIClient()
+    client.credentials(HTTP_X_STUDIO_ID=str(studio.id))
+    client.force_authenticate(user=user)
+    _timed_calls(client, LEGACY_PORTAL_CALLS)  # calentamiento: imports y resolución de URLs
+    cache.clear()
+    legacy = _timed_calls(client, LEGACY_PORTAL_CALLS)
+    cold = _timed_calls(client, ['/api/auth/me/dashboard/'])
+    warm = _timed_calls(client, ['/api/auth/me/dashboard/'])
+    return {
+        'legacy': legacy,
+        'dashboard_cold': cold,
+        'dashboard_warm': warm,
+        'requests_saved': legacy['requests'] - cold['requests'],
+        'server_ms_saved_warm': round(legacy['server_ms'] - warm['server_ms'], 2),
+    }
@@ -0,0 +1,94 @@
+"""Member portal dashboard: everything the portal needs after login in one payload."""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.cache import bump_version, versioned_key
+
+CACHE_NAMESPACE = 'member'
+CACHE_SECONDS = 5 * 60
+UPCOMING_LIMIT = 5
+
+
+def invalidate_member(*user_ids):
+    """Drop cached member views (dashboard, calendar) once the current transaction commits."""
+    for user_id in {uid for uid in user_ids if uid}:
+        transaction.on_commit(lambda uid=user_id: bump_version(CACHE_NAMESPACE, uid))
+
+
+def build_dashboard(studio, user):
+    from commerce.models import UserMembership
+    from commerce.services import get_user_balance
+    from scheduling.models import Booking, WaitlistEntry
+
+    now = timezone.now()
+    upcoming = (
+        Booking.objects.filter(
+            studio=studio,
+            user=user,
+            status=Booking.BookingStatus.BOOKED,
+            session__starts_at__gte=now,
+        )
+        .select_related('session__class_type', 'session__instructor')
+        .order_by('session__starts_at')[:UPCOMING_LIMIT]
+    )
+    waitlist = (
+        WaitlistEntry.objects.filter(studio=studio, user=user, session__starts_at__gte=now)
+        .select_related('session__class_type')
+        .order_by('session__starts_at')
+    )
+    membership = (
+        UserMembership.objects.filter(studio=studio, user=user, status='active')
+        .filter(Q(ends_at__isnull=True) | Q(ends_at__gte=now))
+        .select_related('product')
+        .order_by('ends_at')
+        .first()
+    )
+    return {
+        'profile': {
+            'id': str(user.id),
+            'email': user.email,
+            'full_name': user.full_name,
+            'phone': user.phone,
+            'roles': list(user.roles.values_list('code', flat=True)),
+        },
+        'balance': get_user_balance(studio=studio, user=user),
+        'membership': {
+            'id': str(membership.id),
+            'product': membership.product.name,
+            'status': membership.status,
+            'starts_at': membership.starts_at,
+            'ends_at': membership.ends_at,
+            'next_billing_at': membership.next_billing_at,
+        } if membership else None,
+        'upcoming_bookings': [
+            {
+                'id': str(booking.id),
+                'session': str(booking.session_id),
+                'starts_at': booking.session.starts_at,
+                'class_name': booking.session.class_type.name,
+                'instructor': booking.session.instructor.full_name if booking.session.instructor else None,
+                'spot': booking.spot,
+            }
+            for booking in upcoming
+        ],
+        'waitlist': [
+            {
+                'session': str(entry.session_id),
+                'starts_at': entry.session.starts_at,
+                'class_name': entry.session.class_type.name,
+                'position': entry.position,
+            }
+            for entry in waitlist
+        ],
+    }
+
+
+def get_dashboard(studio, user):
+    key = versioned_key(CACHE_NAMESPACE, user.id, 'dashboard', studio.id)
+    data = cache.get(key)
+    if data is None:
+        data = build_dashboard(studio, user)
+        cache.set(key, data, CACHE_SECONDS)
+    return data
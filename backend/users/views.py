@@ -6,6 +6,7 @@ from notifications.tasks import send_onboarding_email
 from .serializers import RegisterSerializer, UserSerializer, LoginSerializer
 from .models import User, Role
 from .permissions import IsAdmin, IsStaff
+from .dashboard import get_dashboard, invalidate_member
 from django.db import transaction
 
 class RegisterView(generics.CreateAPIView):
@@ -24,6 +25,19 @@ class MeView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         return self.request.user
 
+    def perform_update(self, serializer):
+        user = serializer.save()
+        invalidate_member(user.id)
+
+class DashboardView(generics.GenericAPIView):
+    """Profile, balance, membership, upcoming bookings and waitlist in one call"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        if not request.studio:
+            return Response({'detail': 'Studio requerido'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_dashboard(request.studio, request.user))
+
 class TokenView(TokenObtainPairView):
     pass
 
@@ -80,6 +94,7 @@ class UserViewSet(viewsets.ModelViewSet):
         if not role_code:
             return Response({'detail': 'role requerido'}, status=status.HTTP_400_BAD_REQUEST)
         user.add_role(role_code)
+        invalidate_member(user.id)
         return Response({'detail': f'Rol {role_code} agregado', 'roles': list(user.roles.values_list('code', flat=True))})
 
     @action(detail=True, methods=['post'])
@@ -92,5 +107,6 @@ class UserViewSet(viewsets.ModelViewSet):
         from .models import UserRole
         deleted, _ = UserRole.objects.filter(user=user, role__code=role_code).delete()
         if deleted:
+            invalidate_member(user.id)
             return Response({'detail': f'Rol {role_code} removido', 'roles': list(user.roles.values_list('code', flat=True))})
         return Response({'detail': 'Rol no encontrado'}, status=status.HTTP_404_NOT_FOUND)